@@ -0,0 +1,312 @@
+"""Incremental SKU ABC (Pareto) classification.
+
+v_sku_abc re-aggregates every order line and runs two window sums over all
+SKUs on each query. This engine keeps per-SKU units, revenue and gross profit
+in the sku_revenue table, folds in only orders rows past its etl_state
+watermark, and classifies in memory: SKU totals are held in parallel numpy
+arrays, and A/B/C classes come from one sort and one cumulative sum.
+After a day's load, refresh_sku_revenue() reads only the new rows and
+classification of a few thousand SKUs takes milliseconds. sku_engine() keeps
+the arrays, and their revenue ordering, in memory between calls. It starts
+from sku_revenue and adds the orders appended since straight to the arrays,
+so it only needs a read connection. The engine is shared between threads:
+read it through with_sku_engine(), which holds one lock across the catch-up
+and the read, since a catch-up for another caller changes the arrays in place.
+"""
+import argparse
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, TypeVar
+
+import numpy as np
+import pandas as pd
+
+from connections import open_readonly
+from etl_state import ORDERS_GENERATION, decide_mode, get_state, record_watermark
+from profiling import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+
+STATE = "sku_revenue"  # etl_state prefix: sku_revenue_rowid, sku_revenue_generation
+
+A_THRESHOLD = 0.80
+B_THRESHOLD = 0.95
+
+SKU_REVENUE_DDL = """
+CREATE TABLE IF NOT EXISTS sku_revenue (
+  sku TEXT PRIMARY KEY,
+  units INTEGER NOT NULL,
+  revenue REAL NOT NULL,
+  gross_profit REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+DELTA_SQL = """
+SELECT sku, SUM(qty) AS units, SUM(gross_revenue) AS revenue, SUM(gross_profit) AS gross_profit
+FROM orders
+WHERE rowid > ? AND rowid <= ?
+GROUP BY sku
+"""
+
+UPSERT_SQL = """
+INSERT INTO sku_revenue(sku, units, revenue, gross_profit) VALUES (?, ?, ?, ?)
+ON CONFLICT(sku) DO UPDATE SET
+  units = units + excluded.units,
+  revenue = revenue + excluded.revenue,
+  gross_profit = gross_profit + excluded.gross_profit
+"""
+
+
+class SkuRevenue:
+    """Per-SKU totals in parallel arrays, indexed by a SKU-to-slot map.
+
+    watermark and generation record the last orders rowid, and the orders
+    generation, the arrays include (None when built by hand); the revenue
+    ordering is cached until add().
+    """
+
+    def __init__(self) -> None:
+        self.slots: Dict[str, int] = {}
+        self.skus = np.empty(0, dtype=object)
+        self.units = np.zeros(0, dtype=np.int64)
+        self.revenue = np.zeros(0, dtype=np.float64)
+        self.gross_profit = np.zeros(0, dtype=np.float64)
+        self.watermark: Optional[int] = None
+        self.generation: Optional[int] = None
+        self._order: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _grow(self, size: int) -> None:
+        """Make room for at least size SKUs, doubling capacity to amortize copies."""
+        capacity = len(self.skus)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        for name in ("skus", "units", "revenue", "gross_profit"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype) if old.dtype != object else np.empty(capacity, dtype=object)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, delta: pd.DataFrame) -> None:
+        """Add per-SKU sums (columns sku, units, revenue, gross_profit); new SKUs get new slots."""
+        if delta.empty:
+            return
+        self._order = None
+        skus = delta["sku"].to_numpy(dtype=object)
+        new = [sku for sku in pd.unique(skus) if sku not in self.slots]
+        self._grow(len(self.slots) + len(new))
+        for sku in new:
+            slot = len(self.slots)
+            self.slots[sku] = slot
+            self.skus[slot] = sku
+        index = np.fromiter((self.slots[sku] for sku in skus), dtype=np.int64, count=len(skus))
+        np.add.at(self.units, index, delta["units"].fillna(0).to_numpy(dtype=np.int64))
+        np.add.at(self.revenue, index, delta["revenue"].fillna(0).to_numpy(dtype=np.float64))
+        np.add.at(self.gross_profit, index, delta["gross_profit"].fillna(0).to_numpy(dtype=np.float64))
+
+    def _ranked(self, order: np.ndarray, total: float) -> pd.DataFrame:
+        """Frame for the slots in order (revenue descending), which must include every tie of its last SKU."""
+        ranked = self.revenue[order]
+        n = len(order)
+        # SUM() OVER (ORDER BY revenue DESC) gives tied revenues the running total at the end of the tie
+        running = np.cumsum(ranked)
+        if n:
+            new_run = np.r_[True, ranked[1:] != ranked[:-1]]
+            run_end = np.r_[np.flatnonzero(new_run)[1:] - 1, n - 1]
+            running = running[run_end][np.cumsum(new_run) - 1]
+        share = ranked / total if total else np.full(n, np.nan)
+        cum_share = running / total if total else np.full(n, np.nan)
+        return pd.DataFrame({
+            "sku": self.skus[order],
+            "units": self.units[order],
+            "revenue": ranked,
+            "gross_profit": self.gross_profit[order],
+            "revenue_share": share,
+            "cum_share": cum_share,
+            "abc_class": np.select([cum_share <= A_THRESHOLD, cum_share <= B_THRESHOLD], ["A", "B"], "C"),
+        })
+
+    def _rank(self, slots: np.ndarray) -> np.ndarray:
+        """slots ordered by revenue descending, ties by SKU."""
+        return slots[np.lexsort((self.skus[slots].astype(str), -self.revenue[slots]))]
+
+    def _sorted(self) -> np.ndarray:
+        if self._order is None:
+            self._order = self._rank(np.arange(len(self)))
+        return self._order
+
+    def classify(self) -> pd.DataFrame:
+        """All SKUs with shares and A/B/C classes, like SELECT * FROM v_sku_abc ORDER BY revenue DESC, sku."""
+        return self._ranked(self._sorted(), self.revenue[:len(self)].sum())
+
+    def top(self, limit: int) -> pd.DataFrame:
+        """The first limit rows of classify(), sorting only the SKUs that can be in them."""
+        n = len(self)
+        if limit <= 0 or limit >= n:
+            return self.classify().head(max(limit, 0))
+        revenue = self.revenue[:n]
+        if self._order is not None:
+            # Already ranked: take the leading slots through the end of the last tie
+            ranked = -revenue[self._order]
+            end = int(np.searchsorted(ranked, ranked[limit - 1], side="right"))
+            return self._ranked(self._order[:end], revenue.sum()).head(limit)
+        cutoff = np.partition(revenue, n - limit)[n - limit]
+        candidates = self._rank(np.flatnonzero(revenue >= cutoff))
+        return self._ranked(candidates, revenue.sum()).head(limit)
+
+
+_ENGINES: Dict[str, SkuRevenue] = {}
+_ENGINES_LOCK = threading.Lock()
+
+T = TypeVar("T")
+
+
+def refresh_sku_revenue(db: str = DB, full: bool = False) -> Dict[str, object]:
+    """Fold orders rows past the watermark into sku_revenue. Returns mode, rows, skus and seconds."""
+    if not Path(db).exists():
+        raise FileNotFoundError(f"Database not found: {db}. Please run SQL setup scripts first.")
+
+    start = time.perf_counter()
+    con = connect(db, isolation_level=None)
+    try:
+        if not con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='orders'").fetchone():
+            raise ValueError("Table 'orders' not found. Please run sql/10_load_clean.sql first.")
+        mode, lo, max_rowid = decide_mode(con, STATE, tables=("sku_revenue",), full=full)
+
+        rows = 0
+        if mode != "fresh":
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                if mode == "full":
+                    con.execute("DROP TABLE IF EXISTS sku_revenue")
+                con.execute(SKU_REVENUE_DDL)
+                delta = con.execute(DELTA_SQL, (lo, max_rowid)).fetchall()
+                con.executemany(UPSERT_SQL, delta)
+                rows = con.execute(
+                    "SELECT COUNT(*) FROM orders WHERE rowid > ? AND rowid <= ?", (lo, max_rowid)
+                ).fetchone()[0]
+                record_watermark(con, STATE, max_rowid)
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+        skus = con.execute("SELECT COUNT(*) FROM sku_revenue").fetchone()[0]
+    except sqlite3.Error as e:
+        raise RuntimeError(f"SKU revenue refresh failed: {e}") from e
+    finally:
+        con.close()
+
+    return {"mode": mode, "rows": rows, "skus": skus, "seconds": time.perf_counter() - start}
+
+
+def load_sku_revenue(db: str = DB, con: Optional[sqlite3.Connection] = None) -> SkuRevenue:
+    """Read sku_revenue into an in-memory SkuRevenue."""
+    engine = SkuRevenue()
+    own = con is None
+    try:
+        if own:
+            con = connect(db)
+        engine.add(pd.read_sql_query("SELECT sku, units, revenue, gross_profit FROM sku_revenue", con))
+        engine.watermark = get_state(con, f"{STATE}_rowid")
+        engine.generation = get_state(con, f"{STATE}_generation")
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        raise RuntimeError(f"Could not load sku_revenue: {e}") from e
+    finally:
+        if own and con is not None:
+            con.close()
+    return engine
+
+
+def _catch_up(con: sqlite3.Connection, engine: Optional[SkuRevenue]) -> SkuRevenue:
+    """Return engine with the orders rows past its watermark added, or a new engine if it cannot be extended.
+
+    A new engine starts from sku_revenue when that table was built from the
+    current orders, and from empty arrays otherwise. Nothing is written.
+    """
+    hi = con.execute("SELECT COALESCE(MAX(rowid), 0) FROM orders").fetchone()[0]
+    generation = get_state(con, ORDERS_GENERATION)
+    if engine is None or engine.watermark is None or engine.generation != generation or hi < engine.watermark:
+        has_table = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='sku_revenue'").fetchone()
+        engine = load_sku_revenue(con=con) if has_table else None
+        if engine is None or engine.watermark is None or engine.generation != generation or hi < engine.watermark:
+            engine = SkuRevenue()
+            engine.watermark, engine.generation = 0, generation
+    if hi > engine.watermark:
+        engine.add(pd.read_sql_query(DELTA_SQL, con, params=(engine.watermark, hi)))
+        engine.watermark = hi
+    return engine
+
+
+def with_sku_engine(
+    db: str,
+    read: Callable[[SkuRevenue], T],
+    con: Optional[sqlite3.Connection] = None,
+) -> T:
+    """Bring the SkuRevenue kept in memory for db up to date with orders and return read(engine).
+
+    The first call loads sku_revenue; later calls only add the rows appended
+    since, unless orders was rebuilt. The catch-up and read run under one
+    lock, so read never sees arrays another thread is extending. Reads go
+    through con when given (any read-only connection will do), otherwise
+    through a read-only connection opened for the call.
+    """
+    key = str(Path(db).resolve())
+    with _ENGINES_LOCK:
+        own = con is None
+        try:
+            if own:
+                con = open_readonly(db)
+            engine = _ENGINES[key] = _catch_up(con, _ENGINES.get(key))
+        except (sqlite3.Error, pd.errors.DatabaseError) as e:
+            raise RuntimeError(f"Could not update the SKU engine: {e}") from e
+        finally:
+            if own and con is not None:
+                con.close()
+        return read(engine)
+
+
+def sku_engine(db: str = DB, con: Optional[sqlite3.Connection] = None) -> SkuRevenue:
+    """Return the up-to-date SkuRevenue for db itself; only safe to read while no other thread uses the engine."""
+    return with_sku_engine(db, lambda engine: engine, con)
+
+
+def classify_skus(db: str = DB, limit: Optional[int] = None, con: Optional[sqlite3.Connection] = None) -> pd.DataFrame:
+    """Return the ABC classification of every SKU, or of the top limit, from the up-to-date engine."""
+    return with_sku_engine(db, lambda engine: engine.classify() if limit is None else engine.top(limit), con)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Refresh per-SKU revenue and reclassify SKUs A/B/C.")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("--full", action="store_true", help="rebuild sku_revenue from all of orders")
+    parser.add_argument("--top", type=int, default=0, help="also print the N leading SKUs")
+    args = parser.parse_args(argv)
+
+    try:
+        result = refresh_sku_revenue(args.db, full=args.full)
+        print(f"  ✓ sku_revenue {result['mode']} refresh: {result['rows']:,} order rows in {result['seconds']:.3f}s")
+        start = time.perf_counter()
+        engine = load_sku_revenue(args.db)
+        df = engine.classify()
+        counts = df["abc_class"].value_counts()
+        print(
+            f"  ✓ {len(df):,} SKUs classified in {time.perf_counter() - start:.3f}s: "
+            f"A={counts.get('A', 0):,} B={counts.get('B', 0):,} C={counts.get('C', 0):,}"
+        )
+        if args.top > 0:
+            print(engine.top(args.top).to_string(index=False))
+    except (FileNotFoundError, ValueError, RuntimeError) as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""Small asyncio HTTP API serving filtered aggregates from the orders table.
+
+The dashboard downloads whole CSVs and filters them in the browser. This
+service answers filtered queries instead, so the browser only receives the
+page of rows it displays:
+
+    GET /api/monthly     per-month aggregates
+    GET /api/countries   per-country aggregates
+    GET /api/skus        per-SKU aggregates
+    GET /api/customers   per-customer aggregates
+    GET /api/version     current data version
+
+Filters: start / end (YYYY-MM-DD, inclusive, on order_date), country and
+sku (comma-separated lists). Pagination: limit (default 100) and offset.
+Responses are JSON, or Arrow IPC streams with format=arrow (or an
+"Accept: application/vnd.apache.arrow.stream" header; requires pyarrow).
+
+Queries run on the read-only connection pool used by charts.py. Unfiltered
+requests are answered from the summaries other modules already maintain:
+the mv_* tables (materialize.py) while they are current, and for /api/skus
+the in-memory SKU engine (abc_engine.py), which only sorts the SKUs that
+can reach the requested page. Filtered requests aggregate orders. Full
+aggregate results are kept in an LRU cache keyed by the query and the data
+version (orders generation and high-water rowid), and bounded by bytes as
+well as entries, so paging through a result or repeating it does not touch
+SQLite. Every response carries an ETag, and a matching If-None-Match gets
+304 Not Modified.
+
+Only the standard library is needed; the server speaks just enough HTTP/1.1
+for a browser or reverse proxy and closes the connection after each response.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sqlite3
+import sys
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from abc_engine import with_sku_engine
+from connections import ConnectionManager
+from materialize import staleness
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+DEFAULT_CACHE_SIZE = 128
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+MAX_REQUEST_BYTES = 16 * 1024
+
+_MEASURES = """
+  COUNT(DISTINCT invoice_no) AS orders,
+  COUNT(DISTINCT customer_id) AS buyers,
+  SUM(qty) AS units,
+  SUM(gross_revenue) AS revenue,
+  SUM(gross_profit) AS gross_profit
+"""
+
+# dataset -> (grouping SELECT list, GROUP BY key, ORDER BY, extra WHERE condition)
+DATASETS: Dict[str, Tuple[str, str, str, Optional[str]]] = {
+    "monthly": ("order_month AS ym, MIN(order_date) AS month_start,", "order_month", "ym", None),
+    "countries": ("country,", "country", "revenue DESC, country", None),
+    "skus": ("sku,", "sku", "revenue DESC, sku", None),
+    "customers": (
+        "customer_id, MIN(order_date) AS first_order_date, MAX(order_date) AS last_order_date,",
+        "customer_id",
+        "revenue DESC, customer_id",
+        "customer_id IS NOT NULL",
+    ),
+}
+
+# Unfiltered aggregates read from the materialized summaries, with build_query()'s columns and order
+SUMMARY_SQL: Dict[str, str] = {
+    "monthly": "SELECT ym, month_start, orders, buyers, units, revenue, gross_profit FROM mv_month ORDER BY ym",
+    "countries": (
+        "SELECT country, orders, buyers, units, revenue, gross_profit FROM mv_country ORDER BY revenue DESC, country"
+    ),
+    "customers": (
+        "SELECT customer_id, first_order_date, last_order_date, orders, 1 AS buyers, units, revenue, gross_profit "
+        "FROM mv_customer ORDER BY revenue DESC, customer_id"
+    ),
+}
+
+# Distinct counts for one page of SKUs; chunked to stay under SQLite's bound-parameter limit
+SKU_COUNTS_SQL = """
+SELECT sku, COUNT(DISTINCT invoice_no) AS orders, COUNT(DISTINCT customer_id) AS buyers
+FROM orders WHERE sku IN ({placeholders}) GROUP BY sku
+"""
+SKU_COUNTS_CHUNK = 500
+
+STATUS_TEXT = {200: "OK", 204: "No Content", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 500: "Internal Server Error", 501: "Not Implemented",
+               503: "Service Unavailable"}
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+
+class BadRequest(ValueError):
+    """A request parameter is missing or malformed."""
+
+
+class ResultCache:
+    """Least-recently-used cache of aggregate DataFrames, bounded by entry count and by bytes.
+
+    A frame larger than max_bytes on its own is not cached.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE, max_bytes: int = DEFAULT_CACHE_BYTES) -> None:
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[tuple, pd.DataFrame]" = OrderedDict()
+        self.sizes: Dict[tuple, int] = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[pd.DataFrame]:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, value: pd.DataFrame) -> None:
+        size = int(value.memory_usage(index=True, deep=True).sum())
+        if key in self.entries:
+            self.nbytes -= self.sizes.pop(key)
+            del self.entries[key]
+        if size > self.max_bytes:
+            return
+        self.entries[key] = value
+        self.sizes[key] = size
+        self.nbytes += size
+        while len(self.entries) > self.maxsize or self.nbytes > self.max_bytes:
+            old, _ = self.entries.popitem(last=False)
+            self.nbytes -= self.sizes.pop(old)
+
+
+def _split_list(values: List[str]) -> Tuple[str, ...]:
+    items = {item.strip() for value in values for item in value.split(",") if item.strip()}
+    return tuple(sorted(items))
+
+
+def parse_filters(params: Dict[str, List[str]]) -> Dict[str, object]:
+    """Validate and normalize the filter parameters into a hashable form."""
+    filters: Dict[str, object] = {}
+    for name in ("start", "end"):
+        if name in params:
+            try:
+                filters[name] = date.fromisoformat(params[name][-1]).isoformat()
+            except ValueError:
+                raise BadRequest(f"{name} must be a date in YYYY-MM-DD format")
+    for name in ("country", "sku"):
+        if name in params:
+            filters[name] = _split_list(params[name])
+    return filters
+
+
+def _int_param(params: Dict[str, List[str]], name: str, default: int, low: int, high: int) -> int:
+    if name not in params:
+        return default
+    try:
+        value = int(params[name][-1])
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer")
+    if not low <= value <= high:
+        raise BadRequest(f"{name} must be between {low} and {high}")
+    return value
+
+
+def build_query(dataset: str, filters: Dict[str, object]) -> Tuple[str, List[object]]:
+    """SQL and parameters for one dataset's filtered aggregate."""
+    select, group_by, order_by, condition = DATASETS[dataset]
+    where: List[str] = [condition] if condition else []
+    params: List[object] = []
+    if "start" in filters:
+        where.append("order_date >= ?")
+        params.append(filters["start"])
+    if "end" in filters:
+        where.append("order_date <= ?")
+        params.append(filters["end"])
+    for column in ("country", "sku"):
+        if column in filters:
+            values = filters[column]
+            where.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+    sql = f"SELECT {select}{_MEASURES}FROM orders"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" GROUP BY {group_by} ORDER BY {order_by}"
+    return sql, params
+
+
+def _json_default(value: object) -> object:
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _records(df: pd.DataFrame) -> List[Dict[str, object]]:
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+class QueryService:
+    """Request handling, independent of the socket layer so it can be tested directly."""
+
+    def __init__(
+        self,
+        db: str = DB,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        cache_bytes: int = DEFAULT_CACHE_BYTES,
+        pool_size: int = 4,
+        max_limit: int = MAX_LIMIT,
+    ) -> None:
+        self.db = db
+        self.max_limit = max_limit
+        self.connections = ConnectionManager(db, pool_size=pool_size)
+        self.cache = ResultCache(cache_size, cache_bytes)
+
+    def data_version(self) -> str:
+        """Changes whenever orders is rebuilt or appended to."""
+        with self.connections.connection() as con:
+            max_rowid = con.execute("SELECT COALESCE(MAX(rowid), 0) FROM orders").fetchone()[0]
+            try:
+                row = con.execute("SELECT value FROM etl_state WHERE name='orders_generation'").fetchone()
+            except sqlite3.OperationalError:
+                row = None  # orders built before etl_state existed
+        return f"{row[0] if row else 0}-{max_rowid}"
+
+    def _aggregate(self, dataset: str, filters: Dict[str, object]) -> pd.DataFrame:
+        """A dataset's full aggregate, from the mv_* tables when unfiltered and current, else from orders."""
+        if not filters and dataset in SUMMARY_SQL:
+            with self.connections.connection() as con:
+                try:
+                    current = not staleness(con)["stale"]
+                except sqlite3.Error:
+                    current = False  # no etl_state yet: the summaries were never built
+            if current:
+                return self.connections.query(SUMMARY_SQL[dataset], label=f"api:{dataset}:summary")
+        sql, params = build_query(dataset, filters)
+        return self.connections.query(sql, params, f"api:{dataset}")
+
+    def _sku_page(self, offset: int, limit: int) -> Tuple[pd.DataFrame, int]:
+        """One page of the unfiltered SKU aggregate and the number of SKUs.
+
+        Units, revenue and gross profit come from the SKU engine; only the
+        distinct order and buyer counts of the page's SKUs are read from orders.
+        """
+        with self.connections.connection() as con:
+            # Ranked under the engine's lock: another request may be adding new orders to it
+            page, total = with_sku_engine(
+                self.db, lambda engine: (engine.top(offset + limit).iloc[offset:], len(engine)), con
+            )
+            skus = page["sku"].tolist()
+            counts = [
+                pd.read_sql_query(
+                    SKU_COUNTS_SQL.format(placeholders=", ".join("?" for _ in chunk)), con, params=chunk
+                )
+                for chunk in (skus[i:i + SKU_COUNTS_CHUNK] for i in range(0, len(skus), SKU_COUNTS_CHUNK))
+            ]
+        counts = pd.concat(counts) if counts else pd.DataFrame(columns=["sku", "orders", "buyers"])
+        page = page[["sku", "units", "revenue", "gross_profit"]].merge(counts, on="sku", how="left")
+        return page[["sku", "orders", "buyers", "units", "revenue", "gross_profit"]], total
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def handle(self, method: str, target: str, headers: Dict[str, str]) -> Response:
+        """Answer one request. headers must have lower-case names."""
+        if method == "OPTIONS":
+            return 204, {"Access-Control-Allow-Methods": "GET", "Access-Control-Allow-Headers": "If-None-Match"}, b""
+        if method != "GET":
+            return self._error(405, f"Method {method} not allowed")
+
+        url = urlsplit(target)
+        params = parse_qs(url.query, keep_blank_values=False)
+        parts = [part for part in url.path.split("/") if part]
+        if len(parts) != 2 or parts[0] != "api" or (parts[1] not in DATASETS and parts[1] != "version"):
+            return self._error(404, f"Unknown endpoint {url.path}")
+
+        try:
+            version = await self._run(self.data_version)
+            if parts[1] == "version":
+                etag = self._etag((version,))
+                if self._not_modified(headers, etag):
+                    return 304, {"ETag": etag}, b""
+                body = json.dumps({"version": version}).encode()
+                return 200, {"Content-Type": "application/json", "ETag": etag, "Cache-Control": "no-cache"}, body
+
+            dataset = parts[1]
+            filters = parse_filters(params)
+            limit = _int_param(params, "limit", DEFAULT_LIMIT, 1, self.max_limit)
+            offset = _int_param(params, "offset", 0, 0, sys.maxsize)
+            fmt = params.get("format", ["arrow" if ARROW_MIME in headers.get("accept", "") else "json"])[-1]
+            if fmt not in ("json", "arrow"):
+                raise BadRequest("format must be json or arrow")
+
+            # The page is fully determined by the data version and the request,
+            # so a matching ETag is answered before touching the cache or SQLite
+            key = (version, dataset, tuple(sorted(filters.items())))
+            etag = self._etag(key + (limit, offset, fmt))
+            response_headers = {
+                "Content-Type": ARROW_MIME if fmt == "arrow" else "application/json",
+                "ETag": etag,
+                "Cache-Control": "no-cache",
+                "X-Data-Version": version,
+            }
+            if self._not_modified(headers, etag):
+                return 304, response_headers, b""
+
+            if dataset == "skus" and not filters:
+                # The engine keeps its own ranking in memory, so there is nothing to cache
+                page, total = await self._run(self._sku_page, offset, limit)
+            else:
+                df = self.cache.get(key)
+                if df is None:
+                    df = await self._run(self._aggregate, dataset, filters)
+                    self.cache.put(key, df)
+                page, total = df.iloc[offset:offset + limit].reset_index(drop=True), len(df)
+            response_headers["X-Total-Count"] = str(total)
+            if fmt == "arrow":
+                try:
+                    body = await self._run(self._arrow_body, page)
+                except RuntimeError as e:  # pyarrow is not installed
+                    return self._error(501, str(e))
+            else:
+                body = json.dumps({
+                    "dataset": dataset,
+                    "version": version,
+                    "total": total,
+                    "offset": offset,
+                    "limit": limit,
+                    "next_offset": offset + limit if offset + limit < total else None,
+                    "rows": _records(page),
+                }, default=_json_default).encode()
+            return 200, response_headers, body
+        except BadRequest as e:
+            return self._error(400, str(e))
+        except FileNotFoundError as e:
+            return self._error(503, str(e))
+        except (sqlite3.Error, pd.errors.DatabaseError) as e:
+            return self._error(500, f"Database query failed: {e}")
+        except RuntimeError as e:  # the SKU engine wraps its database errors
+            return self._error(500, str(e))
+
+    @staticmethod
+    def _etag(parts: tuple) -> str:
+        return '"' + hashlib.sha256(repr(parts).encode()).hexdigest()[:32] + '"'
+
+    @staticmethod
+    def _not_modified(request_headers: Dict[str, str], etag: str) -> bool:
+        tags = [tag.strip() for tag in request_headers.get("if-none-match", "").split(",")]
+        candidates = [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+        return etag in candidates or "*" in candidates
+
+    @staticmethod
+    def _arrow_body(page: pd.DataFrame) -> bytes:
+        from columnar import _require_pyarrow, to_arrow_table
+
+        pa = _require_pyarrow()
+        table = to_arrow_table(page)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    @staticmethod
+    def _error(status: int, message: str) -> Response:
+        return status, {"Content-Type": "application/json"}, json.dumps({"error": message}).encode()
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Read one HTTP request from the stream, answer it and close."""
+        try:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            lines = head.decode("latin-1").split("\r\n")
+            try:
+                method, target, _ = lines[0].split(" ", 2)
+            except ValueError:
+                status, headers, body = self._error(400, "Malformed request line")
+            else:
+                request_headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        request_headers[name.strip().lower()] = value.strip()
+                status, headers, body = await self.handle(method, target, request_headers)
+
+            headers = {
+                **headers,
+                "Content-Length": str(len(body)),
+                "Connection": "close",
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Expose-Headers": "ETag, X-Total-Count, X-Data-Version",
+            }
+            response = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            response += "".join(f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+            writer.write(response.encode("latin-1") + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def close(self) -> None:
+        self.connections.close()
+
+
+async def serve(host: str, port: int, service: QueryService) -> None:
+    """Run the HTTP server until cancelled."""
+    server = await asyncio.start_server(service.serve_connection, host, port, limit=MAX_REQUEST_BYTES)
+    addresses = ", ".join(f"http://{sock.getsockname()[0]}:{sock.getsockname()[1]}" for sock in server.sockets)
+    print(f"✅ Serving {service.db} on {addresses}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Serve filtered aggregates over HTTP.")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, help="cached result sets")
+    parser.add_argument(
+        "--cache-mb",
+        type=int,
+        default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+        help="memory the cached result sets may use, in MiB",
+    )
+    args = parser.parse_args(argv)
+
+    if not Path(args.db).exists():
+        print(f"\n❌ Error: Database not found: {args.db}. Please run SQL setup scripts first.", file=sys.stderr)
+        sys.exit(1)
+    service = QueryService(args.db, cache_size=args.cache_size, cache_bytes=args.cache_mb * 1024 * 1024)
+    try:
+        asyncio.run(serve(args.host, args.port, service))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
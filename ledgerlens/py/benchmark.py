@@ -0,0 +1,251 @@
+"""Benchmark suite for the ingest -> clean -> views -> export -> chart pipeline.
+
+generate_orders_raw() writes synthetic orders_raw-shaped rows with
+realistic cardinalities (a few thousand SKUs with a long-tail popularity,
+~125 lines per customer, 38 countries dominated by the UK, ~20 lines per
+invoice, ~2% cancellations and ~25% anonymous invoices). run_benchmark()
+then times every stage separately on a scratch database and returns a JSON-
+serializable report that can be compared against a saved baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ingest import RAW_COLUMNS, apply_bulk_pragmas
+from profiling import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+SQL_DIR = ROOT / "sql"
+
+SIZES = {"100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+DEFAULT_TOLERANCE = 0.25
+
+COUNTRIES = [
+    "United Kingdom", "Germany", "France", "EIRE", "Spain", "Netherlands", "Belgium", "Switzerland",
+    "Portugal", "Australia", "Norway", "Italy", "Channel Islands", "Finland", "Cyprus", "Sweden",
+    "Unspecified", "Austria", "Denmark", "Japan", "Poland", "Israel", "USA", "Hong Kong", "Singapore",
+    "Iceland", "Canada", "Greece", "Malta", "United Arab Emirates", "European Community", "RSA",
+    "Lebanon", "Lithuania", "Brazil", "Czech Republic", "Bahrain", "Saudi Arabia",
+]
+
+
+def _cardinalities(rows: int) -> Dict[str, int]:
+    """Scale entity counts from the 541,909-row reference dataset."""
+    return {
+        "invoices": max(rows // 20, 1),
+        "customers": max(rows // 125, 10),
+        "skus": min(max(rows // 135, 50), 20_000),
+    }
+
+
+def generate_orders_raw(db: str, rows: int, seed: int = 42, chunk_size: int = 250_000) -> None:
+    """Create orders_raw in db and fill it with rows synthetic lines."""
+    rng = np.random.default_rng(seed)
+    card = _cardinalities(rows)
+
+    # Per-entity attributes
+    sku_codes = np.array([f"{20000 + i}" for i in range(card["skus"])], dtype=object)
+    sku_prices = np.round(rng.lognormal(mean=1.0, sigma=0.8, size=card["skus"]), 2)
+    sku_weights = 1.0 / np.arange(1, card["skus"] + 1) ** 1.1
+    sku_weights /= sku_weights.sum()
+
+    country_weights = np.full(len(COUNTRIES), 0.09 / (len(COUNTRIES) - 1))
+    country_weights[0] = 0.91
+    customer_country = rng.choice(len(COUNTRIES), size=card["customers"], p=country_weights)
+
+    inv_customer = rng.integers(0, card["customers"], size=card["invoices"])
+    inv_anonymous = rng.random(card["invoices"]) < 0.25
+    inv_cancelled = rng.random(card["invoices"]) < 0.02
+    start = np.datetime64("2010-12-01T00:00")
+    minutes = 396 * 24 * 60  # ~13 months
+    inv_ts = np.sort(start + rng.integers(0, minutes, size=card["invoices"]).astype("timedelta64[m]"))
+
+    with connect(db, isolation_level=None) as con:
+        apply_bulk_pragmas(con)
+        con.executescript((SQL_DIR / "00_schema.sql").read_text())
+        insert_sql = f"INSERT INTO orders_raw ({', '.join(RAW_COLUMNS)}) VALUES ({', '.join('?' for _ in RAW_COLUMNS)})"
+        con.execute("BEGIN")
+        # Lines are sorted by invoice so invoices stay contiguous like the real export
+        line_invoice = np.sort(rng.integers(0, card["invoices"], size=rows))
+        for lo in range(0, rows, chunk_size):
+            inv = line_invoice[lo:lo + chunk_size]
+            n = len(inv)
+            sku = rng.choice(card["skus"], size=n, p=sku_weights)
+            qty = rng.integers(1, 25, size=n)
+            qty = np.where(inv_cancelled[inv], -qty, qty)
+
+            ts = pd.to_datetime(inv_ts[inv])
+            invoice_date = (
+                ts.month.astype(str) + "/" + ts.day.astype(str) + "/" + ts.year.astype(str)
+                + " " + ts.hour.astype(str) + ":" + pd.Index(ts.minute).astype(str).str.zfill(2)
+            )
+            invoice_no = pd.Index(536365 + inv).astype(str)
+            invoice_no = np.where(inv_cancelled[inv], "C" + invoice_no, invoice_no)
+            customer = inv_customer[inv]
+            customer_id = np.where(inv_anonymous[inv], "", pd.Index(12346 + customer).astype(str))
+
+            frame = pd.DataFrame({
+                "InvoiceNo": invoice_no,
+                "StockCode": sku_codes[sku],
+                "Description": "ITEM " + sku_codes[sku],
+                "Quantity": qty.astype(str),
+                "InvoiceDate": np.asarray(invoice_date),
+                "UnitPrice": sku_prices[sku].astype(str),
+                "CustomerID": customer_id,
+                "Country": np.asarray(COUNTRIES, dtype=object)[customer_country[customer]],
+            })
+            con.executemany(insert_sql, frame.itertuples(index=False, name=None))
+        con.execute("COMMIT")
+
+
+@contextmanager
+def timed(stages: Dict[str, float], name: str) -> Iterator[None]:
+    """Record the wall time of the enclosed block as stages[name]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = time.perf_counter() - start
+
+
+def run_benchmark(rows: int, work_dir: Path, seed: int = 42, charts_enabled: bool = True) -> Dict[str, object]:
+    """Build a database of rows synthetic lines in work_dir and time every stage."""
+    import charts
+    from clean import full_rebuild
+    from indexes import ensure_indexes
+    from rollups import compute_rollups, compute_rollups_parallel
+
+    work_dir = Path(work_dir)
+    db = str(work_dir / "bench.db")
+    stages: Dict[str, float] = {}
+
+    with timed(stages, "generate"):
+        generate_orders_raw(db, rows, seed)
+    # Both engines rebuild orders without indexes; index creation is its own stage
+    with timed(stages, "clean.python"):
+        full_rebuild(db, engine="python", indexes=False)
+    with timed(stages, "clean.sql"):
+        full_rebuild(db, engine="sql", indexes=False)
+    with connect(db) as con:
+        with timed(stages, "indexes"):
+            ensure_indexes(con)
+        with timed(stages, "views.create"):
+            con.executescript((SQL_DIR / "20_views.sql").read_text())
+        for view in charts.REQUIRED_VIEWS:
+            with timed(stages, f"query.{view}"):
+                con.execute(f"SELECT * FROM {view}").fetchall()
+        clean_rows = con.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+    # The same four datasets from one pandas scan, to compare with the query.* stages
+    with timed(stages, "rollups.single_pass"):
+        compute_rollups(db)
+    jobs = max(os.cpu_count() or 1, 2)
+    with timed(stages, f"rollups.parallel.{jobs}"):
+        compute_rollups_parallel(db, jobs)
+
+    # Point the exporters and charts at the scratch database and directories
+    saved = (charts.DB, charts.DATA, charts.ASSETS)
+    charts.DB, charts.DATA, charts.ASSETS = db, work_dir, work_dir
+    try:
+        frames = {}
+        for key, export in [
+            ("monthly", charts.export_monthly_kpis),
+            ("country", charts.export_country_summary),
+            ("customers", charts.export_top_customers),
+            ("sku", charts.export_sku_abc),
+        ]:
+            with timed(stages, f"export.{export.__name__}"):
+                frames[key] = export()
+        if charts_enabled:
+            for _, chart, dataset, head, _ in charts.CHARTS:
+                df = frames[dataset] if head is None else frames[dataset].head(head)
+                with timed(stages, f"chart.{chart.__name__}"):
+                    chart(df)
+    finally:
+        charts.DB, charts.DATA, charts.ASSETS = saved
+
+    return {"rows": rows, "clean_rows": clean_rows, "seed": seed, "stages": stages}
+
+
+def compare(report: Dict[str, object], baseline: Dict[str, object], tolerance: float = DEFAULT_TOLERANCE) -> List[Dict[str, object]]:
+    """List stages that got slower than baseline by more than tolerance (0.25 = 25%)."""
+    base_runs = {run["rows"]: run["stages"] for run in baseline["runs"]}
+    regressions = []
+    for run in report["runs"]:
+        base = base_runs.get(run["rows"])
+        if not base:
+            continue
+        for stage, seconds in run["stages"].items():
+            before = base.get(stage)
+            if before and seconds > before * (1 + tolerance):
+                regressions.append({
+                    "rows": run["rows"],
+                    "stage": stage,
+                    "baseline": before,
+                    "current": seconds,
+                    "ratio": seconds / before,
+                })
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic data.")
+    parser.add_argument("--sizes", default="100k", help=f"comma-separated sizes from {sorted(SIZES)} or row counts")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for the generator")
+    parser.add_argument("--output", default="bench_results.json", help="JSON report path")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown before a stage counts as a regression")
+    parser.add_argument("--no-charts", action="store_true", help="skip the chart_* stages")
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = [SIZES[s.lower()] if s.lower() in SIZES else int(s) for s in args.sizes.split(",")]
+    except ValueError:
+        print(f"\n❌ Error: invalid --sizes value: {args.sizes}", file=sys.stderr)
+        sys.exit(1)
+
+    report: Dict[str, object] = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+        },
+        "runs": [],
+    }
+    for rows in sizes:
+        print(f"Benchmarking {rows:,} rows...")
+        with tempfile.TemporaryDirectory() as tmp:
+            run = run_benchmark(rows, Path(tmp), args.seed, charts_enabled=not args.no_charts)
+        for stage, seconds in run["stages"].items():
+            print(f"  ✓ {stage}: {seconds:.3f}s")
+        report["runs"].append(run)
+
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"\n✅ Wrote {args.output}")
+
+    if args.baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for r in regressions:
+            print(f"  ✗ {r['rows']:,} rows {r['stage']}: {r['baseline']:.3f}s -> {r['current']:.3f}s ({r['ratio']:.2f}x)")
+        if regressions:
+            print(f"\n❌ {len(regressions)} stage(s) regressed beyond {args.tolerance:.0%}", file=sys.stderr)
+            sys.exit(1)
+        print("  ✓ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
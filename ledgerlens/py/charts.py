@@ -1,15 +1,51 @@
+"""Export dashboard CSVs and render the PNG charts.
+
+    python charts.py [validate|export|render|all] [options]
+
+validate checks the database and the view data, export writes the CSVs,
+render draws the charts from the exported CSVs, and all (the default) does
+export and render in one run. pandas and matplotlib are imported only by
+the functions that need them, so validate/export never load matplotlib and
+importing this module (e.g. for the validators) stays cheap.
+"""
+from __future__ import annotations
+
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import inspect
+import os
 import sqlite3
 import sys
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
 
-import matplotlib.pyplot as plt
-import pandas as pd
+import profiling
+from profiling import span, traced
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from connections import ConnectionManager
+    from quality import QualityReport
+    from render_cache import RenderCache
 
 DB = str(Path(__file__).resolve().parent.parent / "db" / "ledgerlens.db")
 ASSETS = Path(__file__).resolve().parent.parent / "web" / "src" / "assets"
-ASSETS.mkdir(parents=True, exist_ok=True)
 DATA = Path(__file__).resolve().parent.parent / "web" / "src" / "data"
-DATA.mkdir(parents=True, exist_ok=True)
+
+COMMANDS = ("validate", "export", "render", "all")
+
+# CSV written by each export, keyed by dataset name
+EXPORT_FILES = {
+    "monthly": "orders_month.csv",
+    "country": "country_summary.csv",
+    "customers": "top_customers.csv",
+    "sku": "sku_abc.csv",
+    "cohorts": "cohort_retention.csv",
+}
 
 # Required views for the script to work
 REQUIRED_VIEWS = [
@@ -20,12 +56,37 @@ REQUIRED_VIEWS = [
 ]
 
 
-def validate_database() -> None:
+_connections: Optional[ConnectionManager] = None
+
+
+def connections(db: Optional[str] = None) -> ConnectionManager:
+    """The shared read-only connection manager for db (default DB), reopened if the path has changed."""
+    from connections import ConnectionManager
+
+    global _connections
+    db = db or DB
+    if _connections is None or _connections.db != db:
+        close_connections()
+        _connections = ConnectionManager(db)
+    return _connections
+
+
+def close_connections() -> None:
+    """Close the shared connections; the next query reopens them."""
+    global _connections
+    if _connections is not None:
+        _connections.close()
+        _connections = None
+
+
+@traced("validate")
+def validate_database(db: Optional[str] = None) -> None:
     """Check if database exists and required views are present."""
-    if not Path(DB).exists():
-        raise FileNotFoundError(f"Database not found: {DB}. Please run SQL setup scripts first.")
+    db = db or DB
+    if not Path(db).exists():
+        raise FileNotFoundError(f"Database not found: {db}. Please run SQL setup scripts first.")
     
-    with sqlite3.connect(DB) as con:
+    with connections(db).connection() as con:
         cursor = con.cursor()
         # Check if views exist
         for view_name in REQUIRED_VIEWS:
@@ -37,16 +98,42 @@ def validate_database() -> None:
                 raise ValueError(f"Required view '{view_name}' not found. Please run sql/20_views.sql first.")
 
 
-def q(sql: str) -> pd.DataFrame:
-    """Execute SQL query and return DataFrame. Raises exception on error."""
+def view_name(view: str, materialized: bool = False) -> str:
+    """Return the view to read: the plain view or its materialized counterpart."""
+    if not materialized:
+        return view
+    from materialize import MATERIALIZED_VIEWS
+    return MATERIALIZED_VIEWS[view]
+
+
+def q(sql: str, db: Optional[str] = None) -> pd.DataFrame:
+    """Execute SQL query on the shared connection to db (default DB) and return DataFrame. Raises exception on error."""
     try:
-        with sqlite3.connect(DB) as con:
-            return pd.read_sql_query(sql, con)
+        with span("q", "sql", sql=" ".join(sql.split())) as args:
+            df = connections(db).query(sql)
+            args["rows"] = len(df)
+        return df
     except sqlite3.Error as e:
         raise RuntimeError(f"Database query failed: {e}") from e
 
 
-def validate_monthly_data(df: pd.DataFrame) -> None:
+def _check_rules(df: pd.DataFrame, rules: str, noun: str) -> QualityReport:
+    """Evaluate one of quality's *_RULES lists on df; errors raise ValueError, warnings are printed.
+
+    Rules on optional columns that df does not have are skipped.
+    """
+    import quality
+
+    applicable = [rule for rule in getattr(quality, rules) if set(rule.columns) <= set(df.columns)]
+    report = quality.check_frame(df, applicable)
+    report.raise_for_errors(noun)
+    for result in report.failures("warning"):
+        print(f"  ⚠️  Warning: {result['violations']} {result['description']}")
+    return report
+
+
+@traced("validate")
+def validate_monthly_data(df: pd.DataFrame) -> QualityReport:
     """Validate monthly KPI data for quality issues."""
     if df.empty:
         raise ValueError("Monthly data is empty")
@@ -57,45 +144,11 @@ def validate_monthly_data(df: pd.DataFrame) -> None:
     if missing:
         raise ValueError(f"Missing required columns: {missing}")
     
-    # Check for null values in critical columns
-    critical_cols = ["ym", "revenue", "gross_profit"]
-    for col in critical_cols:
-        null_count = df[col].isna().sum()
-        if null_count > 0:
-            print(f"  ⚠️  Warning: {null_count} null values found in {col}")
-    
-    # Validate revenue and profit are non-negative
-    negative_revenue = (df["revenue"] < 0).sum()
-    negative_profit = (df["gross_profit"] < 0).sum()
-    if negative_revenue > 0:
-        raise ValueError(f"Found {negative_revenue} rows with negative revenue")
-    if negative_profit > 0:
-        print(f"  ⚠️  Warning: {negative_profit} rows with negative gross profit")
-    
-    # Check for outliers (revenue > 3 standard deviations from mean)
-    if len(df) > 1:
-        mean_rev = df["revenue"].mean()
-        std_rev = df["revenue"].std()
-        if std_rev > 0:
-            outliers = df[abs(df["revenue"] - mean_rev) > 3 * std_rev]
-            if len(outliers) > 0:
-                print(f"  ⚠️  Warning: {len(outliers)} potential revenue outliers detected")
-    
-    # Validate date range (should be reasonable)
-    if "ym" in df.columns:
-        try:
-            dates = pd.to_datetime(df["ym"] + "-01", format="%Y-%m-%d", errors="coerce")
-            if dates.isna().any():
-                print(f"  ⚠️  Warning: Some dates could not be parsed")
-            else:
-                date_range = (dates.max() - dates.min()).days
-                if date_range > 365 * 5:  # More than 5 years seems suspicious
-                    print(f"  ⚠️  Warning: Date range spans {date_range} days ({date_range/365:.1f} years)")
-        except Exception:
-            pass  # Date validation is optional
-
-
-def validate_country_data(df: pd.DataFrame) -> None:
+    return _check_rules(df, "MONTHLY_RULES", "rows")
+
+
+@traced("validate")
+def validate_country_data(df: pd.DataFrame) -> QualityReport:
     """Validate country summary data."""
     if df.empty:
         raise ValueError("Country data is empty")
@@ -103,18 +156,11 @@ def validate_country_data(df: pd.DataFrame) -> None:
     if "country" not in df.columns or "revenue" not in df.columns:
         raise ValueError("Missing required columns: country, revenue")
     
-    # Check for null countries
-    null_countries = df["country"].isna().sum()
-    if null_countries > 0:
-        print(f"  ⚠️  Warning: {null_countries} rows with null country")
-    
-    # Validate revenue
-    negative_revenue = (df["revenue"] < 0).sum()
-    if negative_revenue > 0:
-        raise ValueError(f"Found {negative_revenue} countries with negative revenue")
+    return _check_rules(df, "COUNTRY_RULES", "countries")
 
 
-def validate_customer_data(df: pd.DataFrame) -> None:
+@traced("validate")
+def validate_customer_data(df: pd.DataFrame) -> QualityReport:
     """Validate customer data."""
     if df.empty:
         raise ValueError("Customer data is empty")
@@ -122,13 +168,11 @@ def validate_customer_data(df: pd.DataFrame) -> None:
     if "revenue" not in df.columns:
         raise ValueError("Missing required column: revenue")
     
-    # Validate revenue
-    negative_revenue = (df["revenue"] < 0).sum()
-    if negative_revenue > 0:
-        raise ValueError(f"Found {negative_revenue} customers with negative revenue")
+    return _check_rules(df, "CUSTOMER_RULES", "customers")
 
 
-def validate_sku_data(df: pd.DataFrame) -> None:
+@traced("validate")
+def validate_sku_data(df: pd.DataFrame) -> QualityReport:
     """Validate SKU ABC data."""
     if df.empty:
         raise ValueError("SKU data is empty")
@@ -136,80 +180,285 @@ def validate_sku_data(df: pd.DataFrame) -> None:
     if "sku" not in df.columns or "revenue" not in df.columns:
         raise ValueError("Missing required columns: sku, revenue")
     
-    # Validate revenue
-    negative_revenue = (df["revenue"] < 0).sum()
-    if negative_revenue > 0:
-        raise ValueError(f"Found {negative_revenue} SKUs with negative revenue")
-    
-    # Check ABC classification if present
-    if "abc_class" in df.columns:
-        valid_classes = {"A", "B", "C"}
-        invalid = df[(~df["abc_class"].isin(valid_classes)) & (df["abc_class"].notna())]
-        if len(invalid) > 0:
-            print(f"  ⚠️  Warning: {len(invalid)} SKUs with invalid ABC class")
+    return _check_rules(df, "SKU_RULES", "SKUs")
+
+
+@traced("validate")
+def validate_cohort_data(df: pd.DataFrame) -> QualityReport:
+    """Validate cohort retention data."""
+    if df.empty:
+        raise ValueError("Cohort data is empty")
+
+    missing = [col for col in ("cohort", "customers", "m0") if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}")
+
+    return _check_rules(df, "COHORT_RULES", "cohorts")
+
+
+def write_csv(df: pd.DataFrame, filename: str, cache: Optional[RenderCache] = None) -> None:
+    """Write an export to DATA unless the cache says the file is already up to date."""
+    from render_cache import frame_fingerprint
+
+    DATA.mkdir(parents=True, exist_ok=True)
+    fingerprint = frame_fingerprint(df)
+    if cache is not None and cache.is_fresh(filename, fingerprint):
+        return
+    with span("write_csv", "io", file=filename, rows=len(df)):
+        df.to_csv(DATA / filename, index=False)
+    if cache is not None:
+        cache.record(filename, fingerprint)
 
 
 # CSV Exports
-def export_monthly_kpis() -> pd.DataFrame:
+@traced("export")
+def export_monthly_kpis(
+    materialized: bool = False,
+    cache: Optional[RenderCache] = None,
+    db: Optional[str] = None,
+) -> pd.DataFrame:
     """Export monthly KPIs to CSV. Returns DataFrame."""
     try:
-        df = q("SELECT * FROM v_orders_month ORDER BY ym;")
+        df = q(f"SELECT * FROM {view_name('v_orders_month', materialized)} ORDER BY ym;", db)
         if df.empty:
             raise ValueError("v_orders_month view returned no data")
         validate_monthly_data(df)
-        df.to_csv(DATA / "orders_month.csv", index=False)
+        write_csv(df, "orders_month.csv", cache)
         return df
     except Exception as e:
         raise RuntimeError(f"Failed to export monthly KPIs: {e}") from e
 
 
-def export_country_summary() -> pd.DataFrame:
+@traced("export")
+def export_country_summary(
+    materialized: bool = False,
+    cache: Optional[RenderCache] = None,
+    db: Optional[str] = None,
+) -> pd.DataFrame:
     """Export country summary to CSV. Returns DataFrame."""
     try:
-        df = q("SELECT * FROM v_country_summary;")
+        df = q(f"SELECT * FROM {view_name('v_country_summary', materialized)};", db)
         if df.empty:
             raise ValueError("v_country_summary view returned no data")
         validate_country_data(df)
-        df.to_csv(DATA / "country_summary.csv", index=False)
+        write_csv(df, "country_summary.csv", cache)
         return df
     except Exception as e:
         raise RuntimeError(f"Failed to export country summary: {e}") from e
 
 
-def export_top_customers() -> pd.DataFrame:
-    """Export top customers to CSV. Returns DataFrame."""
+@traced("export")
+def export_top_customers(
+    materialized: bool = False,
+    cache: Optional[RenderCache] = None,
+    db: Optional[str] = None,
+) -> pd.DataFrame:
+    """Export top customers to CSV. Returns DataFrame.
+
+    The plain path reads the top of mv_customer's revenue index
+    (customer_topk.py) instead of ranking every customer, and falls back to
+    v_top_customers while the summaries are stale. Neither path writes.
+    """
     try:
-        df = q("SELECT * FROM v_top_customers;")
+        if materialized:
+            df = q(f"SELECT * FROM {view_name('v_top_customers', materialized)};", db)
+        else:
+            from customer_topk import top_customers
+            with connections(db).connection() as con:
+                df = top_customers(db or DB, con=con)
         if df.empty:
             raise ValueError("v_top_customers view returned no data")
         validate_customer_data(df)
-        df.to_csv(DATA / "top_customers.csv", index=False)
+        write_csv(df, "top_customers.csv", cache)
         return df
     except Exception as e:
         raise RuntimeError(f"Failed to export top customers: {e}") from e
 
 
-def export_sku_abc() -> pd.DataFrame:
-    """Export SKU ABC analysis to CSV. Returns DataFrame."""
+@traced("export")
+def export_sku_abc(
+    materialized: bool = False,
+    cache: Optional[RenderCache] = None,
+    incremental: bool = False,
+    db: Optional[str] = None,
+) -> pd.DataFrame:
+    """Export SKU ABC analysis to CSV, optionally from the incremental ABC engine. Returns DataFrame."""
     try:
-        df = q("SELECT * FROM v_sku_abc ORDER BY revenue DESC;")
+        if incremental:
+            from abc_engine import classify_skus
+            with connections(db).connection() as con:
+                df = classify_skus(db or DB, con=con)
+        else:
+            df = q(f"SELECT * FROM {view_name('v_sku_abc', materialized)} ORDER BY revenue DESC;", db)
         if df.empty:
             raise ValueError("v_sku_abc view returned no data")
         validate_sku_data(df)
-        df.to_csv(DATA / "sku_abc.csv", index=False)
+        write_csv(df, "sku_abc.csv", cache)
         return df
     except Exception as e:
         raise RuntimeError(f"Failed to export SKU ABC: {e}") from e
 
 
+@traced("export")
+def export_cohort_retention(cache: Optional[RenderCache] = None, db: Optional[str] = None) -> pd.DataFrame:
+    """Export monthly cohort retention to CSV. Returns DataFrame.
+
+    Reads the cohort tables that cohorts.py folds forward from new orders
+    instead of joining orders to itself; while they lag behind orders the
+    matrix is computed in memory. Nothing is written.
+    """
+    from cohorts import retention
+
+    try:
+        with connections(db).connection() as con:
+            df = retention(db or DB, con=con)
+        validate_cohort_data(df)
+        write_csv(df, "cohort_retention.csv", cache)
+        return df
+    except Exception as e:
+        raise RuntimeError(f"Failed to export cohort retention: {e}") from e
+
+
+@traced("export")
+def export_single_pass(
+    cache: Optional[RenderCache] = None,
+    jobs: int = 1,
+    db: Optional[str] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Build all four CSV exports from one scan of orders, split across jobs processes. Returns DataFrames by name."""
+    from rollups import compute_rollups, compute_rollups_parallel
+
+    exports = [
+        ("monthly", validate_monthly_data, "orders_month.csv"),
+        ("country", validate_country_data, "country_summary.csv"),
+        ("customers", validate_customer_data, "top_customers.csv"),
+        ("sku", validate_sku_data, "sku_abc.csv"),
+    ]
+    try:
+        if jobs > 1:
+            # Worker processes cannot share a connection; each opens its own read-only one
+            frames = compute_rollups_parallel(db or DB, jobs)
+        else:
+            with connections(db).connection() as con:
+                frames = compute_rollups(db or DB, con=con)
+        for name, validate, filename in exports:
+            validate(frames[name])
+            write_csv(frames[name], filename, cache)
+        return frames
+    except Exception as e:
+        raise RuntimeError(f"Failed to export single-pass rollups: {e}") from e
+
+
+@traced("export")
+def export_approx_distinct(
+    error: float,
+    cache: Optional[RenderCache] = None,
+    db: Optional[str] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Export monthly KPIs and country summary with orders/buyers estimated from HyperLogLog sketches."""
+    from sketches import approx_country_summary, approx_monthly, refresh_sketches
+
+    db = db or DB
+    try:
+        refresh_sketches(db, error)
+        monthly = approx_monthly(db)
+        validate_monthly_data(monthly)
+        write_csv(monthly, "orders_month.csv", cache)
+        country = approx_country_summary(db)
+        validate_country_data(country)
+        write_csv(country, "country_summary.csv", cache)
+        return {"monthly": monthly, "country": country}
+    except Exception as e:
+        raise RuntimeError(f"Failed to export approximate distinct counts: {e}") from e
+
+
+@traced("export")
+def export_partitioned(
+    cache: Optional[RenderCache] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    db: Optional[str] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Refresh the orders partitions and export all four views over those covering [start, end].
+
+    Without a range the views run on the main database instead: every
+    partition would be read, and the indexed views there are faster than the
+    same views over the attached partitions.
+    """
+    from partitions import attach_range, refresh_partitions
+
+    exports = [
+        ("monthly", "SELECT * FROM v_orders_month ORDER BY ym;", validate_monthly_data, "orders_month.csv"),
+        ("country", "SELECT * FROM v_country_summary;", validate_country_data, "country_summary.csv"),
+        ("customers", "SELECT * FROM v_top_customers;", validate_customer_data, "top_customers.csv"),
+        ("sku", "SELECT * FROM v_sku_abc ORDER BY revenue DESC;", validate_sku_data, "sku_abc.csv"),
+    ]
+    import pandas as pd
+
+    db = db or DB
+    try:
+        refresh_partitions(db)
+        frames = {}
+        if start is None and end is None:
+            for name, sql, validate, filename in exports:
+                frames[name] = q(sql, db)
+                validate(frames[name])
+                write_csv(frames[name], filename, cache)
+            return frames
+        with attach_range(db, start, end) as con:
+            for name, sql, validate, filename in exports:
+                with span("q", "sql", sql=sql) as args:
+                    frames[name] = pd.read_sql_query(sql, con)
+                    args["rows"] = len(frames[name])
+                validate(frames[name])
+                write_csv(frames[name], filename, cache)
+        return frames
+    except Exception as e:
+        raise RuntimeError(f"Failed to export from partitions: {e}") from e
+
+
+@traced("export")
+def export_cube(db: Optional[str] = None) -> Dict[str, object]:
+    """Fold new orders into the day × country × export cube next to db (py/cube.py)."""
+    from cube import refresh_cube
+
+    try:
+        return refresh_cube(db or DB)
+    except Exception as e:
+        raise RuntimeError(f"Failed to build the order cube: {e}") from e
+
+
 # Chart Functions
+def _figure(figsize: Tuple[float, float]):
+    """Create a Figure on the non-interactive Agg backend, importing matplotlib on first use."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize)
+
+
+def _rotate_xticks(ax) -> None:
+    """Slant the x tick labels so month labels do not overlap."""
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_horizontalalignment("right")
+
+
+def _save_png(fig, filename: str) -> None:
+    """Write a chart to ASSETS."""
+    with span("write_png", "io", file=filename):
+        fig.savefig(ASSETS / filename, dpi=160, bbox_inches="tight")
+
+
+@traced("chart")
 def chart_revenue_vs_profit(df: pd.DataFrame) -> None:
     """Generate revenue vs profit chart. Raises exception on error."""
     try:
         if df.empty or "ym" not in df.columns or "revenue" not in df.columns or "gross_profit" not in df.columns:
             raise ValueError("DataFrame missing required columns: ym, revenue, gross_profit")
         
-        fig, ax = plt.subplots(figsize=(10, 5))
+        fig = _figure((10, 5))
+        ax = fig.subplots()
         ax.plot(df["ym"], df["revenue"] / 1000, marker="o", label="Revenue", linewidth=2)
         ax.plot(df["ym"], df["gross_profit"] / 1000, marker="s", label="Gross Profit", linewidth=2)
         ax.set_title("Monthly Revenue vs Gross Profit", fontsize=14, fontweight="bold")
@@ -217,21 +466,22 @@ def chart_revenue_vs_profit(df: pd.DataFrame) -> None:
         ax.set_ylabel("Amount (thousands)", fontsize=11)
         ax.legend(loc="best")
         ax.grid(True, alpha=0.3)
-        plt.xticks(rotation=45, ha="right")
-        plt.tight_layout()
-        plt.savefig(ASSETS / "rev_gp.png", dpi=160, bbox_inches="tight")
-        plt.close()
+        _rotate_xticks(ax)
+        fig.tight_layout()
+        _save_png(fig, "rev_gp.png")
     except Exception as e:
         raise RuntimeError(f"Failed to generate revenue vs profit chart: {e}") from e
 
 
+@traced("chart")
 def chart_revenue_mom_growth(df: pd.DataFrame) -> None:
     """Generate revenue MoM growth chart. Raises exception on error."""
     try:
         if df.empty or "ym" not in df.columns or "revenue" not in df.columns:
             raise ValueError("DataFrame missing required columns: ym, revenue")
         
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8), sharex=True)
+        fig = _figure((10, 8))
+        ax1, ax2 = fig.subplots(2, 1, sharex=True)
         
         # Revenue line with MoM annotations
         ax1.plot(df["ym"], df["revenue"] / 1000, marker="o", linewidth=2, color="#2563eb")
@@ -240,6 +490,7 @@ def chart_revenue_mom_growth(df: pd.DataFrame) -> None:
         ax1.grid(True, alpha=0.3)
         
         # Annotate MoM growth on points
+        import pandas as pd
         for i, row in df.iterrows():
             if pd.notna(row.get("revenue_mom_pct")):
                 growth = row["revenue_mom_pct"] * 100
@@ -266,23 +517,25 @@ def chart_revenue_mom_growth(df: pd.DataFrame) -> None:
         ax2.axhline(y=0, color="black", linestyle="-", linewidth=0.8)
         ax2.grid(True, alpha=0.3, axis="y")
         
-        plt.tight_layout()
-        plt.savefig(ASSETS / "revenue_mom.png", dpi=160, bbox_inches="tight")
-        plt.close()
+        fig.tight_layout()
+        _save_png(fig, "revenue_mom.png")
     except Exception as e:
         raise RuntimeError(f"Failed to generate revenue MoM growth chart: {e}") from e
 
 
+@traced("chart")
 def chart_domestic_vs_export(df: pd.DataFrame) -> None:
     """Generate domestic vs export chart. Raises exception on error."""
     try:
         if df.empty or "ym" not in df.columns:
             raise ValueError("DataFrame missing required columns: ym")
         
-        fig, ax = plt.subplots(figsize=(10, 5))
+        fig = _figure((10, 5))
+        ax = fig.subplots()
         x = range(len(df))
         width = 0.35
         
+        import pandas as pd
         domestic = (df["revenue_domestic"] / 1000).fillna(0) if "revenue_domestic" in df.columns else pd.Series([0] * len(df))
         export = (df["revenue_export"] / 1000).fillna(0) if "revenue_export" in df.columns else pd.Series([0] * len(df))
         
@@ -296,33 +549,34 @@ def chart_domestic_vs_export(df: pd.DataFrame) -> None:
         ax.set_xticklabels(df["ym"], rotation=45, ha="right")
         ax.legend(loc="best")
         ax.grid(True, alpha=0.3, axis="y")
-        plt.tight_layout()
-        plt.savefig(ASSETS / "domestic_export.png", dpi=160, bbox_inches="tight")
-        plt.close()
+        fig.tight_layout()
+        _save_png(fig, "domestic_export.png")
     except Exception as e:
         raise RuntimeError(f"Failed to generate domestic vs export chart: {e}") from e
 
 
+@traced("chart")
 def chart_aov(df: pd.DataFrame) -> None:
     """Generate AOV chart. Raises exception on error."""
     try:
         if df.empty or "ym" not in df.columns or "aov" not in df.columns:
             raise ValueError("DataFrame missing required columns: ym, aov")
         
-        fig, ax = plt.subplots(figsize=(10, 5))
+        fig = _figure((10, 5))
+        ax = fig.subplots()
         ax.plot(df["ym"], df["aov"], marker="o", linewidth=2, color="#8b5cf6")
         ax.set_title("Average Order Value (Monthly)", fontsize=14, fontweight="bold")
         ax.set_xlabel("Month", fontsize=11)
         ax.set_ylabel("AOV ($)", fontsize=11)
         ax.grid(True, alpha=0.3)
-        plt.xticks(rotation=45, ha="right")
-        plt.tight_layout()
-        plt.savefig(ASSETS / "aov.png", dpi=160, bbox_inches="tight")
-        plt.close()
+        _rotate_xticks(ax)
+        fig.tight_layout()
+        _save_png(fig, "aov.png")
     except Exception as e:
         raise RuntimeError(f"Failed to generate AOV chart: {e}") from e
 
 
+@traced("chart")
 def chart_top_countries(df: pd.DataFrame) -> None:
     """Generate top countries chart. Raises exception on error."""
     try:
@@ -333,7 +587,8 @@ def chart_top_countries(df: pd.DataFrame) -> None:
         if top_10.empty:
             raise ValueError("No country data available for chart")
         
-        fig, ax = plt.subplots(figsize=(10, 6))
+        fig = _figure((10, 6))
+        ax = fig.subplots()
         
         bars = ax.barh(range(len(top_10)), top_10["revenue"] / 1000, color="#6366f1", alpha=0.8)
         ax.set_yticks(range(len(top_10)))
@@ -347,13 +602,13 @@ def chart_top_countries(df: pd.DataFrame) -> None:
             ax.text(row["revenue"] / 1000 + 5, i, f"${row['revenue']/1000:.0f}K", 
                     va="center", fontsize=9)
         
-        plt.tight_layout()
-        plt.savefig(ASSETS / "top_countries.png", dpi=160, bbox_inches="tight")
-        plt.close()
+        fig.tight_layout()
+        _save_png(fig, "top_countries.png")
     except Exception as e:
         raise RuntimeError(f"Failed to generate top countries chart: {e}") from e
 
 
+@traced("chart")
 def chart_top_skus(df: pd.DataFrame) -> None:
     """Generate top SKUs chart with ABC classification. Raises exception on error."""
     try:
@@ -364,7 +619,8 @@ def chart_top_skus(df: pd.DataFrame) -> None:
         if top_20.empty:
             raise ValueError("No SKU data available for chart")
         
-        fig, ax = plt.subplots(figsize=(10, 8))
+        fig = _figure((10, 8))
+        ax = fig.subplots()
         
         # Handle missing abc_class column gracefully
         if "abc_class" in top_20.columns:
@@ -391,13 +647,13 @@ def chart_top_skus(df: pd.DataFrame) -> None:
             ]
             ax.legend(handles=legend_elements, loc="lower right")
         
-        plt.tight_layout()
-        plt.savefig(ASSETS / "top_skus.png", dpi=160, bbox_inches="tight")
-        plt.close()
+        fig.tight_layout()
+        _save_png(fig, "top_skus.png")
     except Exception as e:
         raise RuntimeError(f"Failed to generate top SKUs chart: {e}") from e
 
 
+@traced("chart")
 def chart_top_customers(df: pd.DataFrame) -> None:
     """Generate top customers chart. Raises exception on error."""
     try:
@@ -408,7 +664,8 @@ def chart_top_customers(df: pd.DataFrame) -> None:
         if top_15.empty:
             raise ValueError("No customer data available for chart")
         
-        fig, ax = plt.subplots(figsize=(10, 7))
+        fig = _figure((10, 7))
+        ax = fig.subplots()
         
         bars = ax.barh(range(len(top_15)), top_15["revenue"] / 1000, color="#8b5cf6", alpha=0.8)
         ax.set_yticks(range(len(top_15)))
@@ -423,47 +680,406 @@ def chart_top_customers(df: pd.DataFrame) -> None:
             ax.text(row["revenue"] / 1000 + 2, i, f"${row['revenue']/1000:.0f}K", 
                     va="center", fontsize=8)
         
-        plt.tight_layout()
-        plt.savefig(ASSETS / "top_customers.png", dpi=160, bbox_inches="tight")
-        plt.close()
+        fig.tight_layout()
+        _save_png(fig, "top_customers.png")
     except Exception as e:
         raise RuntimeError(f"Failed to generate top customers chart: {e}") from e
 
 
-def main() -> None:
-    """Main function to export CSVs and generate charts. Handles errors gracefully."""
+@traced("chart")
+def chart_cohort_retention(df: pd.DataFrame) -> None:
+    """Generate cohort retention heatmap. Raises exception on error."""
     try:
-        print("Validating database...")
-        validate_database()
-        print("✅ Database validation passed")
-        
-        print("\nExporting CSVs...")
-        monthly_df = export_monthly_kpis()
-        print("  ✓ Monthly KPIs exported and validated")
-        country_df = export_country_summary()
-        print("  ✓ Country summary exported and validated")
-        customers_df = export_top_customers()
+        if df.empty or "cohort" not in df.columns or "m0" not in df.columns:
+            raise ValueError("DataFrame missing required columns: cohort, m0")
+
+        periods = [col for col in df.columns if col.startswith("m") and col[1:].isdigit()]
+        rates = df[periods].to_numpy(dtype=float) * 100
+
+        fig = _figure((max(8, len(periods) * 0.7 + 3), max(4, len(df) * 0.45 + 2)))
+        ax = fig.subplots()
+        image = ax.imshow(rates, cmap="Blues", vmin=0, vmax=100, aspect="auto")
+        ax.set_xticks(range(len(periods)))
+        ax.set_xticklabels([col[1:] for col in periods], fontsize=9)
+        ax.set_yticks(range(len(df)))
+        ax.set_yticklabels([f"{c} (n={n})" for c, n in zip(df["cohort"], df["customers"])], fontsize=9)
+        ax.set_xlabel("Months since first order", fontsize=11)
+        ax.set_ylabel("Cohort (first order month)", fontsize=11)
+        ax.set_title("Monthly Cohort Retention", fontsize=14, fontweight="bold")
+
+        # Label cells when the matrix is small enough to read
+        if rates.size <= 400:
+            for i in range(rates.shape[0]):
+                for j in range(rates.shape[1]):
+                    if rates[i, j] == rates[i, j]:  # skip periods not reached yet (NaN)
+                        ax.text(j, i, f"{rates[i, j]:.0f}%", ha="center", va="center", fontsize=7,
+                                color="white" if rates[i, j] > 60 else "#1f2937")
+
+        fig.colorbar(image, ax=ax, label="Customers active (%)")
+        fig.tight_layout()
+        _save_png(fig, "cohort_retention.png")
+    except Exception as e:
+        raise RuntimeError(f"Failed to generate cohort retention chart: {e}") from e
+
+
+# Shared drawing helpers (figure size, tick style, dpi); their source is part of every chart's cache fingerprint
+RENDER_HELPERS = ("_figure", "_rotate_xticks", "_save_png")
+
+# (label, chart function, dataset name, leading rows the chart needs or None for all, output file)
+CHARTS: List[Tuple[str, Callable[[pd.DataFrame], None], str, Optional[int], str]] = [
+    ("Revenue vs Profit", chart_revenue_vs_profit, "monthly", None, "rev_gp.png"),
+    ("Revenue MoM Growth", chart_revenue_mom_growth, "monthly", None, "revenue_mom.png"),
+    ("Domestic vs Export", chart_domestic_vs_export, "monthly", None, "domestic_export.png"),
+    ("AOV", chart_aov, "monthly", None, "aov.png"),
+    ("Top Countries", chart_top_countries, "country", 10, "top_countries.png"),
+    ("Top SKUs", chart_top_skus, "sku", 20, "top_skus.png"),
+    ("Top Customers", chart_top_customers, "customers", 15, "top_customers.png"),
+    ("Cohort Retention", chart_cohort_retention, "cohorts", None, "cohort_retention.png"),
+]
+
+
+def _init_render_worker(assets: str) -> None:
+    """Point a pool worker at the parent's asset directory."""
+    global ASSETS
+    ASSETS = Path(assets)
+    profiling.disable()
+
+
+def _render_chart(chart: Callable[[pd.DataFrame], None], df: pd.DataFrame) -> Optional[str]:
+    """Render one chart. Returns the error message, or None on success."""
+    try:
+        chart(df)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def render_charts(
+    frames: Dict[str, pd.DataFrame],
+    jobs: int = 1,
+    cache: Optional[RenderCache] = None,
+) -> Dict[str, Optional[str]]:
+    """Render every chart in CHARTS, in a process pool when jobs > 1.
+
+    Each chart receives only the rows it draws. Charts whose rows, source
+    code and RENDER_HELPERS source match the cache manifest are skipped. Failures are collected per
+    chart instead of stopping the run; returns {label: error or None}.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    from render_cache import frame_fingerprint
+
+    ASSETS.mkdir(parents=True, exist_ok=True)
+    helpers = "".join(inspect.getsource(globals()[name]) for name in RENDER_HELPERS)
+    tasks = []
+    fingerprints = {}
+    for label, chart, dataset, rows, filename in CHARTS:
+        df = frames[dataset]
+        df = df if rows is None else df.head(rows)
+        fingerprint = frame_fingerprint(df, inspect.getsource(chart), helpers)
+        if cache is not None and cache.is_fresh(filename, fingerprint):
+            continue
+        fingerprints[label] = (filename, fingerprint)
+        tasks.append((label, chart, df))
+
+    if jobs <= 1 or len(tasks) <= 1:
+        results = {label: _render_chart(chart, df) for label, chart, df in tasks}
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(tasks)),
+            initializer=_init_render_worker,
+            initargs=(str(ASSETS),),
+        ) as pool:
+            futures = {label: pool.submit(_render_chart, chart, df) for label, chart, df in tasks}
+            results = {}
+            for label, future in futures.items():
+                try:
+                    results[label] = future.result()
+                except Exception as e:
+                    results[label] = f"worker failed: {e}"
+
+    if cache is not None:
+        for label, error in results.items():
+            if error is None:
+                cache.record(*fingerprints[label])
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line options for main()."""
+    parser = argparse.ArgumentParser(description="Export dashboard CSVs and render charts.")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=COMMANDS,
+        default="all",
+        help="validate the database, views and order rows, export CSVs, render charts from exported CSVs, or all (default)",
+    )
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument(
+        "--materialized",
+        action="store_true",
+        help="refresh the materialized summary tables and export from the *_mat views",
+    )
+    parser.add_argument(
+        "--single-pass",
+        action="store_true",
+        help="compute all four CSV exports from one streaming scan of orders",
+    )
+    parser.add_argument(
+        "--approx-distinct",
+        type=float,
+        nargs="?",
+        const=0.02,
+        metavar="ERROR",
+        help="estimate monthly/country orders and buyers from HyperLogLog sketches (default error 0.02)",
+    )
+    parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        help="refresh the per-year orders partitions (py/partitions.py) and export from them",
+    )
+    parser.add_argument(
+        "--start",
+        help="with --partitioned: first order date (YYYY-MM or YYYY-MM-DD) to export",
+    )
+    parser.add_argument(
+        "--end",
+        help="with --partitioned: last order date (YYYY-MM or YYYY-MM-DD) to export",
+    )
+    parser.add_argument(
+        "--cube",
+        action="store_true",
+        help="also refresh the day × country × export order cube (py/cube.py) for date-range queries",
+    )
+    parser.add_argument(
+        "--abc-engine",
+        action="store_true",
+        help="classify SKUs from the incrementally maintained sku_revenue table instead of v_sku_abc",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="worker processes for chart rendering and --single-pass scans (0 = one per CPU, 1 = in-process)",
+    )
+    parser.add_argument(
+        "--columnar",
+        choices=["arrow", "parquet"],
+        help="also write typed Arrow IPC or Parquet copies of the CSVs (requires pyarrow)",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="print how long each database query took, plus startup and total time",
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        metavar="PATH",
+        help="write a JSON trace of every pipeline span and SQLite statement to PATH",
+    )
+    parser.add_argument(
+        "--chrome-trace",
+        type=Path,
+        metavar="PATH",
+        help="write the same trace in Chrome trace-event format (chrome://tracing, Perfetto)",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        metavar="PATH",
+        help="run under cProfile and dump pstats to PATH",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="rewrite every CSV and chart even if its inputs are unchanged",
+    )
+    args = parser.parse_args(argv)
+    if args.approx_distinct is not None and args.single_pass:
+        parser.error("--approx-distinct cannot be combined with --single-pass")
+    if args.materialized and args.single_pass:
+        parser.error("--materialized cannot be combined with --single-pass")
+    if args.abc_engine and (args.single_pass or args.partitioned):
+        parser.error("--abc-engine cannot be combined with --single-pass or --partitioned")
+    if args.partitioned and (args.single_pass or args.materialized or args.approx_distinct is not None):
+        parser.error("--partitioned cannot be combined with --single-pass, --materialized or --approx-distinct")
+    if (args.start or args.end) and not args.partitioned:
+        parser.error("--start/--end require --partitioned")
+    return args
+
+
+def validate_views(materialized: bool = False, db: Optional[str] = None) -> None:
+    """Query the four export views and run the validators without writing anything."""
+    validate_monthly_data(q(f"SELECT * FROM {view_name('v_orders_month', materialized)} ORDER BY ym;", db))
+    print("  ✓ Monthly KPIs valid")
+    validate_country_data(q(f"SELECT * FROM {view_name('v_country_summary', materialized)};", db))
+    print("  ✓ Country summary valid")
+    validate_customer_data(q(f"SELECT * FROM {view_name('v_top_customers', materialized)};", db))
+    print("  ✓ Top customers valid")
+    validate_sku_data(q(f"SELECT * FROM {view_name('v_sku_abc', materialized)} ORDER BY revenue DESC;", db))
+    print("  ✓ SKU ABC valid")
+
+
+def validate_orders(db: Optional[str] = None) -> QualityReport:
+    """Check every row of orders against quality.ORDER_RULES; error-severity violations raise ValueError."""
+    from quality import check_orders, format_report
+
+    report = check_orders(db or DB)
+    print(f"  ✓ {report.rows:,} order rows checked against {len(report.rules)} rules in {report.seconds:.2f}s")
+    if report.failures():
+        print(format_report(report))
+    report.raise_for_errors()
+    return report
+
+
+def load_exports() -> Dict[str, pd.DataFrame]:
+    """Read the exported CSVs back from DATA, keyed like render_charts() expects."""
+    import pandas as pd
+
+    missing = [name for name in EXPORT_FILES.values() if not (DATA / name).exists()]
+    if missing:
+        raise FileNotFoundError(
+            f"Exported CSVs not found in {DATA}: {', '.join(missing)}. Please run `python charts.py export` first."
+        )
+    dtypes = {"ym": str, "customer_id": str, "sku": str, "cohort": str}
+    return {dataset: pd.read_csv(DATA / name, dtype=dtypes) for dataset, name in EXPORT_FILES.items()}
+
+
+def run_exports(args: argparse.Namespace, jobs: int) -> Dict[str, pd.DataFrame]:
+    """Write the CSV exports selected by args. Returns the exported frames."""
+    from render_cache import RenderCache
+
+    if args.materialized:
+        from materialize import refresh
+        result = refresh(args.db)
+        print(f"  ✓ Materialized summaries ({result['mode']}, {result['rows']:,} order rows)")
+
+    DATA.mkdir(parents=True, exist_ok=True)
+    csv_cache = RenderCache(DATA, enabled=not args.no_cache)
+
+    print("\nExporting CSVs...")
+    if args.single_pass:
+        frames = export_single_pass(csv_cache, jobs, args.db)
+        print("  ✓ Monthly, country, customer and SKU exports built in one scan and validated")
+    elif args.partitioned:
+        frames = export_partitioned(csv_cache, args.start, args.end, args.db)
+        print("  ✓ Monthly, country, customer and SKU exports built from partitions and validated")
+    else:
+        if args.approx_distinct is not None:
+            frames = export_approx_distinct(args.approx_distinct, csv_cache, args.db)
+            print(f"  ✓ Monthly KPIs and country summary exported with ~{args.approx_distinct:.0%} distinct counts")
+        else:
+            frames = {"monthly": export_monthly_kpis(args.materialized, csv_cache, args.db)}
+            print("  ✓ Monthly KPIs exported and validated")
+            frames["country"] = export_country_summary(args.materialized, csv_cache, args.db)
+            print("  ✓ Country summary exported and validated")
+        frames["customers"] = export_top_customers(args.materialized, csv_cache, args.db)
         print("  ✓ Top customers exported and validated")
-        sku_df = export_sku_abc()
+        frames["sku"] = export_sku_abc(args.materialized, csv_cache, incremental=args.abc_engine, db=args.db)
         print("  ✓ SKU ABC exported and validated")
-        
-        print("\nGenerating charts...")
-        chart_revenue_vs_profit(monthly_df)
-        print("  ✓ Revenue vs Profit chart")
-        chart_revenue_mom_growth(monthly_df)
-        print("  ✓ Revenue MoM Growth chart")
-        chart_domestic_vs_export(monthly_df)
-        print("  ✓ Domestic vs Export chart")
-        chart_aov(monthly_df)
-        print("  ✓ AOV chart")
-        chart_top_countries(country_df)
-        print("  ✓ Top Countries chart")
-        chart_top_skus(sku_df)
-        print("  ✓ Top SKUs chart")
-        chart_top_customers(customers_df)
-        print("  ✓ Top Customers chart")
-        
-        print("\n✅ Successfully exported all charts to web/src/assets and CSVs to web/src/data")
+    frames["cohorts"] = export_cohort_retention(csv_cache, args.db)
+    print("  ✓ Cohort retention exported and validated")
+    if args.columnar:
+        from columnar import export_columnar
+        # One typed file per CSV, named after it (orders_month.csv -> orders_month.arrow)
+        manifest = export_columnar(
+            {Path(filename).stem: frames[name] for name, filename in EXPORT_FILES.items()},
+            DATA,
+            args.columnar,
+            csv_cache,
+        )
+        print(f"  ✓ {len(manifest)} {args.columnar} files and columnar_manifest.json written")
+    if args.cube:
+        result = export_cube(args.db)
+        days, countries = result["shape"][:2]
+        print(f"  ✓ Order cube ({result['mode']}, {days:,} days × {countries} countries)")
+    csv_cache.save()
+    print(f"  ✓ CSV cache: {csv_cache.summary()}")
+    return frames
+
+
+def run_render(args: argparse.Namespace, frames: Dict[str, pd.DataFrame], jobs: int) -> None:
+    """Render every chart from frames. Raises RuntimeError if any chart failed."""
+    from render_cache import RenderCache
+
+    ASSETS.mkdir(parents=True, exist_ok=True)
+    chart_cache = RenderCache(ASSETS, enabled=not args.no_cache)
+
+    print("\nGenerating charts...")
+    results = render_charts(frames, jobs=jobs, cache=chart_cache)
+    chart_cache.save()
+    failed = {label: error for label, error in results.items() if error}
+    for label, error in results.items():
+        print(f"  ✗ {label} chart: {error}" if error else f"  ✓ {label} chart")
+    print(f"  ✓ Chart cache: {chart_cache.summary()}")
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(results)} charts failed: {', '.join(failed)}")
+
+
+def run_command(args: argparse.Namespace) -> None:
+    """Run the validate, export, render or all command."""
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    if args.command == "render":
+        print("Loading exported CSVs...")
+        frames = load_exports()
+        print(f"  ✓ {len(frames)} CSVs loaded from {DATA}")
+    else:
+        print("Validating database...")
+        validate_database(args.db)
+        print("✅ Database validation passed")
+
+    if args.command == "validate":
+        print("\nValidating view data...")
+        validate_views(args.materialized, args.db)
+        print("\nChecking order rows...")
+        validate_orders(args.db)
+    elif args.command in ("export", "all"):
+        frames = run_exports(args, jobs)
+    if args.command in ("render", "all"):
+        run_render(args, frames, jobs)
+
+
+def write_traces(args: argparse.Namespace) -> None:
+    """Write the active trace to the --trace/--chrome-trace paths and stop tracing."""
+    tracer = profiling.disable()
+    if tracer is None:
+        return
+    if args.trace:
+        tracer.write_json(args.trace)
+        print(f"  ✓ Trace written to {args.trace}")
+    if args.chrome_trace:
+        tracer.write_chrome_trace(args.chrome_trace)
+        print(f"  ✓ Chrome trace written to {args.chrome_trace}")
+    print("\nSlowest spans:")
+    print(tracer.summary())
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Main function to validate, export and/or render. Handles errors gracefully."""
+    args = parse_args(argv)
+    startup = time.perf_counter() - _STARTED
+    try:
+        if args.trace or args.chrome_trace:
+            profiling.enable()
+            close_connections()  # pooled connections opened untraced are reopened traced
+        with profiling.profile(args.profile), span(args.command, "command"):
+            run_command(args)
+
+        if args.timings:
+            if _connections is not None and _connections.timings:
+                print("\nQuery timings:")
+                print(_connections.timing_report())
+            print(f"\nStartup {startup * 1000:.0f} ms, total {time.perf_counter() - _STARTED:.2f}s")
+
+        done = {
+            "validate": "✅ Database, view data and order rows are valid",
+            "export": "✅ Successfully exported CSVs to web/src/data",
+            "render": "✅ Successfully rendered all charts to web/src/assets",
+            "all": "✅ Successfully exported all charts to web/src/assets and CSVs to web/src/data",
+        }
+        print(f"\n{done[args.command]}")
     except FileNotFoundError as e:
         print(f"\n❌ Error: {e}", file=sys.stderr)
         sys.exit(1)
@@ -479,6 +1095,11 @@ def main() -> None:
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        write_traces(args)
+        if args.profile:
+            print(f"  ✓ cProfile stats written to {args.profile}")
+        close_connections()
 
 
 if __name__ == "__main__":
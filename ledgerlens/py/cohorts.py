@@ -0,0 +1,273 @@
+"""Monthly cohort retention from a per-customer first-month index.
+
+A customer's cohort is the month of their first order. Period N counts the
+cohort's customers who ordered again N months later. Computing that in SQL
+means joining orders to itself to find each customer's first month. Here
+three tables in the main database hold the state instead:
+
+- cohort_customer: first_month per customer_id (the first-month index);
+- cohort_customer_month: the distinct (customer_id, order_month) pairs seen;
+- cohort_activity: active customers per (cohort, period).
+
+refresh_cohorts() reads only orders rows past its etl_state watermark, like
+the other incremental summaries. It inserts their pairs, keeping the ones
+that are new, and folds those into cohort_activity in one vectorized pandas
+pass: a first-month lookup, a month difference and a group count. When late
+rows move a customer's first month earlier, that customer's older pairs are
+taken out of the old cohort and counted again under the new one.
+
+retention() only reads: it uses cohort_activity while that is current and
+otherwise computes the counts in memory from the distinct (customer, month)
+pairs of orders, so exports never write. refresh_cohorts() (or the CLI here)
+brings the tables up to date.
+
+PAIRS_SQL uses INSERT ... RETURNING, which needs SQLite 3.35 or newer.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from connections import open_readonly
+from etl_state import decide_mode, record_watermark
+from profiling import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+
+STATE = "cohort_orders"  # etl_state prefix: cohort_orders_rowid, cohort_orders_generation
+
+COHORT_DDL = """
+DROP TABLE IF EXISTS cohort_customer;
+CREATE TABLE cohort_customer(
+  customer_id TEXT PRIMARY KEY,
+  first_month TEXT NOT NULL
+) WITHOUT ROWID;
+DROP TABLE IF EXISTS cohort_customer_month;
+CREATE TABLE cohort_customer_month(
+  customer_id TEXT,
+  order_month TEXT,
+  PRIMARY KEY (customer_id, order_month)
+) WITHOUT ROWID;
+DROP TABLE IF EXISTS cohort_activity;
+CREATE TABLE cohort_activity(
+  cohort TEXT,
+  period INTEGER,
+  customers INTEGER NOT NULL,
+  PRIMARY KEY (cohort, period)
+) WITHOUT ROWID;
+"""
+
+# RETURNING (SQLite >= 3.35) yields only the pairs not already in cohort_customer_month
+PAIRS_SQL = """
+INSERT OR IGNORE INTO cohort_customer_month(customer_id, order_month)
+SELECT DISTINCT customer_id, order_month FROM orders
+WHERE rowid > ? AND rowid <= ? AND customer_id IS NOT NULL AND order_month IS NOT NULL
+RETURNING customer_id, order_month
+"""
+
+
+def month_index(months: pd.Series) -> pd.Series:
+    """YYYY-MM strings as months since year 0, so periods are plain differences."""
+    return months.str[:4].astype(int) * 12 + months.str[5:7].astype(int) - 1
+
+
+def month_label(index: pd.Series) -> pd.Series:
+    """Inverse of month_index()."""
+    return (index // 12).astype(str).str.zfill(4) + "-" + (index % 12 + 1).astype(str).str.zfill(2)
+
+
+def activity_counts(pairs: pd.DataFrame, first: pd.Series) -> pd.DataFrame:
+    """Customers per (cohort, period) for (customer_id, order_month) pairs, given first month indexes by customer."""
+    cohort = pairs["customer_id"].map(first)
+    period = month_index(pairs["order_month"]) - cohort
+    counts = pd.DataFrame({"cohort": cohort, "period": period}).value_counts().rename("customers").reset_index()
+    counts["cohort"] = month_label(counts["cohort"])
+    return counts
+
+
+def _customers_table(con: sqlite3.Connection, customers: pd.Index) -> None:
+    """Load customers into temp.cohort_delta so lookups can join on them."""
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS cohort_delta(customer_id TEXT PRIMARY KEY)")
+    con.execute("DELETE FROM temp.cohort_delta")
+    con.executemany("INSERT INTO temp.cohort_delta(customer_id) VALUES (?)", ((c,) for c in customers))
+
+
+def _fold(con: sqlite3.Connection, new_pairs: pd.DataFrame) -> int:
+    """Fold newly seen pairs into cohort_customer and cohort_activity. Returns customers whose cohort moved."""
+    months = month_index(new_pairs["order_month"])
+    earliest = months.groupby(new_pairs["customer_id"]).min()
+    _customers_table(con, earliest.index)
+    old = pd.read_sql_query(
+        "SELECT customer_id, first_month FROM cohort_customer JOIN temp.cohort_delta USING (customer_id)", con
+    ).set_index("customer_id")["first_month"]
+    old = month_index(old) if len(old) else pd.Series(dtype="int64")
+    first = earliest.copy()
+    known = first.index.intersection(old.index)
+    first[known] = first[known].where(first[known] < old[known], old[known])
+
+    # Late rows gave these customers an earlier first month: recount their history
+    moved = known[(first[known] < old[known]).to_numpy()]
+    history = pd.DataFrame(columns=["customer_id", "order_month"])
+    if len(moved):
+        _customers_table(con, moved)
+        history = pd.read_sql_query(
+            "SELECT customer_id, order_month FROM cohort_customer_month JOIN temp.cohort_delta USING (customer_id)",
+            con,
+        )
+        history = history.merge(new_pairs, how="left", indicator=True)
+        history = history[history["_merge"] == "left_only"].drop(columns="_merge")
+
+    removed = activity_counts(history, old) if len(history) else None
+    added = activity_counts(pd.concat([new_pairs, history], ignore_index=True), first)
+    if removed is not None:
+        removed["customers"] = -removed["customers"]
+        added = pd.concat([added, removed]).groupby(["cohort", "period"], as_index=False)["customers"].sum()
+
+    con.executemany(
+        "INSERT INTO cohort_activity(cohort, period, customers) VALUES (?, ?, ?) "
+        "ON CONFLICT(cohort, period) DO UPDATE SET customers = customers + excluded.customers",
+        added[["cohort", "period", "customers"]].astype(object).itertuples(index=False, name=None),
+    )
+    con.execute("DELETE FROM cohort_activity WHERE customers = 0")
+    changed = first[~first.index.isin(old.index) | first.index.isin(moved)]
+    con.executemany(
+        "INSERT OR REPLACE INTO cohort_customer(customer_id, first_month) VALUES (?, ?)",
+        zip(changed.index, month_label(changed)),
+    )
+    return len(moved)
+
+
+def refresh_cohorts(db: str = DB, full: bool = False) -> Dict[str, object]:
+    """Fold orders rows past the watermark into the cohort tables. Returns mode, rows, pairs, moved and seconds."""
+    if not Path(db).exists():
+        raise FileNotFoundError(f"Database not found: {db}. Please run SQL setup scripts first.")
+
+    start = time.perf_counter()
+    con = connect(db, isolation_level=None)
+    try:
+        if not con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='orders'").fetchone():
+            raise ValueError("Table 'orders' not found. Please run sql/10_load_clean.sql first.")
+        mode, lo, max_rowid = decide_mode(con, STATE, tables=("cohort_activity",), full=full)
+        if mode == "fresh":
+            return {"mode": "fresh", "rows": 0, "pairs": 0, "moved": 0, "seconds": time.perf_counter() - start}
+        # executescript() commits any open transaction first, but a BEGIN inside the
+        # script stays open, so a full rebuild's DDL rolls back with the rest
+        if mode == "full":
+            con.executescript("BEGIN IMMEDIATE;" + COHORT_DDL)
+        else:
+            con.execute("BEGIN IMMEDIATE")
+        try:
+            new_pairs = pd.DataFrame(
+                con.execute(PAIRS_SQL, (lo, max_rowid)).fetchall(), columns=["customer_id", "order_month"]
+            )
+            moved = _fold(con, new_pairs) if len(new_pairs) else 0
+            record_watermark(con, STATE, max_rowid)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        rows = con.execute(
+            "SELECT COUNT(*) FROM orders WHERE rowid > ? AND rowid <= ?", (lo, max_rowid)
+        ).fetchone()[0]
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Cohort refresh failed: {e}") from e
+    finally:
+        con.close()
+
+    return {
+        "mode": mode,
+        "rows": rows,
+        "pairs": len(new_pairs),
+        "moved": moved,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _activity(con: sqlite3.Connection) -> pd.DataFrame:
+    """cohort, period, customers rows: from cohort_activity when it is current, else computed from orders."""
+    if decide_mode(con, STATE, tables=("cohort_activity",)).mode == "fresh":
+        return pd.read_sql_query("SELECT cohort, period, customers FROM cohort_activity", con)
+    pairs = pd.read_sql_query(
+        "SELECT DISTINCT customer_id, order_month FROM orders "
+        "WHERE customer_id IS NOT NULL AND order_month IS NOT NULL",
+        con,
+    )
+    if pairs.empty:
+        return pd.DataFrame(columns=["cohort", "period", "customers"])
+    first = month_index(pairs["order_month"]).groupby(pairs["customer_id"]).min()
+    return activity_counts(pairs, first)
+
+
+def cohort_counts(db: str = DB, con: Optional[sqlite3.Connection] = None) -> pd.DataFrame:
+    """Active customers as a cohort × period matrix (rows: cohort month, columns: months since first order).
+
+    Nothing is written. Queries run on con when given, otherwise on a
+    read-only connection to db.
+    """
+    own = con is None
+    try:
+        if own:
+            con = open_readonly(db)
+        activity = _activity(con)
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        raise RuntimeError(f"Could not read cohort activity: {e}") from e
+    finally:
+        if own and con is not None:
+            con.close()
+    matrix = activity.pivot(index="cohort", columns="period", values="customers")
+    return matrix.reindex(columns=range(int(activity["period"].max()) + 1 if len(activity) else 0)).sort_index()
+
+
+def retention(db: str = DB, con: Optional[sqlite3.Connection] = None) -> pd.DataFrame:
+    """Return one row per cohort, without writing to the database.
+
+    Columns: cohort, customers (cohort size) and m0..mN, the share of the
+    cohort active N months after its first month. Periods that have not
+    happened yet for a cohort are empty.
+    """
+    counts = cohort_counts(db, con)
+    if counts.empty:
+        return pd.DataFrame(columns=["cohort", "customers", "m0"])
+    size = counts[0]
+    rates = counts.div(size, axis=0)
+    # Later periods with no active customers are 0; periods past the last loaded month stay empty
+    starts = month_index(pd.Series(counts.index, index=counts.index))
+    active = counts.stack().dropna()  # (cohort, period) pairs with active customers
+    last = (starts[active.index.get_level_values(0)].to_numpy() + active.index.get_level_values(1)).max()
+    horizon = last - starts
+    for period in rates.columns:
+        rates[period] = rates[period].where(period > horizon, rates[period].fillna(0))
+    rates.columns = [f"m{period}" for period in rates.columns]
+    rates.insert(0, "customers", size.astype("int64"))
+    return rates.rename_axis("cohort").reset_index()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Refresh the cohort tables and print monthly retention.")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("--full", action="store_true", help="rebuild the cohort tables from all of orders")
+    parser.add_argument("--periods", type=int, default=6, help="months since first order to print")
+    args = parser.parse_args(argv)
+
+    try:
+        result = refresh_cohorts(args.db, full=args.full)
+        print(
+            f"  ✓ cohorts {result['mode']} refresh: {result['rows']:,} order rows, {result['pairs']:,} new "
+            f"customer-months, {result['moved']:,} customers moved cohort in {result['seconds']:.3f}s"
+        )
+        df = retention(args.db)
+        columns = ["cohort", "customers"] + [c for c in df.columns if c.startswith("m")][: args.periods]
+        print(df[columns].to_string(index=False, float_format=lambda x: f"{x:.0%}"))
+    except (FileNotFoundError, ValueError, RuntimeError) as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Typed columnar (Arrow IPC / Parquet) copies of the dashboard exports.
+
+The CSVs lose their types: dates become strings, nullable counts become
+floats, and every number must be parsed from text again. export_columnar()
+writes the same DataFrames as Arrow IPC or Parquet files with explicit column
+types, plus columnar_manifest.json describing each file's schema and row count.
+
+pyarrow is an optional dependency; it is only imported when a columnar
+export is requested.
+"""
+import json
+from pathlib import Path
+from typing import Dict, Optional
+
+import pandas as pd
+
+from render_cache import RenderCache, frame_fingerprint
+
+FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+MANIFEST_NAME = "columnar_manifest.json"
+
+DATE_COLUMNS = {"month_start", "first_order_date", "last_order_date"}
+# Integer columns that are NULL for the first month and so arrive as floats
+NULLABLE_INT_COLUMNS = {"buyers_prev"}
+CATEGORY_COLUMNS = {"abc_class"}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise RuntimeError("Columnar export requires pyarrow. Install it with: pip install pyarrow") from e
+    return pa
+
+
+def to_arrow_table(df: pd.DataFrame):
+    """Convert an export DataFrame to a pyarrow Table with explicit column types."""
+    pa = _require_pyarrow()
+    typed = df.copy()
+    for col in typed.columns:
+        if col in DATE_COLUMNS:
+            typed[col] = pd.to_datetime(typed[col], errors="coerce").dt.date
+        elif col in NULLABLE_INT_COLUMNS:
+            typed[col] = typed[col].astype("Int64")
+        elif col in CATEGORY_COLUMNS:
+            typed[col] = typed[col].astype("category")
+    table = pa.Table.from_pandas(typed, preserve_index=False)
+    # Drop the pandas metadata blob; readers only need the Arrow schema
+    return table.replace_schema_metadata(None)
+
+
+def export_columnar(
+    frames: Dict[str, pd.DataFrame],
+    out_dir: Path,
+    fmt: str = "arrow",
+    cache: Optional[RenderCache] = None,
+) -> Dict[str, Dict[str, object]]:
+    """Write each frame as <name>.arrow or <name>.parquet and update the manifest.
+
+    Returns the manifest entries: file, format, rows, bytes and a
+    column-name-to-type schema for every dataset.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown columnar format '{fmt}', expected one of {sorted(FORMATS)}")
+    _require_pyarrow()
+    out_dir = Path(out_dir)
+
+    manifest_path = out_dir / MANIFEST_NAME
+    manifest: Dict[str, Dict[str, object]] = {}
+    if manifest_path.exists():
+        try:
+            manifest = json.loads(manifest_path.read_text())
+        except ValueError:
+            manifest = {}
+
+    for name, df in frames.items():
+        filename = f"{name}{FORMATS[fmt]}"
+        path = out_dir / filename
+        fingerprint = frame_fingerprint(df, fmt)
+        table = to_arrow_table(df)
+        if cache is None or not cache.is_fresh(filename, fingerprint):
+            if fmt == "parquet":
+                import pyarrow.parquet as pq
+                pq.write_table(table, path, compression="zstd")
+            else:
+                import pyarrow.feather as feather
+                feather.write_feather(table, path, compression="zstd")
+            if cache is not None:
+                cache.record(filename, fingerprint)
+        manifest[name] = {
+            "file": filename,
+            "format": fmt,
+            "rows": table.num_rows,
+            "bytes": path.stat().st_size,
+            "schema": {field.name: str(field.type) for field in table.schema},
+        }
+
+    manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
@@ -0,0 +1,123 @@
+"""Shared read-only SQLite connections for the export layer.
+
+charts.py used to open a new connection for every query, paying for
+connection setup, schema parsing and a cold page cache each time.
+ConnectionManager opens the database once in read-only URI mode with
+memory-mapped I/O and a larger page cache, hands out that connection (or
+one of a small pool, for threads running queries in parallel), and records
+how long every query took.
+"""
+from __future__ import annotations
+
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Deque, Dict, Iterator, List, Optional, Sequence, Union
+
+from profiling import connect
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Read-path settings: queries never write, so the page cache and mmap window
+# can be sized for scans of the orders table.
+READ_PRAGMAS: Dict[str, Union[int, str]] = {
+    "mmap_size": 268_435_456,  # 256 MiB
+    "cache_size": -65536,  # 64 MiB
+    "temp_store": "MEMORY",
+    "query_only": "ON",
+}
+
+# Query timings kept per manager; a long-running process keeps only the latest
+MAX_TIMINGS = 1000
+
+
+def open_readonly(db: str, pragmas: Optional[Dict[str, Union[int, str]]] = None) -> sqlite3.Connection:
+    """Open db read-only (it must already exist) and apply the read PRAGMAs."""
+    path = Path(db).resolve()
+    if not path.exists():
+        raise FileNotFoundError(f"Database not found: {db}. Please run SQL setup scripts first.")
+    # check_same_thread=False lets a pooled connection move between threads;
+    # the pool guarantees only one thread uses it at a time.
+    con = connect(f"{path.as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    for name, value in (READ_PRAGMAS if pragmas is None else pragmas).items():
+        con.execute(f"PRAGMA {name}={value}")
+    return con
+
+
+class ConnectionManager:
+    """A pool of pool_size read-only connections to one database, with the last MAX_TIMINGS query timings."""
+
+    def __init__(
+        self,
+        db: str,
+        pool_size: int = 1,
+        pragmas: Optional[Dict[str, Union[int, str]]] = None,
+    ) -> None:
+        if pool_size <= 0:
+            raise ValueError(f"pool_size must be positive, got {pool_size}")
+        self.db = db
+        self.pool_size = pool_size
+        self.pragmas = pragmas
+        self.timings: Deque[Dict[str, object]] = deque(maxlen=MAX_TIMINGS)
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._opened: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection, opening one lazily while the pool is below pool_size."""
+        con = None
+        with self._lock:
+            try:
+                con = self._pool.get_nowait()
+            except queue.Empty:
+                if len(self._opened) < self.pool_size:
+                    con = open_readonly(self.db, self.pragmas)
+                    self._opened.append(con)
+        if con is None:
+            con = self._pool.get()
+        try:
+            yield con
+        finally:
+            self._pool.put(con)
+
+    def query(self, sql: str, params: Optional[Sequence[object]] = None, label: Optional[str] = None) -> pd.DataFrame:
+        """Run a query on a pooled connection and record its timing."""
+        import pandas as pd
+
+        start = time.perf_counter()
+        with self.connection() as con:
+            df = pd.read_sql_query(sql, con, params=params)
+        self.timings.append({
+            "query": label or " ".join(sql.split()),
+            "seconds": time.perf_counter() - start,
+            "rows": len(df),
+        })
+        return df
+
+    def timing_report(self) -> str:
+        """One line per query, slowest first."""
+        lines = [
+            f"{t['seconds'] * 1000:8.1f} ms  {t['rows']:>7,} rows  {t['query']}"
+            for t in sorted(self.timings, key=lambda t: t["seconds"], reverse=True)
+        ]
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        """Close every connection the manager opened."""
+        with self._lock:
+            for con in self._opened:
+                con.close()
+            self._opened.clear()
+            self._pool = queue.Queue()
+
+    def __enter__(self) -> "ConnectionManager":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
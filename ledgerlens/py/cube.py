@@ -0,0 +1,380 @@
+"""Day × country × export-flag cube of orders, queried by prefix sums.
+
+refresh_cube() aggregates orders into a dense array with one cell per
+order_date, country and is_export value. Each cell holds revenue,
+gross_profit, units and orders. The array is saved as order_cube.npz next to
+the database, together with its running sum along the day axis. The sum over
+any date range is then prefix[end + 1] - prefix[start], so a query costs the
+same for a day or for two years, and it never touches orders.
+
+As in the other incremental summaries, only orders rows past the cube's
+etl_state watermark are read. New days and countries widen the array.
+`orders` is the number of distinct invoices in each cell. The cube_invoice key
+set (like the mv_*_invoice tables of sql/30_materialized.sql) makes sure an
+invoice already counted in a cell is not counted again. Summing cells
+matches COUNT(DISTINCT invoice_no) over a range as long as no invoice spans
+two days or countries. That holds for the raw feed, which has one timestamp
+and one country per invoice.
+
+load_cube() returns an OrderCube whose totals(), by_country() and
+by_period() methods are the query API for the exporters.
+
+INVOICE_SQL uses INSERT ... RETURNING, which needs SQLite 3.35 or newer.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from etl_state import ORDERS_GENERATION, STATE_DDL, decide_mode, get_state, record_watermark
+from profiling import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+
+STATE = "cube_orders"  # etl_state prefix: cube_orders_rowid, cube_orders_generation
+
+MEASURES = ("revenue", "gross_profit", "units", "orders")
+COUNT_MEASURES = ("units", "orders")
+
+INVOICE_DDL = """
+CREATE TABLE IF NOT EXISTS cube_invoice(
+  invoice_no TEXT,
+  day TEXT,
+  country TEXT,
+  is_export INTEGER,
+  PRIMARY KEY (day, country, is_export, invoice_no)
+) WITHOUT ROWID
+"""
+
+DELTA_SQL = """
+SELECT
+  substr(order_date, 1, 10) AS day,
+  COALESCE(country, 'Unknown') AS country,
+  COALESCE(is_export, 0) AS is_export,
+  SUM(gross_revenue) AS revenue,
+  SUM(gross_profit) AS gross_profit,
+  SUM(qty) AS units
+FROM orders
+WHERE rowid > ? AND rowid <= ? AND order_date IS NOT NULL
+GROUP BY 1, 2, 3
+"""
+
+# RETURNING (SQLite >= 3.35) yields only the (cell, invoice) keys that were not already counted
+INVOICE_SQL = """
+INSERT OR IGNORE INTO cube_invoice(invoice_no, day, country, is_export)
+SELECT DISTINCT
+  invoice_no,
+  substr(order_date, 1, 10),
+  COALESCE(country, 'Unknown'),
+  COALESCE(is_export, 0)
+FROM orders
+WHERE rowid > ? AND rowid <= ? AND invoice_no IS NOT NULL AND order_date IS NOT NULL
+RETURNING day, country, is_export
+"""
+
+
+def cube_path(db: str) -> Path:
+    """Default location of db's cube: order_cube.npz next to it."""
+    return Path(db).resolve().parent / "order_cube.npz"
+
+
+def _parse_day(value: Union[str, np.datetime64], end: bool = False) -> np.datetime64:
+    """A YYYY-MM-DD day, or the first (last, with end=True) day of a YYYY-MM month."""
+    try:
+        if isinstance(value, str) and len(value) == 7:
+            month = np.datetime64(value, "M")
+            return (month + 1).astype("datetime64[D]") - 1 if end else month.astype("datetime64[D]")
+        return np.datetime64(value, "D")
+    except ValueError as e:
+        raise ValueError(f"Dates must be YYYY-MM or YYYY-MM-DD, got {value!r}") from e
+
+
+class OrderCube:
+    """Daily cells of the order measures and their prefix sums along the day axis."""
+
+    def __init__(
+        self,
+        days: np.ndarray,
+        countries: np.ndarray,
+        cells: np.ndarray,
+        watermark: int = 0,
+        generation: Optional[int] = None,
+    ) -> None:
+        self.days = days.astype("datetime64[D]")
+        self.countries = countries.astype(str)
+        self.cells = cells
+        # prefix[i] is the sum of the cells of days[:i]
+        self.prefix = np.zeros((len(days) + 1,) + cells.shape[1:])
+        np.cumsum(cells, axis=0, out=self.prefix[1:])
+        self.watermark = watermark
+        self.generation = generation
+        self._country_index = {country: i for i, country in enumerate(self.countries)}
+
+    @classmethod
+    def empty(cls) -> "OrderCube":
+        return cls(np.array([], dtype="datetime64[D]"), np.array([], dtype=str), np.zeros((0, 0, 2, len(MEASURES))))
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.cells.shape
+
+    def _day_slice(self, start: Optional[str], end: Optional[str]) -> Tuple[int, int]:
+        """Prefix indexes [i, j) of the days in [start, end], by date arithmetic."""
+        n = len(self.days)
+        if n == 0:
+            return 0, 0
+        first = self.days[0]
+        i = 0 if start is None else int((_parse_day(start) - first).astype(int))
+        j = n if end is None else int((_parse_day(end, end=True) - first).astype(int)) + 1
+        if start is not None and end is not None and j <= i:
+            raise ValueError(f"start {start} is after end {end}")
+        return min(max(i, 0), n), min(max(j, 0), n)
+
+    def _country_positions(self, country: Union[None, str, Iterable[str]]) -> np.ndarray:
+        if country is None:
+            return np.arange(len(self.countries))
+        names = [country] if isinstance(country, str) else list(country)
+        return np.array([self._country_index[c] for c in names if c in self._country_index], dtype=int)
+
+    @staticmethod
+    def _export_positions(is_export: Optional[bool]) -> List[int]:
+        return [0, 1] if is_export is None else [int(bool(is_export))]
+
+    def _as_record(self, values: np.ndarray) -> Dict[str, float]:
+        return {
+            name: int(round(value)) if name in COUNT_MEASURES else float(value)
+            for name, value in zip(MEASURES, values)
+        }
+
+    def totals(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        country: Union[None, str, Iterable[str]] = None,
+        is_export: Optional[bool] = None,
+    ) -> Dict[str, float]:
+        """Revenue, gross profit, units and orders for [start, end], optionally one country set and export flag.
+
+        start and end are inclusive YYYY-MM-DD days or YYYY-MM months.
+        The cost does not depend on the length of the range.
+        """
+        i, j = self._day_slice(start, end)
+        window = self.prefix[j] - self.prefix[i]
+        window = window[np.ix_(self._country_positions(country), self._export_positions(is_export))]
+        return self._as_record(window.sum(axis=(0, 1)))
+
+    def by_country(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        is_export: Optional[bool] = None,
+    ) -> pd.DataFrame:
+        """One row per country with activity in [start, end], by revenue descending."""
+        i, j = self._day_slice(start, end)
+        window = (self.prefix[j] - self.prefix[i])[:, self._export_positions(is_export)].sum(axis=1)
+        df = pd.DataFrame(window, columns=list(MEASURES))
+        df.insert(0, "country", self.countries)
+        df = df[(window != 0).any(axis=1)]
+        for name in COUNT_MEASURES:
+            df[name] = df[name].round().astype("int64")
+        return df.sort_values("revenue", ascending=False).reset_index(drop=True)
+
+    def by_period(
+        self,
+        freq: str = "W",
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        country: Union[None, str, Iterable[str]] = None,
+        is_export: Optional[bool] = None,
+    ) -> pd.DataFrame:
+        """Totals per pandas period (e.g. "D", "W", "M", "Q") within [start, end]."""
+        i, j = self._day_slice(start, end)
+        columns = ["period", "period_start", *MEASURES]
+        if j <= i:
+            return pd.DataFrame(columns=columns)
+        prefix = self.prefix[:, self._country_positions(country)][:, :, self._export_positions(is_export)].sum(axis=(1, 2))
+        periods = pd.PeriodIndex(self.days[i:j], freq=freq)
+        # Each period is a run of consecutive days: difference the prefix at run boundaries
+        starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+        bounds = np.r_[starts, j - i] + i
+        sums = prefix[bounds[1:]] - prefix[bounds[:-1]]
+        df = pd.DataFrame(sums, columns=list(MEASURES))
+        df.insert(0, "period", periods[starts].astype(str))
+        df.insert(1, "period_start", self.days[bounds[:-1]].astype(str))
+        for name in COUNT_MEASURES:
+            df[name] = df[name].round().astype("int64")
+        return df
+
+    def widen(self, days: np.ndarray, countries: np.ndarray) -> "OrderCube":
+        """A copy covering the union of this cube's days and countries with `days` and `countries`."""
+        all_days = np.concatenate([self.days, days.astype("datetime64[D]")])
+        if not len(all_days):
+            return self
+        first, last = all_days.min(), all_days.max()
+        new_days = np.arange(first, last + 1, dtype="datetime64[D]")
+        new_countries = np.union1d(self.countries, countries.astype(str))
+        cells = np.zeros((len(new_days), len(new_countries), 2, len(MEASURES)))
+        if self.cells.size:
+            offset = int((self.days[0] - first).astype(int))
+            rows = np.searchsorted(new_countries, self.countries)
+            cells[offset:offset + len(self.days), rows] = self.cells
+        return OrderCube(new_days, new_countries, cells, self.watermark, self.generation)
+
+    def add(self, days: np.ndarray, countries: np.ndarray, is_export: np.ndarray, values: np.ndarray) -> "OrderCube":
+        """Fold per-cell measure deltas (one row per cell, columns in MEASURES order) into a widened copy."""
+        cube = self.widen(np.asarray(days, dtype="datetime64[D]"), np.asarray(countries, dtype=str))
+        if len(values):
+            day_pos = (np.asarray(days, dtype="datetime64[D]") - cube.days[0]).astype(int)
+            country_pos = np.searchsorted(cube.countries, np.asarray(countries, dtype=str))
+            np.add.at(cube.cells, (day_pos, country_pos, np.asarray(is_export, dtype=int)), values)
+            cube = OrderCube(cube.days, cube.countries, cube.cells, cube.watermark, cube.generation)
+        return cube
+
+    def save(self, path: Union[str, Path]) -> Path:
+        """Write the cube to path atomically (npz: days, countries, cells, prefix, watermark, generation)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as fh:
+            np.savez(
+                fh,
+                days=self.days,
+                countries=self.countries,
+                measures=np.array(MEASURES),
+                cells=self.cells,
+                prefix=self.prefix,
+                watermark=np.int64(self.watermark),
+                generation=np.int64(-1 if self.generation is None else self.generation),
+            )
+        os.replace(tmp, path)
+        return path
+
+
+def load_cube(path: Union[str, Path, None] = None, db: str = DB) -> OrderCube:
+    """Read a saved cube (by default the one next to db)."""
+    path = Path(path) if path is not None else cube_path(db)
+    if not path.exists():
+        raise FileNotFoundError(f"Order cube not found: {path}. Run cube.py (or python charts.py export --cube) first.")
+    with np.load(path, allow_pickle=False) as data:
+        if tuple(data["measures"]) != MEASURES:
+            raise ValueError(f"{path} holds measures {tuple(data['measures'])}, expected {MEASURES}")
+        generation = int(data["generation"])
+        return OrderCube(
+            data["days"],
+            data["countries"],
+            data["cells"],
+            int(data["watermark"]),
+            None if generation < 0 else generation,
+        )
+
+
+def refresh_cube(db: str = DB, path: Union[str, Path, None] = None, full: bool = False) -> Dict[str, object]:
+    """Fold orders rows past the watermark into the cube and save it. Returns mode, rows, shape and seconds.
+
+    A full rebuild happens on the first run, after orders was rebuilt, or
+    when the saved file is missing or does not match the stored watermark.
+    """
+    if not Path(db).exists():
+        raise FileNotFoundError(f"Database not found: {db}. Please run SQL setup scripts first.")
+    path = Path(path) if path is not None else cube_path(db)
+
+    start = time.perf_counter()
+    con = connect(db, isolation_level=None)
+    try:
+        if not con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='orders'").fetchone():
+            raise ValueError("Table 'orders' not found. Please run sql/10_load_clean.sql first.")
+        con.execute(STATE_DDL)
+        watermark = get_state(con, f"{STATE}_rowid")
+        generation = get_state(con, ORDERS_GENERATION)
+        cube = None
+        if path.exists() and watermark is not None:
+            try:
+                cube = load_cube(path)
+            except (OSError, KeyError, ValueError):
+                cube = None
+        # The file must be the one the watermark describes
+        stale_file = cube is None or cube.watermark != watermark or cube.generation != generation
+        mode, lo, max_rowid = decide_mode(con, STATE, full=full or stale_file)
+        if mode == "fresh":
+            return {"mode": "fresh", "rows": 0, "shape": cube.shape, "seconds": time.perf_counter() - start}
+        if mode == "full":
+            cube = OrderCube.empty()
+
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if mode == "full":
+                con.execute("DROP TABLE IF EXISTS cube_invoice")
+            con.execute(INVOICE_DDL)
+            rows = con.execute(
+                "SELECT COUNT(*) FROM orders WHERE rowid > ? AND rowid <= ?", (lo, max_rowid)
+            ).fetchone()[0]
+            sums = pd.read_sql_query(DELTA_SQL, con, params=(lo, max_rowid))
+            invoices = pd.DataFrame(
+                con.execute(INVOICE_SQL, (lo, max_rowid)).fetchall(), columns=["day", "country", "is_export"]
+            )
+            new_orders = invoices.groupby(["day", "country", "is_export"]).size().rename("orders").reset_index()
+            delta = sums.merge(new_orders, on=["day", "country", "is_export"], how="outer").fillna(0)
+            cube = cube.add(
+                delta["day"].to_numpy(dtype="datetime64[D]"),
+                delta["country"].to_numpy(dtype=str),
+                delta["is_export"].to_numpy(dtype=int),
+                delta[list(MEASURES)].to_numpy(dtype=float),
+            )
+            cube.watermark, cube.generation = max_rowid, generation
+            cube.save(path)
+            record_watermark(con, STATE, max_rowid)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Cube refresh failed: {e}") from e
+    finally:
+        con.close()
+
+    return {"mode": mode, "rows": rows, "shape": cube.shape, "seconds": time.perf_counter() - start}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Refresh and query the day × country × export order cube.")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("--path", type=Path, help="cube file (default: order_cube.npz next to --db)")
+    parser.add_argument("--full", action="store_true", help="rebuild the cube from all of orders")
+    parser.add_argument("--start", help="first date (YYYY-MM or YYYY-MM-DD) to report")
+    parser.add_argument("--end", help="last date (YYYY-MM or YYYY-MM-DD) to report")
+    parser.add_argument("--country", action="append", help="restrict to this country (repeatable)")
+    parser.add_argument("--export", choices=["domestic", "export"], help="restrict to domestic or export orders")
+    parser.add_argument("--by", help="also print totals per pandas period (D, W, M, Q) or 'country'")
+    args = parser.parse_args(argv)
+
+    try:
+        result = refresh_cube(args.db, args.path, full=args.full)
+        days, countries = result["shape"][:2]
+        print(
+            f"  ✓ cube {result['mode']} refresh: {result['rows']:,} order rows "
+            f"({days:,} days × {countries} countries) in {result['seconds']:.2f}s"
+        )
+        cube = load_cube(args.path, args.db)
+        is_export = None if args.export is None else args.export == "export"
+        totals = cube.totals(args.start, args.end, args.country, is_export)
+        print("  ✓ " + ", ".join(f"{name} {value:,.2f}" if isinstance(value, float) else f"{name} {value:,}"
+                                 for name, value in totals.items()))
+        if args.by == "country":
+            print(cube.by_country(args.start, args.end, is_export).head(20).to_string(index=False))
+        elif args.by:
+            print(cube.by_period(args.by, args.start, args.end, args.country, is_export).to_string(index=False))
+    except (FileNotFoundError, ValueError, RuntimeError) as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
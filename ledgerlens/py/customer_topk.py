@@ -0,0 +1,118 @@
+"""Top-K customers by revenue from the materialized customer totals.
+
+v_top_customers filters v_customer_value on revenue_rank <= 50, so every
+export aggregates all customers and ranks them with ROW_NUMBER(). The
+per-customer totals are already folded forward into mv_customer by
+materialize.py, and sql/30_materialized.sql indexes them on revenue. A
+top-N query walks the first N index entries, and only those N rows get the
+derived avg_order_value, active_days and revenue_per_active_month columns.
+
+top_customers() never writes: while the summaries lag behind orders it
+answers from v_top_customers instead, and materialize.py (or the CLI here)
+brings them up to date.
+"""
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+
+from connections import open_readonly
+from materialize import refresh, staleness
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+
+# Largest N a top-N query may ask for; matches v_top_customers
+MAX_TOP_K = 50
+
+# Same columns as v_customer_value, computed for the first :n index entries only
+TOP_SQL = """
+WITH top AS (
+  SELECT
+    customer_id,
+    orders,
+    units,
+    revenue,
+    gross_profit,
+    revenue * 1.0 / lines AS avg_order_value,
+    first_order_date,
+    last_order_date,
+    (julianday(last_order_date) - julianday(first_order_date) + 1) AS active_days
+  FROM mv_customer
+  ORDER BY revenue DESC
+  LIMIT :n
+)
+SELECT
+  customer_id,
+  orders,
+  units,
+  revenue,
+  gross_profit,
+  avg_order_value,
+  first_order_date,
+  last_order_date,
+  active_days,
+  CASE
+    WHEN active_days <= 0 THEN NULL
+    ELSE revenue / (active_days / 30.0)
+  END AS revenue_per_active_month,
+  ROW_NUMBER() OVER (ORDER BY revenue DESC) AS revenue_rank
+FROM top
+ORDER BY revenue DESC
+"""
+
+# Fallback while mv_customer is stale
+VIEW_SQL = "SELECT * FROM v_top_customers WHERE revenue_rank <= :n"
+
+
+def top_customers(
+    db: str = DB,
+    n: int = MAX_TOP_K,
+    max_k: int = MAX_TOP_K,
+    con: Optional[sqlite3.Connection] = None,
+) -> pd.DataFrame:
+    """Return the top n customers by revenue without writing to the database.
+
+    Reads mv_customer through its revenue index when the summaries are
+    current, and v_top_customers when they lag behind orders. Queries run on
+    con when given, otherwise on a read-only connection to db.
+    """
+    if not 1 <= n <= max_k:
+        raise ValueError(f"n must be between 1 and {max_k}, got {n}")
+    own = con is None
+    if own:
+        con = open_readonly(db)
+    try:
+        if staleness(con)["stale"]:
+            return pd.read_sql_query(VIEW_SQL, con, params={"n": n})
+        return pd.read_sql_query(TOP_SQL, con, params={"n": n})
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        raise RuntimeError(f"Database query failed: {e}") from e
+    finally:
+        if own:
+            con.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Refresh the summary tables and print the top customers.")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("-n", type=int, default=10, help=f"number of customers to show (at most {MAX_TOP_K})")
+    parser.add_argument("--full", action="store_true", help="rebuild the summary tables from all of orders")
+    args = parser.parse_args(argv)
+
+    try:
+        result = refresh(args.db, full=args.full)
+        print(f"  ✓ summaries {result['mode']} refresh: {result['rows']:,} order rows in {result['seconds']:.3f}s")
+        df = top_customers(args.db, args.n)
+        print(df[["revenue_rank", "customer_id", "orders", "revenue"]].to_string(index=False))
+    except (FileNotFoundError, ValueError, RuntimeError) as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Watermark bookkeeping shared by the incremental summaries over orders.
+
+Each summary that folds in orders rows keeps two etl_state values under its
+own prefix: <prefix>_rowid, the last orders rowid it has read, and
+<prefix>_generation, the orders generation it was built from.
+sql/10_load_clean.sql bumps orders_generation on every full rebuild of
+orders, so a mismatch means rowids restarted and the summary is rebuilt.
+"""
+import sqlite3
+from typing import Iterable, NamedTuple, Optional
+
+ORDERS_GENERATION = "orders_generation"
+STATE_DDL = "CREATE TABLE IF NOT EXISTS etl_state(name TEXT PRIMARY KEY, value INTEGER)"
+
+
+class Plan(NamedTuple):
+    """What a refresh has to do: mode is "full", "incremental" or "fresh"; read rowids lo < rowid <= hi."""
+
+    mode: str
+    lo: int
+    hi: int
+
+
+def get_state(con: sqlite3.Connection, name: str) -> Optional[int]:
+    row = con.execute("SELECT value FROM etl_state WHERE name=?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def set_state(con: sqlite3.Connection, name: str, value: Optional[int]) -> None:
+    con.execute("INSERT OR REPLACE INTO etl_state(name, value) VALUES (?, ?)", (name, value))
+
+
+def decide_mode(con: sqlite3.Connection, prefix: str, tables: Iterable[str] = (), full: bool = False) -> Plan:
+    """Compare orders with the watermark stored under prefix.
+
+    The plan is "full" when requested (callers fold their own reasons, such
+    as a changed precision or a missing file, into full), when any of tables
+    is missing, when there is no watermark, when orders shrank below it or
+    when orders was rebuilt since. Otherwise it is "fresh" if no rows were
+    appended and "incremental" if some were.
+    """
+    con.execute(STATE_DDL)
+    hi = con.execute("SELECT COALESCE(MAX(rowid), 0) FROM orders").fetchone()[0]
+    watermark = get_state(con, f"{prefix}_rowid")
+    missing = any(
+        not con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+        for table in tables
+    )
+    if (
+        full
+        or missing
+        or watermark is None
+        or hi < watermark
+        or get_state(con, f"{prefix}_generation") != get_state(con, ORDERS_GENERATION)
+    ):
+        return Plan("full", 0, hi)
+    return Plan("fresh" if hi == watermark else "incremental", watermark, hi)
+
+
+def record_watermark(con: sqlite3.Connection, prefix: str, hi: int) -> None:
+    """Record that orders rows up to hi of the current generation are folded in."""
+    set_state(con, f"{prefix}_rowid", hi)
+    set_state(con, f"{prefix}_generation", get_state(con, ORDERS_GENERATION))
@@ -0,0 +1,87 @@
+"""Covering indexes on orders and a query-plan regression check for the views.
+
+ensure_indexes() applies sql/15_indexes.sql. check_query_plans() runs
+EXPLAIN QUERY PLAN for every view in charts.REQUIRED_VIEWS and reports any
+view that reads orders with a full table scan or sorts its groups in a temp
+B-tree, which means a covering index is missing or no longer used.
+"""
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from profiling import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+INDEXES_SQL = ROOT / "sql" / "15_indexes.sql"
+
+
+def ensure_indexes(con: sqlite3.Connection) -> None:
+    """Create any missing covering indexes on orders."""
+    con.executescript(INDEXES_SQL.read_text())
+
+
+def query_plan(con: sqlite3.Connection, sql: str) -> List[str]:
+    """Return the detail lines of EXPLAIN QUERY PLAN for a statement."""
+    return [row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def plan_problems(plan: List[str], table: str = "orders") -> List[str]:
+    """List the plan steps that show a full scan of table or a GROUP BY sort."""
+    problems = []
+    for step in plan:
+        if step.strip() == f"SCAN {table}":
+            problems.append(step.strip())
+        elif "USE TEMP B-TREE FOR GROUP BY" in step:
+            problems.append(step.strip())
+    return problems
+
+
+def check_query_plans(con: sqlite3.Connection, views: Optional[List[str]] = None) -> Dict[str, List[str]]:
+    """Return {view: problems} for every view whose plan regressed (empty when all pass)."""
+    if views is None:
+        from charts import REQUIRED_VIEWS
+        views = REQUIRED_VIEWS
+    failures = {}
+    for view in views:
+        problems = plan_problems(query_plan(con, f"SELECT * FROM {view}"))
+        if problems:
+            failures[view] = problems
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Create covering indexes and check view query plans.")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("--check-only", action="store_true", help="only check plans, do not create indexes")
+    args = parser.parse_args(argv)
+
+    if not Path(args.db).exists():
+        print(f"\n❌ Error: Database not found: {args.db}. Please run SQL setup scripts first.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        with connect(args.db) as con:
+            if not args.check_only:
+                ensure_indexes(con)
+                print("  ✓ Covering indexes in place")
+            failures = check_query_plans(con)
+    except sqlite3.Error as e:
+        print(f"\n❌ Runtime error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    from charts import REQUIRED_VIEWS
+    for view in REQUIRED_VIEWS:
+        if view in failures:
+            print(f"  ✗ {view}: {'; '.join(failures[view])}")
+        else:
+            print(f"  ✓ {view}: index-driven plan")
+    if failures:
+        print(f"\n❌ {len(failures)} view(s) fall back to a table scan or temp B-tree sort", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Stream the raw e-commerce CSV into the orders_raw table.
+
+Replaces the `sqlite-utils insert ... --csv` step: rows are read in fixed-size
+chunks and written with executemany inside a single transaction, so memory
+stays flat regardless of file size.
+"""
+import argparse
+import csv
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from profiling import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+CSV = ROOT / "data_raw" / "ecommerce.csv"
+SCHEMA_SQL = ROOT / "sql" / "00_schema.sql"
+
+RAW_COLUMNS = [
+    "InvoiceNo",
+    "StockCode",
+    "Description",
+    "Quantity",
+    "InvoiceDate",
+    "UnitPrice",
+    "CustomerID",
+    "Country",
+]
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Bulk-load settings for --reset loads and scratch databases, which start
+# over from the CSVs if they fail, so durability is traded for throughput.
+# A crash with the journal in memory can corrupt the whole file.
+BULK_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "cache_size": -65536,  # 64 MiB
+    "temp_store": "MEMORY",
+}
+
+# Appends go into the live database: the journal mode is left as it is
+# (DELETE, or WAL if the database uses it) and commits are synced.
+APPEND_PRAGMAS = {
+    "synchronous": "FULL",
+    "cache_size": -65536,
+    "temp_store": "MEMORY",
+}
+
+
+def apply_pragmas(con: sqlite3.Connection, pragmas: Dict[str, object]) -> None:
+    """Apply PRAGMA settings to a connection."""
+    for name, value in pragmas.items():
+        con.execute(f"PRAGMA {name}={value}")
+
+
+def apply_bulk_pragmas(con: sqlite3.Connection) -> None:
+    """Apply the bulk-load PRAGMAs to a connection."""
+    apply_pragmas(con, BULK_PRAGMAS)
+
+
+def iter_chunks(reader: Iterator[List[str]], chunk_size: int) -> Iterator[List[List[str]]]:
+    """Yield lists of at most chunk_size rows from a CSV reader."""
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    while True:
+        chunk = list(islice(reader, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _column_order(header: List[str]) -> List[int]:
+    """Map RAW_COLUMNS to their positions in the CSV header."""
+    positions = {name.strip(): i for i, name in enumerate(header)}
+    missing = [col for col in RAW_COLUMNS if col not in positions]
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {missing}")
+    return [positions[col] for col in RAW_COLUMNS]
+
+
+def _select_columns(reader, order: List[int], csv_path: Path) -> Iterator[List[str]]:
+    """Yield each data row's RAW_COLUMNS values; blank lines are skipped, short rows are an error."""
+    width = max(order) + 1
+    for row in reader:
+        if not row or not any(value.strip() for value in row):
+            continue
+        if len(row) < width:
+            raise ValueError(
+                f"{csv_path}: line {reader.line_num} has {len(row)} fields, expected at least {width}"
+            )
+        yield [row[i] for i in order]
+
+
+def ingest_csv(
+    csv_path: Path = CSV,
+    db: str = DB,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    encoding: str = "latin-1",
+    reset: bool = False,
+) -> Dict[str, float]:
+    """Append a CSV file to orders_raw. Returns rows, seconds and rows_per_sec.
+
+    Values are stored as text exactly like sqlite-utils does; the column
+    affinities declared in 00_schema.sql handle numeric conversion. Only a
+    reset load uses BULK_PRAGMAS; appends keep the journal on disk.
+    """
+    csv_path = Path(csv_path)
+    if not csv_path.exists():
+        raise FileNotFoundError(f"CSV not found: {csv_path}")
+
+    start = time.perf_counter()
+    rows = 0
+    Path(db).parent.mkdir(parents=True, exist_ok=True)
+    con = connect(db, isolation_level=None)
+    try:
+        apply_pragmas(con, BULK_PRAGMAS if reset else APPEND_PRAGMAS)
+        if reset:
+            con.executescript(SCHEMA_SQL.read_text())
+        exists = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='orders_raw'"
+        ).fetchone()
+        if not exists:
+            raise ValueError("Table 'orders_raw' not found. Please run sql/00_schema.sql first.")
+
+        placeholders = ", ".join("?" for _ in RAW_COLUMNS)
+        insert_sql = f"INSERT INTO orders_raw ({', '.join(RAW_COLUMNS)}) VALUES ({placeholders})"
+
+        with open(csv_path, newline="", encoding=encoding) as fh:
+            reader = csv.reader(fh)
+            try:
+                order = _column_order(next(reader))
+            except StopIteration:
+                raise ValueError(f"CSV is empty: {csv_path}")
+
+            con.execute("BEGIN")
+            try:
+                for chunk in iter_chunks(_select_columns(reader, order, csv_path), chunk_size):
+                    con.executemany(insert_sql, chunk)
+                    rows += len(chunk)
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Ingest failed: {e}") from e
+    finally:
+        con.close()
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds if seconds > 0 else float("inf"),
+    }
+
+
+def benchmark(csv_path: Path = CSV, chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: str = "latin-1") -> Dict[str, Optional[Dict[str, float]]]:
+    """Time the streaming ingest against `sqlite-utils insert` on scratch databases."""
+    results: Dict[str, Optional[Dict[str, float]]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        native_db = str(Path(tmp) / "native.db")
+        results["native"] = ingest_csv(csv_path, native_db, chunk_size, encoding, reset=True)
+
+        results["sqlite_utils"] = None
+        exe = shutil.which("sqlite-utils")
+        if exe:
+            legacy_db = str(Path(tmp) / "legacy.db")
+            with connect(legacy_db) as con:
+                con.executescript(SCHEMA_SQL.read_text())
+            start = time.perf_counter()
+            subprocess.run(
+                [exe, "insert", legacy_db, "orders_raw", str(csv_path), "--csv", "--encoding", encoding],
+                check=True,
+            )
+            seconds = time.perf_counter() - start
+            rows = results["native"]["rows"]
+            results["sqlite_utils"] = {
+                "rows": rows,
+                "seconds": seconds,
+                "rows_per_sec": rows / seconds if seconds > 0 else float("inf"),
+            }
+    return results
+
+
+def _print_stats(label: str, stats: Optional[Dict[str, float]]) -> None:
+    if stats is None:
+        print(f"  - {label}: skipped (not installed)")
+    else:
+        print(f"  ✓ {label}: {stats['rows']:,} rows in {stats['seconds']:.2f}s ({stats['rows_per_sec']:,.0f} rows/sec)")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Stream a raw CSV into orders_raw.")
+    parser.add_argument("csv", nargs="?", default=str(CSV), help="CSV file to load")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per executemany batch")
+    parser.add_argument("--encoding", default="latin-1", help="CSV file encoding")
+    parser.add_argument("--reset", action="store_true", help="recreate orders_raw from sql/00_schema.sql first")
+    parser.add_argument("--benchmark", action="store_true", help="compare against sqlite-utils on scratch databases")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.benchmark:
+            print("Benchmarking ingest...")
+            results = benchmark(Path(args.csv), args.chunk_size, args.encoding)
+            _print_stats("native", results["native"])
+            _print_stats("sqlite-utils", results["sqlite_utils"])
+            if results["sqlite_utils"]:
+                speedup = results["sqlite_utils"]["seconds"] / results["native"]["seconds"]
+                print(f"\n✅ Native ingest is {speedup:.1f}x the sqlite-utils path")
+            return
+
+        print(f"Ingesting {args.csv}...")
+        _print_stats("orders_raw", ingest_csv(Path(args.csv), args.db, args.chunk_size, args.encoding, args.reset))
+    except (FileNotFoundError, ValueError, RuntimeError, subprocess.CalledProcessError) as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Incrementally maintained summary tables behind the *_mat views.
+
+sql/30_materialized.sql creates mv_month, mv_sku, mv_country and mv_customer
+plus the distinct-key sets their COUNT(DISTINCT ...) columns need. Each
+refresh folds only the orders rows appended since the last refresh into those
+tables. When orders was fully rebuilt (its etl_state generation changed) the
+summaries are recreated from scratch instead.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from etl_state import decide_mode, record_watermark
+from profiling import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+MATERIALIZED_SQL = ROOT / "sql" / "30_materialized.sql"
+
+STATE = "mv_orders"  # etl_state prefix: mv_orders_rowid, mv_orders_generation
+
+# Materialized view name for each plain view read by charts.py
+MATERIALIZED_VIEWS = {
+    "v_orders_month": "v_orders_month_mat",
+    "v_sku_abc": "v_sku_abc_mat",
+    "v_country_summary": "v_country_summary_mat",
+    "v_customer_value": "v_customer_value_mat",
+    "v_top_customers": "v_top_customers_mat",
+}
+
+# Every statement folds orders rows with :lo < rowid <= :hi into the summaries.
+DELTA_SQL = [
+    """
+    INSERT INTO mv_month(ym, month_start, orders, buyers, units, revenue, gross_profit, lines, revenue_domestic, revenue_export)
+    SELECT
+      order_month,
+      MIN(order_date),
+      0,
+      0,
+      SUM(qty),
+      SUM(gross_revenue),
+      SUM(gross_profit),
+      COUNT(*),
+      SUM(CASE WHEN is_export = 0 THEN gross_revenue ELSE 0 END),
+      SUM(CASE WHEN is_export = 1 THEN gross_revenue ELSE 0 END)
+    FROM orders
+    WHERE rowid > :lo AND rowid <= :hi
+    GROUP BY order_month
+    ON CONFLICT(ym) DO UPDATE SET
+      month_start = MIN(month_start, excluded.month_start),
+      units = units + excluded.units,
+      revenue = revenue + excluded.revenue,
+      gross_profit = gross_profit + excluded.gross_profit,
+      lines = lines + excluded.lines,
+      revenue_domestic = revenue_domestic + excluded.revenue_domestic,
+      revenue_export = revenue_export + excluded.revenue_export
+    """,
+    """
+    INSERT INTO mv_sku(sku, units, revenue, gross_profit)
+    SELECT sku, SUM(qty), SUM(gross_revenue), SUM(gross_profit)
+    FROM orders
+    WHERE rowid > :lo AND rowid <= :hi
+    GROUP BY sku
+    ON CONFLICT(sku) DO UPDATE SET
+      units = units + excluded.units,
+      revenue = revenue + excluded.revenue,
+      gross_profit = gross_profit + excluded.gross_profit
+    """,
+    """
+    INSERT INTO mv_country(country, orders, buyers, units, revenue, gross_profit, lines)
+    SELECT country, 0, 0, SUM(qty), SUM(gross_revenue), SUM(gross_profit), COUNT(*)
+    FROM orders
+    WHERE rowid > :lo AND rowid <= :hi
+    GROUP BY country
+    ON CONFLICT(country) DO UPDATE SET
+      units = units + excluded.units,
+      revenue = revenue + excluded.revenue,
+      gross_profit = gross_profit + excluded.gross_profit,
+      lines = lines + excluded.lines
+    """,
+    """
+    INSERT INTO mv_customer(customer_id, orders, units, revenue, gross_profit, lines, first_order_date, last_order_date)
+    SELECT customer_id, 0, SUM(qty), SUM(gross_revenue), SUM(gross_profit), COUNT(*), MIN(order_date), MAX(order_date)
+    FROM orders
+    WHERE rowid > :lo AND rowid <= :hi AND customer_id IS NOT NULL
+    GROUP BY customer_id
+    ON CONFLICT(customer_id) DO UPDATE SET
+      units = units + excluded.units,
+      revenue = revenue + excluded.revenue,
+      gross_profit = gross_profit + excluded.gross_profit,
+      lines = lines + excluded.lines,
+      first_order_date = MIN(first_order_date, excluded.first_order_date),
+      last_order_date = MAX(last_order_date, excluded.last_order_date)
+    """,
+    """
+    INSERT OR IGNORE INTO mv_month_invoice(ym, invoice_no)
+    SELECT DISTINCT order_month, invoice_no FROM orders
+    WHERE rowid > :lo AND rowid <= :hi AND invoice_no IS NOT NULL
+    """,
+    """
+    INSERT OR IGNORE INTO mv_month_buyer(ym, customer_id)
+    SELECT DISTINCT order_month, customer_id FROM orders
+    WHERE rowid > :lo AND rowid <= :hi AND customer_id IS NOT NULL
+    """,
+    """
+    INSERT OR IGNORE INTO mv_country_invoice(country, invoice_no)
+    SELECT DISTINCT country, invoice_no FROM orders
+    WHERE rowid > :lo AND rowid <= :hi AND invoice_no IS NOT NULL
+    """,
+    """
+    INSERT OR IGNORE INTO mv_country_buyer(country, customer_id)
+    SELECT DISTINCT country, customer_id FROM orders
+    WHERE rowid > :lo AND rowid <= :hi AND customer_id IS NOT NULL
+    """,
+    """
+    INSERT OR IGNORE INTO mv_customer_invoice(customer_id, invoice_no)
+    SELECT DISTINCT customer_id, invoice_no FROM orders
+    WHERE rowid > :lo AND rowid <= :hi AND customer_id IS NOT NULL AND invoice_no IS NOT NULL
+    """,
+    # Distinct counts are recomputed only for keys touched by the delta
+    """
+    UPDATE mv_month SET
+      orders = (SELECT COUNT(*) FROM mv_month_invoice i WHERE i.ym = mv_month.ym),
+      buyers = (SELECT COUNT(*) FROM mv_month_buyer b WHERE b.ym = mv_month.ym)
+    WHERE ym IN (SELECT order_month FROM orders WHERE rowid > :lo AND rowid <= :hi)
+    """,
+    """
+    UPDATE mv_country SET
+      orders = (SELECT COUNT(*) FROM mv_country_invoice i WHERE i.country = mv_country.country),
+      buyers = (SELECT COUNT(*) FROM mv_country_buyer b WHERE b.country = mv_country.country)
+    WHERE country IN (SELECT country FROM orders WHERE rowid > :lo AND rowid <= :hi)
+    """,
+    """
+    UPDATE mv_customer SET
+      orders = (SELECT COUNT(*) FROM mv_customer_invoice i WHERE i.customer_id = mv_customer.customer_id)
+    WHERE customer_id IN (SELECT customer_id FROM orders WHERE rowid > :lo AND rowid <= :hi)
+    """,
+]
+
+
+def staleness(con: sqlite3.Connection) -> Dict[str, object]:
+    """Describe how far the summaries lag behind orders.
+
+    Returns stale (bool), mode ("fresh", "incremental" or "full") and
+    pending_rows, the number of orders rows not yet folded in.
+    """
+    plan = decide_mode(con, STATE, tables=("mv_month", "mv_sku", "mv_country", "mv_customer"))
+    if plan.mode == "full":
+        return {"stale": True, "mode": "full", "pending_rows": plan.hi, "max_rowid": plan.hi}
+    pending = con.execute("SELECT COUNT(*) FROM orders WHERE rowid > ?", (plan.lo,)).fetchone()[0]
+    return {
+        "stale": pending > 0,
+        "mode": "incremental" if pending else "fresh",
+        "pending_rows": pending,
+        "max_rowid": plan.hi,
+        "watermark": plan.lo,
+    }
+
+
+def refresh(db: str = DB, full: bool = False) -> Dict[str, object]:
+    """Bring the summary tables up to date with orders. Returns mode, rows and seconds."""
+    if not Path(db).exists():
+        raise FileNotFoundError(f"Database not found: {db}. Please run SQL setup scripts first.")
+
+    start = time.perf_counter()
+    con = connect(db, isolation_level=None)
+    try:
+        exists = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='orders'").fetchone()
+        if not exists:
+            raise ValueError("Table 'orders' not found. Please run sql/10_load_clean.sql first.")
+
+        status = staleness(con)
+        mode = "full" if full else status["mode"]
+        if mode == "fresh":
+            return {"mode": mode, "rows": 0, "seconds": time.perf_counter() - start}
+
+        lo = 0 if mode == "full" else status["watermark"]
+        hi = status["max_rowid"]
+
+        # executescript() commits any open transaction first, but a BEGIN inside the
+        # script stays open, so a full rebuild's DROP/CREATE rolls back with the deltas
+        if mode == "full":
+            con.executescript("BEGIN IMMEDIATE;" + MATERIALIZED_SQL.read_text())
+        else:
+            con.execute("BEGIN IMMEDIATE")
+        try:
+            for sql in DELTA_SQL:
+                con.execute(sql, {"lo": lo, "hi": hi})
+            record_watermark(con, STATE, hi)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        rows = con.execute("SELECT COUNT(*) FROM orders WHERE rowid > ? AND rowid <= ?", (lo, hi)).fetchone()[0]
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Materialized refresh failed: {e}") from e
+    finally:
+        con.close()
+
+    return {"mode": mode, "rows": rows, "seconds": time.perf_counter() - start}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Refresh the materialized summary tables.")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("--full", action="store_true", help="recreate the summaries from all of orders")
+    args = parser.parse_args(argv)
+
+    try:
+        result = refresh(args.db, full=args.full)
+        print(f"  ✓ materialized {result['mode']} refresh: {result['rows']:,} order rows in {result['seconds']:.2f}s")
+    except (FileNotFoundError, ValueError, RuntimeError) as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
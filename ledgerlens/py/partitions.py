@@ -0,0 +1,421 @@
+"""Year- or month-partitioned copies of orders, attached on demand.
+
+refresh_partitions() splits the orders table into one SQLite file per year
+(or month) of order_month in a partitions/ directory next to the database,
+each holding an orders table indexed on order_date. Like the other
+incremental summaries it only copies orders rows past its etl_state
+watermark, and the orders_partitions catalog in the main database records
+each file's month range, row count and state. Rows keep their orders rowid,
+so an append that failed before the watermark was recorded is simply redone.
+
+Every partition older than the newest one is closed: it is vacuumed,
+analyzed, hashed and made read-only, and the router attaches it with
+immutable=1 so SQLite skips locking and change detection. A closed file
+only changes if late rows for its period arrive, in which case it is
+reopened, appended to and sealed again with a new hash, so backups and
+caches can key on (key, sha256).
+
+The router (attach_range / query / query_view) reads the catalog, attaches
+only the partitions a date range touches to an in-memory connection and
+exposes their UNION ALL as a temp `orders` view, with the 20_views.sql
+views recreated over it, so v_orders_month and the rest run unchanged over
+just that range.
+
+Costs: the partitions hold a second copy of every orders row. They skip
+15_indexes.sql's covering indexes, which the views cannot use through the
+UNION ALL anyway, so the copy is about the size of the orders table alone.
+The views over partitions aggregate with a full scan and temp B-tree sort of
+the attached rows, so over the whole date range they are slower than the
+indexed views in the main database; charts.py exports from the main
+database when no range is given.
+"""
+import argparse
+import hashlib
+import re
+import sqlite3
+import stat
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from clean import ORDERS_COLUMNS, ORDERS_DDL
+from connections import READ_PRAGMAS
+from etl_state import decide_mode, record_watermark
+from profiling import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+VIEWS_SQL = ROOT / "sql" / "20_views.sql"
+
+STATE = "partitions_orders"  # etl_state prefix: partitions_orders_rowid, partitions_orders_generation
+
+# Characters of order_month ('YYYY-MM') that make up a partition key
+GRAINS = {"year": 4, "month": 7}
+
+# SQLite attaches at most 10 databases per connection by default; past this
+# many partitions the router copies them into a temp table batch by batch.
+MAX_ATTACHED = 8
+
+CATALOG_DDL = """
+CREATE TABLE IF NOT EXISTS orders_partitions(
+  key TEXT PRIMARY KEY,
+  grain TEXT NOT NULL,
+  file TEXT NOT NULL,
+  first_month TEXT,
+  last_month TEXT,
+  rows INTEGER NOT NULL,
+  sealed INTEGER NOT NULL DEFAULT 0,
+  sha256 TEXT
+)
+"""
+
+# The only index a partition needs: _branch() filters partitions a range cuts through on order_date
+PARTITION_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_orders_date ON orders(order_date)"
+
+_DATE = re.compile(r"^\d{4}-\d{2}(-\d{2})?$")
+
+
+def partition_dir(db: str) -> Path:
+    """Default home of db's partition files: a partitions/ directory next to it."""
+    return Path(db).resolve().parent / "partitions"
+
+
+def partition_file(key: str) -> str:
+    return f"orders_{key}.db"
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _set_writable(path: Path, writable: bool) -> None:
+    mode = path.stat().st_mode
+    write_bits = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+    path.chmod(mode | stat.S_IWUSR if writable else mode & ~write_bits)
+
+
+def _append(out_dir: Path, key: str, src: str, lo: int, hi: int) -> int:
+    """Copy orders rows (lo, hi] of src whose order_month starts with key into the key's partition.
+
+    Rows keep their orders rowid, and rows past lo are deleted first, so
+    appending the same range twice leaves one copy. VACUUM can renumber the
+    rows of a sealed partition, but only downwards, so they stay at or below lo.
+    """
+    path = out_dir / partition_file(key)
+    new = not path.exists()
+    if not new:
+        _set_writable(path, True)
+    cols = ", ".join(ORDERS_COLUMNS)
+    # A range on order_month ('~' sorts after every character of 'YYYY-MM') instead of
+    # substr(), so a full build reads each key's rows from idx_orders_month_cover; the
+    # unary + keeps SQLite from scanning the whole rowid range for every key instead.
+    # An incremental append lets it walk the (short) rowid range of the delta.
+    where = "order_month >= ? AND order_month < ? AND "
+    where += "rowid > ? AND rowid <= ?" if lo > 0 else "+rowid > ? AND +rowid <= ?"
+    con = connect(path, isolation_level=None)
+    try:
+        con.execute("ATTACH DATABASE ? AS src", (f"{Path(src).resolve().as_uri()}?mode=ro",))
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if new:
+                con.execute(ORDERS_DDL)
+            else:
+                con.execute("DELETE FROM orders WHERE rowid > ?", (lo,))
+            rows = con.execute(
+                f"INSERT INTO orders (rowid, {cols}) SELECT rowid, {cols} FROM src.orders "
+                f"WHERE {where}",
+                (key, key + "~", lo, hi),
+            ).rowcount
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("DETACH DATABASE src")
+        if new:
+            con.execute(PARTITION_INDEX_SQL)
+    finally:
+        con.close()
+    return rows
+
+
+def _seal(path: Path) -> str:
+    """Compact and analyze a closed partition, make it read-only and return its hash."""
+    con = connect(path, isolation_level=None)
+    try:
+        con.execute("PRAGMA journal_mode=DELETE")
+        con.execute("ANALYZE")
+        con.execute("VACUUM")
+    finally:
+        con.close()
+    _set_writable(path, False)
+    return _file_hash(path)
+
+
+def refresh_partitions(
+    db: str = DB,
+    out_dir: Optional[Path] = None,
+    grain: str = "year",
+    full: bool = False,
+) -> Dict[str, object]:
+    """Copy orders rows past the watermark into their partitions and seal closed ones.
+
+    Returns mode ("fresh", "incremental" or "full"), rows, the partitions
+    appended to, the partitions sealed and seconds. Changing the grain or a
+    full rebuild of orders rebuilds every partition.
+    """
+    if grain not in GRAINS:
+        raise ValueError(f"Unknown grain '{grain}', expected one of {tuple(GRAINS)}")
+    if not Path(db).exists():
+        raise FileNotFoundError(f"Database not found: {db}. Please run SQL setup scripts first.")
+    out_dir = Path(out_dir) if out_dir is not None else partition_dir(db)
+    length = GRAINS[grain]
+
+    start = time.perf_counter()
+    con = connect(db, isolation_level=None)
+    try:
+        if not con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='orders'").fetchone():
+            raise ValueError("Table 'orders' not found. Please run sql/10_load_clean.sql first.")
+        con.execute(CATALOG_DDL)
+        catalog = {
+            key: {"grain": g, "sealed": sealed, "file": f}
+            for key, g, sealed, f in con.execute("SELECT key, grain, sealed, file FROM orders_partitions")
+        }
+        mode, lo, max_rowid = decide_mode(
+            con,
+            STATE,
+            full=full
+            or any(entry["grain"] != grain for entry in catalog.values())
+            or any(not (out_dir / entry["file"]).exists() for entry in catalog.values()),
+        )
+        if mode == "fresh":
+            return {"mode": "fresh", "rows": 0, "appended": [], "sealed": [], "seconds": time.perf_counter() - start}
+
+        if mode == "full":
+            for entry in catalog.values():
+                path = out_dir / entry["file"]
+                if path.exists():
+                    path.unlink()
+            con.execute("DELETE FROM orders_partitions")
+            catalog = {}
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        keys = [
+            row[0]
+            for row in con.execute(
+                f"SELECT DISTINCT substr(order_month, 1, {length}) FROM orders "
+                "WHERE rowid > ? AND rowid <= ? AND order_month IS NOT NULL ORDER BY 1",
+                (lo, max_rowid),
+            )
+        ]
+        rows = 0
+        for key in keys:
+            rows += _append(out_dir, key, db, lo, max_rowid)
+            with connect(out_dir / partition_file(key)) as part:
+                first, last, count = part.execute(
+                    "SELECT MIN(order_month), MAX(order_month), COUNT(*) FROM orders"
+                ).fetchone()
+            con.execute(
+                "INSERT OR REPLACE INTO orders_partitions(key, grain, file, first_month, last_month, rows, sealed, sha256) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0, NULL)",
+                (key, grain, partition_file(key), first, last, count),
+            )
+
+        # Everything but the newest partition is closed
+        newest = con.execute("SELECT MAX(key) FROM orders_partitions").fetchone()[0]
+        sealed = []
+        for (key,) in con.execute(
+            "SELECT key FROM orders_partitions WHERE sealed = 0 AND key < ? ORDER BY key", (newest,)
+        ).fetchall():
+            digest = _seal(out_dir / partition_file(key))
+            con.execute("UPDATE orders_partitions SET sealed = 1, sha256 = ? WHERE key = ?", (digest, key))
+            sealed.append(key)
+
+        record_watermark(con, STATE, max_rowid)
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Partition refresh failed: {e}") from e
+    finally:
+        con.close()
+
+    return {"mode": mode, "rows": rows, "appended": keys, "sealed": sealed, "seconds": time.perf_counter() - start}
+
+
+def load_catalog(db: str = DB) -> pd.DataFrame:
+    """The orders_partitions catalog, ordered by key."""
+    try:
+        with connect(db) as con:
+            return pd.read_sql_query("SELECT * FROM orders_partitions ORDER BY key", con)
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        raise RuntimeError(f"Could not read the partition catalog (run refresh_partitions first): {e}") from e
+
+
+def _bounds(start: Optional[str], end: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Normalize YYYY-MM / YYYY-MM-DD bounds to inclusive order_date strings."""
+    for value in (start, end):
+        if value is not None and not _DATE.match(value):
+            raise ValueError(f"Dates must be YYYY-MM or YYYY-MM-DD, got {value!r}")
+    if start is not None and len(start) == 7:
+        start += "-01"
+    if end is not None and len(end) == 7:
+        end += "-31"  # compares after every real day of the month
+    if start is not None and end is not None and start > end:
+        raise ValueError(f"start {start} is after end {end}")
+    return start, end
+
+
+def prune(catalog: pd.DataFrame, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+    """Catalog rows whose month range overlaps [start, end]."""
+    start, end = _bounds(start, end)
+    keep = pd.Series(True, index=catalog.index)
+    if start is not None:
+        keep &= catalog["last_month"] >= start[:7]
+    if end is not None:
+        keep &= catalog["first_month"] <= end[:7]
+    return catalog[keep]
+
+
+def _branch(schema: str, first_month: str, last_month: str, start: Optional[str], end: Optional[str]) -> str:
+    """SELECT of one partition's rows, filtered only if the range cuts through it."""
+    cols = ", ".join(ORDERS_COLUMNS)
+    where = []
+    if start is not None and start > f"{first_month}-01":
+        where.append(f"order_date >= '{start}'")
+    if end is not None and end < f"{last_month}-31":
+        where.append(f"order_date <= '{end}'")
+    return f"SELECT {cols} FROM {schema}.orders" + (f" WHERE {' AND '.join(where)}" if where else "")
+
+
+@contextmanager
+def attach_range(
+    db: str = DB,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    out_dir: Optional[Path] = None,
+) -> Iterator[sqlite3.Connection]:
+    """In-memory connection whose temp `orders` and 20_views.sql views cover only [start, end].
+
+    Partitions outside the range are never opened. Closed partitions are
+    attached read-only with immutable=1, the open one read-only.
+    """
+    start, end = _bounds(start, end)
+    out_dir = Path(out_dir) if out_dir is not None else partition_dir(db)
+    parts = prune(load_catalog(db), start, end)
+    con = connect("file::memory:", uri=True, isolation_level=None)
+    try:
+        for name in ("cache_size", "temp_store", "mmap_size"):
+            con.execute(f"PRAGMA {name}={READ_PRAGMAS[name]}")
+        branches = []
+        if parts.empty:
+            con.execute(ORDERS_DDL.replace("CREATE TABLE", "CREATE TEMP TABLE"))
+        for offset in range(0, len(parts), MAX_ATTACHED):
+            batch = parts.iloc[offset:offset + MAX_ATTACHED]
+            schemas = []
+            for i, part in enumerate(batch.itertuples(index=False)):
+                path = out_dir / part.file
+                if not path.exists():
+                    raise FileNotFoundError(f"Partition file missing: {path}. Please run partitions.py --full.")
+                flags = "mode=ro&immutable=1" if part.sealed else "mode=ro"
+                schema = f"p{offset + i}"
+                con.execute(f"ATTACH DATABASE '{path.resolve().as_uri()}?{flags}' AS {schema}")
+                schemas.append(schema)
+                branches.append(_branch(schema, part.first_month, part.last_month, start, end))
+            if len(parts) > MAX_ATTACHED:
+                # Too many to attach at once: copy this batch into a temp table and detach it
+                batch_sql = " UNION ALL ".join(branches[offset:])
+                if offset == 0:
+                    con.execute(f"CREATE TEMP TABLE orders AS {batch_sql}")
+                else:
+                    con.execute(f"INSERT INTO temp.orders {batch_sql}")
+                for schema in schemas:
+                    con.execute(f"DETACH DATABASE {schema}")
+        if branches and len(parts) <= MAX_ATTACHED:
+            con.execute(f"CREATE TEMP VIEW orders AS {' UNION ALL '.join(branches)}")
+        con.executescript(VIEWS_SQL.read_text().replace("CREATE VIEW", "CREATE TEMP VIEW"))
+        yield con
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Partitioned query failed: {e}") from e
+    finally:
+        con.close()
+
+
+def query(
+    sql: str,
+    db: str = DB,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    out_dir: Optional[Path] = None,
+) -> pd.DataFrame:
+    """Run sql (over orders or the analytical views) against the partitions covering [start, end]."""
+    with attach_range(db, start, end, out_dir) as con:
+        return pd.read_sql_query(sql, con)
+
+
+def query_view(
+    view: str,
+    db: str = DB,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    out_dir: Optional[Path] = None,
+) -> pd.DataFrame:
+    """SELECT * FROM one of the 20_views.sql views over the partitions covering [start, end]."""
+    views = re.findall(r"CREATE VIEW (\w+)", VIEWS_SQL.read_text())
+    if view not in views:
+        raise ValueError(f"Unknown view '{view}', expected one of {views}")
+    return query(f"SELECT * FROM {view}", db, start, end, out_dir)
+
+
+def verify(db: str = DB, out_dir: Optional[Path] = None) -> List[str]:
+    """Keys of closed partitions whose file no longer matches its recorded hash."""
+    out_dir = Path(out_dir) if out_dir is not None else partition_dir(db)
+    catalog = load_catalog(db)
+    return [
+        part.key
+        for part in catalog[catalog["sealed"] == 1].itertuples(index=False)
+        if not (out_dir / part.file).exists() or _file_hash(out_dir / part.file) != part.sha256
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Refresh and query year/month partitions of orders.")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("--dir", type=Path, help="directory for partition files (default: partitions/ next to --db)")
+    parser.add_argument("--grain", choices=list(GRAINS), default="year", help="one file per year or per month")
+    parser.add_argument("--full", action="store_true", help="rebuild every partition from orders")
+    parser.add_argument("--view", help="after refreshing, print this view over the partitions in --start/--end")
+    parser.add_argument("--start", help="first date (YYYY-MM or YYYY-MM-DD) for --view")
+    parser.add_argument("--end", help="last date (YYYY-MM or YYYY-MM-DD) for --view")
+    parser.add_argument("--verify", action="store_true", help="check closed partitions against their recorded hashes")
+    args = parser.parse_args(argv)
+
+    try:
+        result = refresh_partitions(args.db, args.dir, args.grain, full=args.full)
+        print(
+            f"  ✓ partitions {result['mode']} refresh: {result['rows']:,} order rows into "
+            f"{len(result['appended'])} partition(s), {len(result['sealed'])} sealed in {result['seconds']:.2f}s"
+        )
+        if args.verify:
+            changed = verify(args.db, args.dir)
+            if changed:
+                raise RuntimeError(f"Closed partitions changed on disk: {', '.join(changed)}")
+            print("  ✓ Closed partitions match their recorded hashes")
+        if args.view:
+            catalog = load_catalog(args.db)
+            used = prune(catalog, args.start, args.end)
+            df = query_view(args.view, args.db, args.start, args.end, args.dir)
+            print(f"  ✓ {args.view}: {len(df):,} rows from {len(used)} of {len(catalog)} partitions")
+            print(df.head(20).to_string(index=False))
+    except (FileNotFoundError, ValueError, RuntimeError) as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
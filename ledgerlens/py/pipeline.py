@@ -0,0 +1,486 @@
+"""Dependency-aware runner for the whole pipeline, with a watch mode.
+
+The manual sequence (00_schema.sql, import, 10_load_clean.sql, 20_views.sql,
+charts.py) becomes a DAG of stages:
+
+    schema -> ingest -> clean -> indexes -> materialize -> export -> render
+                             \\-> views --/             \\-> quality
+
+Each stage declares its inputs: hashes of the SQL and Python files it runs,
+the mtime/size/sha256 of the raw CSVs and the version of the tables it reads
+(MAX(rowid) plus orders_generation). A stage runs only when the fingerprint
+of its inputs differs from the one stored in pipeline_state after its last
+successful run. Independent stages run concurrently in a thread pool.
+Without WAL a writer waits for every open read, so quality's long read of
+orders starts only after indexes, views and materialize (which folds new
+orders into the mv_* summaries that top_customers.csv is read from) have
+written; export, render and quality only read and overlap freely. Inputs are evaluated once
+a stage's dependencies have finished, so a stage whose upstream rewrote a
+table sees the new table version.
+
+watch() polls the drop directory for new or changed CSVs. A new drop is
+appended to orders_raw on its own, cleaned incrementally and re-exported, so
+the dashboard data catches up within seconds of the file landing.
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from profiling import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+DROP_DIR = ROOT / "data_raw"
+SQL_DIR = ROOT / "sql"
+PY_DIR = Path(__file__).resolve().parent
+
+DEFAULT_INTERVAL = 2.0
+
+STATE_DDL = """
+CREATE TABLE IF NOT EXISTS pipeline_state(
+  stage TEXT PRIMARY KEY,
+  fingerprint TEXT NOT NULL,
+  inputs TEXT NOT NULL,
+  outputs TEXT,
+  seconds REAL,
+  finished_at TEXT
+)
+"""
+
+Inputs = Dict[str, object]
+
+
+class Stage:
+    """A named pipeline step: inputs(previous) describes what it reads, run(previous) does the work.
+
+    previous is the stage's stored record ({"inputs": ..., "outputs": ...}) or
+    None if it never ran. run() returns a JSON-serializable outputs dict.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        deps: Sequence[str],
+        inputs: Callable[[Optional[Dict[str, object]]], Inputs],
+        run: Callable[[Optional[Dict[str, object]]], Dict[str, object]],
+    ) -> None:
+        self.name = name
+        self.deps = tuple(deps)
+        self.inputs = inputs
+        self.run = run
+
+    def __repr__(self) -> str:
+        return f"Stage({self.name!r}, deps={self.deps})"
+
+
+def fingerprint(inputs: Inputs) -> str:
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_signature(path: Path, known: Optional[Dict[str, object]] = None) -> Dict[str, object]:
+    """mtime, size and sha256 of a file; the hash is reused when mtime and size match known."""
+    stat = path.stat()
+    signature: Dict[str, object] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if known and all(known.get(k) == v for k, v in signature.items()):
+        signature["sha256"] = known["sha256"]
+    else:
+        signature["sha256"] = file_hash(path)
+    return signature
+
+
+def _connect(db: str) -> sqlite3.Connection:
+    return connect(db, timeout=30)
+
+
+def _exists(con: sqlite3.Connection, kind: str, name: str) -> bool:
+    return con.execute("SELECT 1 FROM sqlite_master WHERE type=? AND name=?", (kind, name)).fetchone() is not None
+
+
+def table_version(db: str, table: str, generation: Optional[str] = "orders_generation") -> Optional[List[object]]:
+    """[MAX(rowid), etl_state generation] for table (just [MAX(rowid)] when generation is None), or None if it does not exist."""
+    if not Path(db).exists():
+        return None
+    with _connect(db) as con:
+        if not _exists(con, "table", table):
+            return None
+        version: List[object] = [con.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]]
+        if generation:
+            row = None
+            if _exists(con, "table", "etl_state"):
+                row = con.execute("SELECT value FROM etl_state WHERE name=?", (generation,)).fetchone()
+            version.append(row[0] if row else None)
+    return version
+
+
+def objects_present(db: str, kind: str, names: Iterable[str]) -> bool:
+    if not Path(db).exists():
+        return False
+    with _connect(db) as con:
+        return all(_exists(con, kind, name) for name in names)
+
+
+def load_state(db: str) -> Dict[str, Dict[str, object]]:
+    """Stored fingerprint, inputs and outputs of every stage that has run."""
+    if not Path(db).exists():
+        return {}
+    with _connect(db) as con:
+        if not _exists(con, "table", "pipeline_state"):
+            return {}
+        rows = con.execute("SELECT stage, fingerprint, inputs, outputs, seconds, finished_at FROM pipeline_state")
+        return {
+            stage: {
+                "fingerprint": fp,
+                "inputs": json.loads(inputs),
+                "outputs": json.loads(outputs) if outputs else {},
+                "seconds": seconds,
+                "finished_at": finished_at,
+            }
+            for stage, fp, inputs, outputs, seconds, finished_at in rows
+        }
+
+
+def save_state(db: str, stage: str, inputs: Inputs, outputs: Dict[str, object], seconds: float) -> None:
+    Path(db).parent.mkdir(parents=True, exist_ok=True)
+    with _connect(db) as con:
+        con.execute(STATE_DDL)
+        con.execute(
+            "INSERT OR REPLACE INTO pipeline_state(stage, fingerprint, inputs, outputs, seconds, finished_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                stage,
+                fingerprint(inputs),
+                json.dumps(inputs, sort_keys=True, default=str),
+                json.dumps(outputs, sort_keys=True, default=str),
+                seconds,
+                datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            ),
+        )
+
+
+def _check_dag(stages: Sequence[Stage]) -> None:
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate stage names: {names}")
+    known = set()
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in known]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on {missing}, which must be listed before it")
+        known.add(stage.name)
+
+
+def run_pipeline(
+    stages: Sequence[Stage],
+    db: str = DB,
+    force: Iterable[str] = (),
+    jobs: int = 2,
+) -> Dict[str, Dict[str, object]]:
+    """Run stages in dependency order, skipping those whose inputs are unchanged.
+
+    Stages must be listed after their dependencies. Returns {stage: {"status",
+    "seconds", "outputs"}} where status is "ran", "skipped", "failed" (with
+    "error") or "blocked" (a dependency failed). Raises RuntimeError after all
+    runnable stages finish if any stage failed.
+    """
+    _check_dag(stages)
+    force = set(force)
+    unknown = force - {stage.name for stage in stages}
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}")
+    state = load_state(db)
+    results: Dict[str, Dict[str, object]] = {}
+    pending = list(stages)
+    running: Dict[Future, Stage] = {}
+
+    def execute(stage: Stage) -> Dict[str, object]:
+        start = time.perf_counter()
+        outputs = stage.run(state.get(stage.name))
+        seconds = time.perf_counter() - start
+        # Inputs are fingerprinted after the run, so tables a stage writes itself
+        # (e.g. orders_raw for ingest) do not make it look stale next time.
+        save_state(db, stage.name, stage.inputs(state.get(stage.name)), outputs, seconds)
+        return {"status": "ran", "seconds": seconds, "outputs": outputs}
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        while pending or running:
+            for stage in list(pending):
+                statuses = [results.get(dep, {}).get("status") for dep in stage.deps]
+                if any(s in ("failed", "blocked") for s in statuses):
+                    results[stage.name] = {"status": "blocked", "seconds": 0.0, "outputs": {}}
+                    pending.remove(stage)
+                elif all(s in ("ran", "skipped") for s in statuses):
+                    pending.remove(stage)
+                    previous = state.get(stage.name)
+                    stale = (
+                        stage.name in force
+                        or previous is None
+                        or fingerprint(stage.inputs(previous)) != previous["fingerprint"]
+                    )
+                    if stale:
+                        running[pool.submit(execute, stage)] = stage
+                    else:
+                        results[stage.name] = {"status": "skipped", "seconds": 0.0, "outputs": previous["outputs"]}
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    results[stage.name] = future.result()
+                except Exception as e:
+                    results[stage.name] = {"status": "failed", "seconds": 0.0, "outputs": {}, "error": str(e)}
+
+    failed = [name for name, result in results.items() if result["status"] == "failed"]
+    if failed:
+        details = "; ".join(f"{name}: {results[name]['error']}" for name in failed)
+        raise RuntimeError(f"{len(failed)} stage(s) failed: {details}")
+    return results
+
+
+def csv_files(drop_dir: Path) -> List[Path]:
+    return sorted(Path(drop_dir).glob("*.csv"))
+
+
+def build_stages(db: str = DB, drop_dir: Path = DROP_DIR, engine: str = "sql", chart_jobs: int = 1) -> List[Stage]:
+    """The standard LedgerLens DAG over db and the CSVs in drop_dir."""
+    import charts
+    from clean import LOAD_CLEAN_SQL, full_rebuild, refresh_orders
+    from indexes import INDEXES_SQL, ensure_indexes
+    from ingest import SCHEMA_SQL, ingest_csv
+    from materialize import MATERIALIZED_SQL, refresh
+
+    views_sql = SQL_DIR / "20_views.sql"
+    charts_py = PY_DIR / "charts.py"
+    quality_py = PY_DIR / "quality.py"
+    materialize_py = PY_DIR / "materialize.py"
+
+    def schema_inputs(previous):
+        return {"sql": file_hash(SCHEMA_SQL), "orders_raw": objects_present(db, "table", ["orders_raw"])}
+
+    def schema_run(previous):
+        Path(db).parent.mkdir(parents=True, exist_ok=True)
+        with _connect(db) as con:
+            con.executescript(SCHEMA_SQL.read_text())
+        return {}
+
+    def ingest_inputs(previous):
+        known = (previous or {}).get("inputs", {}).get("files", {})
+        return {
+            "files": {path.name: file_signature(path, known.get(path.name)) for path in csv_files(drop_dir)},
+            "orders_raw": table_version(db, "orders_raw", generation=None),
+        }
+
+    def ingest_run(previous):
+        files = {path.name: path for path in csv_files(drop_dir)}
+        if not files:
+            raise FileNotFoundError(f"No CSV files found in {drop_dir}")
+        before = (previous or {}).get("inputs", {})
+        loaded = before.get("files", {})
+        signatures = {name: file_signature(path, loaded.get(name)) for name, path in files.items()}
+        # Appending is only safe while orders_raw still holds exactly what was loaded before
+        # and no loaded file was edited or removed; otherwise reload every file.
+        append = (
+            previous is not None
+            and before.get("orders_raw") == table_version(db, "orders_raw", generation=None)
+            and all(name in signatures and signatures[name]["sha256"] == sig["sha256"] for name, sig in loaded.items())
+        )
+        todo = [name for name in files if not append or name not in loaded]
+        rows = 0
+        for i, name in enumerate(todo):
+            rows += ingest_csv(files[name], db, reset=not append and i == 0)["rows"]
+        return {"mode": "append" if append else "reload", "files": todo, "rows": rows}
+
+    # 00_schema.sql bumps this on every reset of orders_raw, so a reload that
+    # ends at the same rowid (an edited file of the same length) still counts
+    raw_generation = "orders_raw_generation"
+
+    def clean_inputs(previous):
+        return {
+            "sql": file_hash(LOAD_CLEAN_SQL),
+            "engine": engine,
+            "orders_raw": table_version(db, "orders_raw", generation=raw_generation),
+        }
+
+    def clean_run(previous):
+        before = (previous or {}).get("inputs", {})
+        loaded = table_version(db, "orders_raw", generation=raw_generation) or [None, None]
+        rebuild = (
+            previous is None
+            or before.get("sql") != file_hash(LOAD_CLEAN_SQL)
+            or (before.get("orders_raw") or [None])[-1] != loaded[-1]  # orders_raw was reloaded
+        )
+        result = full_rebuild(db, engine) if rebuild else refresh_orders(db, engine=engine)
+        return {"mode": result["mode"], "rows_added": result["rows_added"]}
+
+    def indexes_inputs(previous):
+        names = [line.split()[-1] for line in INDEXES_SQL.read_text().splitlines() if line.startswith("CREATE INDEX")]
+        return {"sql": file_hash(INDEXES_SQL), "present": objects_present(db, "index", names)}
+
+    def indexes_run(previous):
+        with _connect(db) as con:
+            ensure_indexes(con)
+        return {}
+
+    def views_inputs(previous):
+        return {"sql": file_hash(views_sql), "present": objects_present(db, "view", charts.REQUIRED_VIEWS)}
+
+    def views_run(previous):
+        with _connect(db) as con:
+            con.executescript(views_sql.read_text())
+        return {}
+
+    def materialize_inputs(previous):
+        return {
+            "sql": file_hash(MATERIALIZED_SQL),
+            "code": file_hash(materialize_py),
+            "orders": table_version(db, "orders"),
+        }
+
+    def materialize_run(previous):
+        # refresh() rebuilds on its own after orders was rebuilt; a changed DDL file needs it too
+        changed = previous is not None and previous.get("inputs", {}).get("sql") != file_hash(MATERIALIZED_SQL)
+        result = refresh(db, full=changed)
+        return {"mode": result["mode"], "rows": result["rows"]}
+
+    def quality_inputs(previous):
+        return {"code": file_hash(quality_py), "orders": table_version(db, "orders")}
+
+    def quality_run(previous):
+        from quality import check_orders
+
+        report = check_orders(db)
+        report.raise_for_errors()
+        return {"rows": report.rows, "warnings": {r["rule"]: r["violations"] for r in report.failures("warning")}}
+
+    def export_inputs(previous):
+        return {"code": file_hash(charts_py), "views": file_hash(views_sql), "orders": table_version(db, "orders")}
+
+    def export_run(previous):
+        try:
+            charts.run_command(charts.parse_args(["export", "--db", db, "--jobs", str(chart_jobs)]))
+        finally:
+            charts.close_connections()
+        return {"files": sorted(charts.EXPORT_FILES.values())}
+
+    def render_inputs(previous):
+        exported = [charts.DATA / name for name in charts.EXPORT_FILES.values()]
+        return {
+            "code": file_hash(charts_py),
+            "csvs": {path.name: file_hash(path) if path.exists() else None for path in exported},
+        }
+
+    def render_run(previous):
+        charts.run_command(charts.parse_args(["render", "--jobs", str(chart_jobs)]))
+        return {"charts": len(charts.CHARTS)}
+
+    return [
+        Stage("schema", [], schema_inputs, schema_run),
+        Stage("ingest", ["schema"], ingest_inputs, ingest_run),
+        Stage("clean", ["ingest"], clean_inputs, clean_run),
+        Stage("indexes", ["clean"], indexes_inputs, indexes_run),
+        Stage("views", ["clean"], views_inputs, views_run),
+        Stage("materialize", ["indexes", "views"], materialize_inputs, materialize_run),
+        Stage("export", ["materialize"], export_inputs, export_run),
+        Stage("render", ["export"], render_inputs, render_run),
+        Stage("quality", ["materialize"], quality_inputs, quality_run),
+    ]
+
+
+def _listing(drop_dir: Path) -> Dict[str, tuple]:
+    """Cheap change detector for the drop directory: name -> (mtime_ns, size)."""
+    listing = {}
+    for path in csv_files(drop_dir):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # removed between glob and stat
+        listing[path.name] = (stat.st_mtime_ns, stat.st_size)
+    return listing
+
+
+def watch(
+    stages: Sequence[Stage],
+    db: str = DB,
+    drop_dir: Path = DROP_DIR,
+    interval: float = DEFAULT_INTERVAL,
+    jobs: int = 2,
+    max_runs: Optional[int] = None,
+) -> None:
+    """Run the pipeline now and again whenever the CSVs in drop_dir change.
+
+    A drop is picked up once its size and mtime have been stable for one
+    poll, so files still being copied are not ingested half-written.
+    max_runs stops after that many pipeline runs (used by tests).
+    """
+    runs = 0
+    seen = None
+    candidate = _listing(drop_dir)
+    while max_runs is None or runs < max_runs:
+        listing = _listing(drop_dir)
+        if listing == candidate and listing != seen:
+            started = time.perf_counter()
+            try:
+                results = run_pipeline(stages, db, jobs=jobs)
+                ran = [name for name, result in results.items() if result["status"] == "ran"]
+                print(f"  ✓ Pipeline run in {time.perf_counter() - started:.2f}s (ran: {', '.join(ran) or 'nothing'})")
+            except (FileNotFoundError, ValueError, RuntimeError) as e:
+                print(f"  ✗ Pipeline run failed: {e}", file=sys.stderr)
+            seen = listing
+            runs += 1
+            continue
+        candidate = listing
+        time.sleep(interval)
+
+
+def print_results(results: Dict[str, Dict[str, object]]) -> None:
+    for name, result in results.items():
+        if result["status"] == "ran":
+            print(f"  ✓ {name}: ran in {result['seconds']:.2f}s")
+        else:
+            print(f"  - {name}: {result['status']}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Run the pipeline stages whose inputs changed.")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("--drop-dir", type=Path, default=DROP_DIR, help="directory of raw CSV files to ingest")
+    parser.add_argument("--engine", choices=["sql", "python"], default="sql", help="orders normalizer for the clean stage")
+    parser.add_argument("--force", nargs="+", default=[], metavar="STAGE", help="rerun these stages even if unchanged")
+    parser.add_argument("--jobs", type=int, default=2, help="stages to run concurrently")
+    parser.add_argument("--chart-jobs", type=int, default=1, help="worker processes for chart rendering")
+    parser.add_argument("--watch", action="store_true", help="keep running and refresh when CSVs in --drop-dir change")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between --watch polls")
+    args = parser.parse_args(argv)
+
+    try:
+        stages = build_stages(args.db, args.drop_dir, args.engine, args.chart_jobs)
+        if args.watch:
+            print(f"Watching {args.drop_dir} every {args.interval:g}s (Ctrl+C to stop)...")
+            watch(stages, args.db, args.drop_dir, args.interval, args.jobs)
+        else:
+            print_results(run_pipeline(stages, args.db, args.force, args.jobs))
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    except (FileNotFoundError, ValueError, RuntimeError) as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
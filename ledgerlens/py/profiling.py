@@ -0,0 +1,345 @@
+"""Span tracing for the pipeline, with SQLite statement capture.
+
+enable() installs a process-wide Tracer; until then span() and traced()
+cost one global lookup, so the instrumented code paths run unchanged. While
+a tracer is active:
+
+- span(name, category) times a block and records it with its parent span,
+  thread and any args the block adds (e.g. rows);
+- trace_connection(con) hooks SQLite's trace and progress callbacks, so
+  every statement run on that connection is recorded with its SQL, the
+  span it ran in, its wall time and the number of VM steps it took.
+  connect() opens a TracedConnection, which is hooked when it opens and
+  whose cursors also count the rows fetched and end each statement when it
+  has finished or its rows are exhausted. Modules open their databases with
+  connect(), so engine statements are traced alongside the charts queries.
+  With no tracer it returns a plain sqlite3 connection, whose C cursors
+  fetch about twice as fast;
+- the trace is written as JSON (write_json) or in Chrome trace-event format
+  (write_chrome_trace) for chrome://tracing or https://ui.perfetto.dev.
+
+profile(path) wraps a block in cProfile and dumps pstats to path.
+
+Only stdlib is imported, so charts.py can import this at module level.
+"""
+import cProfile
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, TypeVar, Union
+
+# SQLite calls the progress handler every PROGRESS_STEPS VM instructions
+PROGRESS_STEPS = 1000
+
+F = TypeVar("F", bound=Callable[..., object])
+
+
+class Tracer:
+    """Collected spans and SQLite statements for one run."""
+
+    def __init__(self) -> None:
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.spans: List[Dict[str, object]] = []
+        self.statements: List[Dict[str, object]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self) -> List[Dict[str, object]]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _now_us(self) -> float:
+        return (time.perf_counter_ns() - self.origin) / 1000
+
+    @contextmanager
+    def span(self, name: str, category: str = "pipeline", **args: object) -> Iterator[Dict[str, object]]:
+        """Time a block; yields its args dict so the block can add to it."""
+        stack = self._stack()
+        record: Dict[str, object] = {
+            "name": name,
+            "category": category,
+            "parent": stack[-1]["name"] if stack else None,
+            "depth": len(stack),
+            "thread": threading.get_ident(),
+            "start_us": self._now_us(),
+            "args": dict(args),
+            "statements": 0,
+        }
+        stack.append(record)
+        try:
+            yield record["args"]
+        except BaseException as e:
+            record["args"]["error"] = str(e)
+            raise
+        finally:
+            self._close_statement()
+            stack.pop()
+            record["duration_us"] = self._now_us() - record["start_us"]
+            with self._lock:
+                self.spans.append(record)
+
+    def _open_statement(self) -> Optional[Dict[str, object]]:
+        return getattr(self._local, "statement", None)
+
+    def _close_statement(self) -> None:
+        statement = self._open_statement()
+        if statement is None:
+            return
+        self._local.statement = None
+        statement["duration_us"] = self._now_us() - statement["start_us"]
+        with self._lock:
+            self.statements.append(statement)
+
+    def on_statement(self, sql: str) -> None:
+        """sqlite3 trace callback: a statement started, so the previous one on this thread ended."""
+        self._close_statement()
+        stack = self._stack()
+        if stack:
+            stack[-1]["statements"] += 1
+        self._local.statement = {
+            "sql": " ".join(sql.split()),
+            "span": stack[-1]["name"] if stack else None,
+            "thread": threading.get_ident(),
+            "start_us": self._now_us(),
+            "vm_steps": 0,
+            "rows": None,
+        }
+
+    def finish_statement(self, statement: Optional[Dict[str, object]]) -> None:
+        """End statement now, if it is still the running statement on this thread."""
+        if statement is not None and statement is self._open_statement():
+            self._close_statement()
+
+    def on_progress(self) -> int:
+        """sqlite3 progress handler: count VM steps for the running statement. Never aborts it."""
+        statement = self._open_statement()
+        if statement is not None:
+            statement["vm_steps"] += PROGRESS_STEPS
+        return 0
+
+    def to_dict(self) -> Dict[str, object]:
+        spans = sorted(self.spans, key=lambda s: s["start_us"])
+        statements = sorted(self.statements, key=lambda s: s["start_us"])
+        return {"pid": self.pid, "spans": spans, "statements": statements}
+
+    def chrome_events(self) -> List[Dict[str, object]]:
+        """Complete ("X") trace events for spans and statements, in microseconds."""
+        events = [
+            {
+                "name": s["name"],
+                "cat": s["category"],
+                "ph": "X",
+                "ts": s["start_us"],
+                "dur": s["duration_us"],
+                "pid": self.pid,
+                "tid": s["thread"],
+                "args": s["args"],
+            }
+            for s in self.spans
+        ]
+        events.extend(
+            {
+                "name": s["sql"][:80],
+                "cat": "sqlite",
+                "ph": "X",
+                "ts": s["start_us"],
+                "dur": s["duration_us"],
+                "pid": self.pid,
+                "tid": s["thread"],
+                "args": {"sql": s["sql"], "span": s["span"], "vm_steps": s["vm_steps"], "rows": s.get("rows")},
+            }
+            for s in self.statements
+        )
+        return sorted(events, key=lambda e: e["ts"])
+
+    def write_json(self, path: Union[str, Path]) -> Path:
+        path = Path(path)
+        path.write_text(json.dumps(self.to_dict(), indent=2, default=str))
+        return path
+
+    def write_chrome_trace(self, path: Union[str, Path]) -> Path:
+        path = Path(path)
+        path.write_text(json.dumps({"traceEvents": self.chrome_events(), "displayTimeUnit": "ms"}, default=str))
+        return path
+
+    def summary(self, limit: int = 10) -> str:
+        """The slowest spans by total time, one line per span name."""
+        totals: Dict[str, List[float]] = {}
+        for s in self.spans:
+            totals.setdefault(f"{s['category']}:{s['name']}", []).append(s["duration_us"])
+        ranked = sorted(totals.items(), key=lambda item: sum(item[1]), reverse=True)[:limit]
+        return "\n".join(
+            f"{sum(durations) / 1000:8.1f} ms  {len(durations):>4}x  {name}" for name, durations in ranked
+        )
+
+
+_tracer: Optional[Tracer] = None
+
+
+def enable() -> Tracer:
+    """Start recording into a new process-wide Tracer and return it."""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disable() -> Optional[Tracer]:
+    """Stop recording; returns the tracer that was active, if any."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def active() -> Optional[Tracer]:
+    return _tracer
+
+
+@contextmanager
+def span(name: str, category: str = "pipeline", **args: object) -> Iterator[Dict[str, object]]:
+    """Tracer.span() on the active tracer; a plain block (with a throwaway args dict) when tracing is off."""
+    tracer = _tracer
+    if tracer is None:
+        yield {}
+        return
+    with tracer.span(name, category, **args) as span_args:
+        yield span_args
+
+
+def traced(category: str) -> Callable[[F], F]:
+    """Decorator: record every call of the function as a span named after it."""
+    def decorate(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: object, **kwargs: object) -> object:
+            tracer = _tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            with tracer.span(func.__name__, category):
+                return func(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+    return decorate
+
+
+def trace_connection(con: "object") -> None:
+    """Hook a sqlite3 connection's trace and progress callbacks into the active tracer, if any."""
+    tracer = _tracer
+    if tracer is None:
+        return
+    con.set_trace_callback(tracer.on_statement)
+    con.set_progress_handler(tracer.on_progress, PROGRESS_STEPS)
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that adds fetched rows to its statement's record and ends it once the rows run out."""
+
+    _statement: Optional[Dict[str, object]] = None
+
+    def _started(self) -> None:
+        tracer = _tracer
+        self._statement = tracer._open_statement() if tracer is not None else None
+        if self._statement is not None:
+            self._statement["rows"] = 0
+            if self.description is None:  # no result rows: the statement ran to completion
+                tracer.finish_statement(self._statement)
+
+    def _fetched(self, rows: int, exhausted: bool) -> None:
+        statement = self._statement
+        if statement is None:
+            return
+        statement["rows"] += rows
+        tracer = _tracer
+        if exhausted and tracer is not None:
+            tracer.finish_statement(statement)
+
+    def execute(self, sql: str, parameters: object = ()) -> "TracedCursor":
+        super().execute(sql, parameters)
+        self._started()
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters: object) -> "TracedCursor":
+        super().executemany(sql, seq_of_parameters)
+        self._started()
+        return self
+
+    def executescript(self, sql_script: str) -> "TracedCursor":
+        super().executescript(sql_script)
+        self._started()
+        return self
+
+    def fetchone(self) -> object:
+        row = super().fetchone()
+        self._fetched(row is not None, row is None)
+        return row
+
+    def fetchmany(self, size: Optional[int] = None) -> list:
+        size = self.arraysize if size is None else size
+        rows = super().fetchmany(size)
+        self._fetched(len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self) -> list:
+        rows = super().fetchall()
+        self._fetched(len(rows), True)
+        return rows
+
+    def __next__(self) -> object:
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(0, True)
+            raise
+        self._fetched(1, False)
+        return row
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection hooked into the active tracer when opened, whose cursors are TracedCursors."""
+
+    def __init__(self, *args: object, **kwargs: object) -> None:
+        super().__init__(*args, **kwargs)
+        trace_connection(self)
+
+    def cursor(self, factory: Optional[Callable[..., sqlite3.Cursor]] = None) -> sqlite3.Cursor:
+        return super().cursor(factory or TracedCursor)
+
+    # sqlite3.Connection's shortcuts create plain cursors, so route them through cursor()
+    def execute(self, sql: str, parameters: object = ()) -> sqlite3.Cursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: object) -> sqlite3.Cursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str) -> sqlite3.Cursor:
+        return self.cursor().executescript(sql_script)
+
+
+def connect(database: Union[str, Path], **kwargs: object) -> sqlite3.Connection:
+    """sqlite3.connect(), returning a TracedConnection while a tracer is active so its statements appear in traces.
+
+    Connections opened before enable() stay plain and are not traced.
+    """
+    if _tracer is None:
+        return sqlite3.connect(database, **kwargs)
+    return sqlite3.connect(database, factory=TracedConnection, **kwargs)
+
+
+@contextmanager
+def profile(path: Optional[Union[str, Path]]) -> Iterator[Optional[cProfile.Profile]]:
+    """Run the block under cProfile and dump pstats to path; a plain block when path is None."""
+    if path is None:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(str(path))
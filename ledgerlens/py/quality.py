@@ -0,0 +1,325 @@
+"""Declarative data-quality rules, evaluated one vectorized pass per chunk.
+
+A Rule names a check, its severity and the columns it reads; its check
+returns a boolean mask of violating rows. check_frame() evaluates every
+rule against a frame at once (one mask per rule, counted together), and
+check_orders() streams the orders fact table in chunks, reading only the
+columns the rules need. Results are collected in a QualityReport with the
+violation count and a few sample row ids per rule, so callers decide
+whether to fail, print or serialize them.
+
+The charts.py validators run the *_RULES for the exported aggregates; the
+ORDER_RULES check every row of orders.
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from connections import open_readonly
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+
+DEFAULT_CHUNK_SIZE = 200_000
+DEFAULT_SAMPLES = 5
+SEVERITIES = ("error", "warning")
+
+DOMESTIC_COUNTRY = "United Kingdom"
+
+
+class Rule:
+    """A named row-level check; check(df) is True for the rows that violate it."""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        columns: Sequence[str],
+        check: Callable[[pd.DataFrame], object],
+        severity: str = "error",
+    ) -> None:
+        if severity not in SEVERITIES:
+            raise ValueError(f"severity must be one of {SEVERITIES}, got {severity!r}")
+        self.name = name
+        self.description = description
+        self.columns = tuple(columns)
+        self.check = check
+        self.severity = severity
+
+    def __repr__(self) -> str:
+        return f"Rule({self.name!r}, severity={self.severity!r})"
+
+
+def _missing(column: str) -> Callable[[pd.DataFrame], pd.Series]:
+    """Check for NULL or blank values in column."""
+    def check(df: pd.DataFrame) -> pd.Series:
+        values = df[column]
+        if values.dtype == object or pd.api.types.is_string_dtype(values):
+            return values.isna() | (values.astype(str).str.strip() == "")
+        return values.isna()
+    return check
+
+
+def _negative(column: str) -> Callable[[pd.DataFrame], pd.Series]:
+    return lambda df: df[column] < 0
+
+
+def _not_equal(left: pd.Series, right: pd.Series, rtol: float = 1e-9, atol: float = 1e-6) -> np.ndarray:
+    """Numeric inequality beyond floating-point noise; rows with a NULL on either side pass."""
+    a = left.to_numpy(dtype=np.float64, na_value=np.nan)
+    b = right.to_numpy(dtype=np.float64, na_value=np.nan)
+    return ~np.isclose(a, b, rtol=rtol, atol=atol) & ~np.isnan(a) & ~np.isnan(b)
+
+
+def _unparsable_dates(values: pd.Series, fmt: str, suffix: str = "") -> pd.Series:
+    """Non-NULL values that do not parse as dates in fmt."""
+    dates = pd.to_datetime(values + suffix, format=fmt, errors="coerce")
+    return dates.isna() & values.notna()
+
+
+def _revenue_outliers(df: pd.DataFrame) -> pd.Series:
+    """Revenue more than 3 standard deviations from the frame's mean."""
+    revenue = df["revenue"]
+    std = revenue.std()
+    if len(df) < 2 or not std > 0:
+        return pd.Series(False, index=df.index)
+    return (revenue - revenue.mean()).abs() > 3 * std
+
+
+def _span_over_five_years(df: pd.DataFrame) -> pd.Series:
+    """Months more than five years before the latest month."""
+    dates = pd.to_datetime(df["ym"] + "-01", format="%Y-%m-%d", errors="coerce")
+    return (dates.max() - dates).dt.days > 365 * 5
+
+
+def _export_flag_mismatch(df: pd.DataFrame) -> pd.Series:
+    """is_export disagrees with country (NULL countries count as domestic, like the clean view)."""
+    expected = (df["country"].notna() & (df["country"] != DOMESTIC_COUNTRY)).astype(np.int64)
+    return df["is_export"].notna() & (df["is_export"] != expected)
+
+
+# Every row of the orders fact table
+ORDER_RULES: List[Rule] = [
+    Rule("invoice_missing", "missing invoice_no", ["invoice_no"], _missing("invoice_no")),
+    Rule("sku_missing", "missing sku", ["sku"], _missing("sku")),
+    Rule("order_date_missing", "missing order_date", ["order_date"], _missing("order_date")),
+    Rule(
+        "order_date_invalid", "order_date that is not a calendar date", ["order_date"],
+        lambda df: _unparsable_dates(df["order_date"], "%Y-%m-%d"),
+    ),
+    Rule(
+        "order_month_mismatch", "order_month that does not match order_date", ["order_date", "order_month"],
+        lambda df: df["order_date"].notna() & (df["order_month"] != df["order_date"].str[:7]),
+    ),
+    Rule("qty_not_positive", "non-positive qty", ["qty"], lambda df: df["qty"] <= 0),
+    Rule("unit_price_negative", "negative unit_price", ["unit_price"], _negative("unit_price")),
+    Rule(
+        "revenue_mismatch", "gross_revenue other than qty * unit_price", ["qty", "unit_price", "gross_revenue"],
+        lambda df: _not_equal(df["gross_revenue"], df["qty"] * df["unit_price"]),
+    ),
+    Rule(
+        "profit_mismatch", "gross_profit other than gross_revenue - cogs", ["gross_revenue", "cogs", "gross_profit"],
+        lambda df: _not_equal(df["gross_profit"], df["gross_revenue"] - df["cogs"]),
+    ),
+    Rule(
+        "export_flag_mismatch", "is_export inconsistent with country", ["country", "is_export"],
+        _export_flag_mismatch,
+    ),
+    Rule("customer_missing", "missing customer_id", ["customer_id"], _missing("customer_id"), "warning"),
+    Rule("country_missing", "missing country", ["country"], _missing("country"), "warning"),
+    Rule("unit_price_zero", "zero unit_price", ["unit_price"], lambda df: df["unit_price"] == 0, "warning"),
+]
+
+# Exported aggregates (charts.py validators)
+MONTHLY_RULES: List[Rule] = [
+    Rule("revenue_negative", "negative revenue", ["revenue"], _negative("revenue")),
+    Rule("ym_missing", "null values in ym", ["ym"], lambda df: df["ym"].isna(), "warning"),
+    Rule("revenue_missing", "null values in revenue", ["revenue"], lambda df: df["revenue"].isna(), "warning"),
+    Rule(
+        "gross_profit_missing", "null values in gross_profit", ["gross_profit"],
+        lambda df: df["gross_profit"].isna(), "warning",
+    ),
+    Rule("gross_profit_negative", "rows with negative gross profit", ["gross_profit"], _negative("gross_profit"), "warning"),
+    Rule("revenue_outlier", "potential revenue outliers", ["revenue"], _revenue_outliers, "warning"),
+    Rule(
+        "ym_invalid", "months that could not be parsed", ["ym"],
+        lambda df: _unparsable_dates(df["ym"], "%Y-%m-%d", "-01"), "warning",
+    ),
+    Rule("ym_span", "months more than 5 years before the latest", ["ym"], _span_over_five_years, "warning"),
+]
+
+COUNTRY_RULES: List[Rule] = [
+    Rule("revenue_negative", "negative revenue", ["revenue"], _negative("revenue")),
+    Rule("country_missing", "rows with null country", ["country"], lambda df: df["country"].isna(), "warning"),
+]
+
+CUSTOMER_RULES: List[Rule] = [
+    Rule("revenue_negative", "negative revenue", ["revenue"], _negative("revenue")),
+]
+
+COHORT_RULES: List[Rule] = [
+    Rule("cohort_missing", "cohorts with null month", ["cohort"], _missing("cohort")),
+    Rule("cohort_size_not_positive", "cohorts with no customers", ["customers"], lambda df: df["customers"] <= 0),
+    Rule(
+        "month0_not_full", "cohorts whose month-0 retention is not 100%", ["m0"],
+        lambda df: _not_equal(df["m0"], pd.Series(1.0, index=df.index)),
+    ),
+]
+
+SKU_RULES: List[Rule] = [
+    Rule("revenue_negative", "negative revenue", ["revenue"], _negative("revenue")),
+    Rule(
+        "abc_class_invalid", "SKUs with invalid ABC class", ["abc_class"],
+        lambda df: df["abc_class"].notna() & ~df["abc_class"].isin(["A", "B", "C"]), "warning",
+    ),
+]
+
+
+def evaluate(df: pd.DataFrame, rules: Sequence[Rule]) -> np.ndarray:
+    """Boolean matrix with one row per rule and one column per row of df."""
+    masks = np.zeros((len(rules), len(df)), dtype=bool)
+    for i, rule in enumerate(rules):
+        mask = rule.check(df)
+        if isinstance(mask, pd.Series):
+            mask = mask.fillna(False).to_numpy(dtype=bool)
+        masks[i] = mask
+    return masks
+
+
+class QualityReport:
+    """Violation counts and sample row ids per rule, accumulated over chunks."""
+
+    def __init__(self, rules: Sequence[Rule], samples: int = DEFAULT_SAMPLES) -> None:
+        self.rules = list(rules)
+        self.samples = samples
+        self.rows = 0
+        self.chunks = 0
+        self.seconds = 0.0
+        self.violations = np.zeros(len(self.rules), dtype=np.int64)
+        self.sample_ids: List[List[object]] = [[] for _ in self.rules]
+
+    def add(self, df: pd.DataFrame, ids: Optional[Iterable[object]] = None) -> None:
+        """Evaluate every rule on one chunk; ids label its rows (default: the index)."""
+        masks = evaluate(df, self.rules)
+        counts = masks.sum(axis=1)
+        self.violations += counts
+        self.rows += len(df)
+        self.chunks += 1
+        labels = np.asarray(df.index if ids is None else list(ids), dtype=object)
+        for i in np.flatnonzero(counts):
+            room = self.samples - len(self.sample_ids[i])
+            if room > 0:
+                self.sample_ids[i].extend(labels[np.flatnonzero(masks[i])[:room]].tolist())
+
+    def results(self) -> List[Dict[str, object]]:
+        """One dict per rule: rule, severity, description, violations and sample_row_ids."""
+        return [
+            {
+                "rule": rule.name,
+                "severity": rule.severity,
+                "description": rule.description,
+                "violations": int(count),
+                "sample_row_ids": ids,
+            }
+            for rule, count, ids in zip(self.rules, self.violations, self.sample_ids)
+        ]
+
+    def failures(self, severity: Optional[str] = None) -> List[Dict[str, object]]:
+        """Results with at least one violation, optionally of one severity."""
+        return [
+            r for r in self.results()
+            if r["violations"] and (severity is None or r["severity"] == severity)
+        ]
+
+    def raise_for_errors(self, noun: str = "rows") -> None:
+        """Raise ValueError naming every error-severity rule that has violations."""
+        errors = self.failures("error")
+        if errors:
+            raise ValueError("; ".join(f"Found {r['violations']} {noun} with {r['description']}" for r in errors))
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.results())
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"rows": self.rows, "chunks": self.chunks, "seconds": self.seconds, "results": self.results()}
+
+
+def check_frame(df: pd.DataFrame, rules: Sequence[Rule], samples: int = DEFAULT_SAMPLES) -> QualityReport:
+    """Evaluate rules against an in-memory frame."""
+    start = time.perf_counter()
+    report = QualityReport(rules, samples)
+    report.add(df)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def check_orders(
+    db: str = DB,
+    rules: Sequence[Rule] = ORDER_RULES,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    samples: int = DEFAULT_SAMPLES,
+) -> QualityReport:
+    """Stream orders in chunks and evaluate rules on every row; sample ids are orders rowids."""
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    columns = list(dict.fromkeys(column for rule in rules for column in rule.columns))
+    start = time.perf_counter()
+    report = QualityReport(rules, samples)
+    con = open_readonly(db)
+    try:
+        if not con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='orders'").fetchone():
+            raise ValueError("Table 'orders' not found. Please run sql/10_load_clean.sql first.")
+        sql = f"SELECT rowid AS row_id{''.join(', ' + c for c in columns)} FROM orders"
+        for chunk in pd.read_sql_query(sql, con, chunksize=chunk_size):
+            report.add(chunk, chunk["row_id"])
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        raise RuntimeError(f"Data quality scan failed: {e}") from e
+    finally:
+        con.close()
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def format_report(report: QualityReport) -> str:
+    """One line per rule that has violations."""
+    marks = {"error": "✗", "warning": "⚠️ "}
+    lines = [
+        f"  {marks[r['severity']]} {r['rule']}: {r['violations']:,} rows with {r['description']}"
+        f" (e.g. row ids {', '.join(str(i) for i in r['sample_row_ids'])})"
+        for r in report.failures()
+    ]
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Check every row of orders against the data-quality rules.")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="sample row ids kept per rule")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        report = check_orders(args.db, chunk_size=args.chunk_size, samples=args.samples)
+        if args.json:
+            print(json.dumps(report.to_dict(), indent=2))
+        else:
+            print(f"  ✓ {report.rows:,} order rows checked against {len(report.rules)} rules in {report.seconds:.2f}s")
+            if report.failures():
+                print(format_report(report))
+        report.raise_for_errors()
+    except (FileNotFoundError, ValueError, RuntimeError) as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
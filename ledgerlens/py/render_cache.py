@@ -0,0 +1,66 @@
+"""Content-hash cache that lets charts.py skip unchanged CSVs and PNGs.
+
+Each output directory keeps a manifest mapping artifact file names to the
+fingerprint of the inputs that produced them: the exported DataFrame's
+values plus any rendering parameters. An artifact whose fingerprint matches
+the manifest, and which still exists on disk, is not rewritten, so
+unchanged files keep their mtimes and the frontend build cache stays warm.
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+
+MANIFEST_NAME = ".render-manifest.json"
+
+
+def frame_fingerprint(df: pd.DataFrame, *params: object) -> str:
+    """Hash a DataFrame's columns, dtypes and values together with extra parameters."""
+    digest = hashlib.sha256()
+    digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    for param in params:
+        digest.update(b"\0")
+        digest.update(repr(param).encode())
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Manifest of artifact fingerprints for one output directory."""
+
+    def __init__(self, directory: Path, enabled: bool = True) -> None:
+        self.directory = Path(directory)
+        self.path = self.directory / MANIFEST_NAME
+        self.enabled = enabled
+        self.hits: List[str] = []
+        self.misses: List[str] = []
+        self.entries: Dict[str, str] = {}
+        if enabled and self.path.exists():
+            try:
+                self.entries = json.loads(self.path.read_text())
+            except (OSError, ValueError):
+                self.entries = {}  # A corrupt manifest just means a full re-render
+
+    def is_fresh(self, filename: str, fingerprint: str) -> bool:
+        """True when the artifact exists and was built from the same inputs. Counts hits and misses."""
+        fresh = (
+            self.enabled
+            and self.entries.get(filename) == fingerprint
+            and (self.directory / filename).exists()
+        )
+        (self.hits if fresh else self.misses).append(filename)
+        return fresh
+
+    def record(self, filename: str, fingerprint: str) -> None:
+        """Remember the fingerprint of a freshly written artifact."""
+        self.entries[filename] = fingerprint
+
+    def save(self) -> None:
+        """Write the manifest back to disk."""
+        if self.enabled:
+            self.path.write_text(json.dumps(self.entries, indent=2, sort_keys=True))
+
+    def summary(self) -> str:
+        return f"{len(self.hits)} cached, {len(self.misses)} written"
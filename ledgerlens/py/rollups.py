@@ -0,0 +1,324 @@
+"""Compute all four dashboard datasets from a single streaming scan of orders.
+
+The plain views each re-scan orders, so exporting them one after another
+reads the fact table four times. compute_rollups() reads it once in chunks,
+folds every chunk into the monthly, country, customer and SKU partial
+aggregates, and derives frames with the same columns and semantics as
+v_orders_month, v_country_summary, v_top_customers and v_sku_abc. Dates
+are read as YYYYMMDD integers and every distinct count is a vectorized
+nunique() over one deduplicated (month, country, invoice, customer) frame.
+
+compute_rollups_parallel() splits the same scan into rowid ranges, folds
+each range in a worker process over its own read-only connection, and
+merges the partial accumulators. Sums merge by adding and the distinct
+key frames by concatenating and deduplicating, so the results are exact.
+"""
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from connections import open_readonly
+from profiling import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+
+DEFAULT_CHUNK_SIZE = 200_000
+TOP_CUSTOMERS = 50
+
+# order_date comes back as a YYYYMMDD integer: min/max and month bucketing
+# (day // 100) are then integer operations instead of string comparisons
+SCAN_SQL = """
+SELECT invoice_no, CAST(replace(order_date, '-', '') AS INTEGER) AS day, customer_id, sku, qty,
+       country, is_export, gross_revenue, gross_profit
+FROM orders
+"""
+PARTITION_SQL = SCAN_SQL + "WHERE rowid BETWEEN ? AND ?\n"
+
+_SUMS = {"units": "sum", "revenue": "sum", "gross_profit": "sum", "lines": "sum"}
+_MONTH = {**_SUMS, "month_start": "min", "revenue_domestic": "sum", "revenue_export": "sum"}
+_COUNTRY = _SUMS
+_CUSTOMER = {**_SUMS, "first_order_date": "min", "last_order_date": "max"}
+_SKU = {"units": "sum", "revenue": "sum", "gross_profit": "sum"}
+# The distinct (month, country, invoice, customer) tuples every COUNT(DISTINCT) is derived from
+_KEYS = ["month", "country", "invoice_no", "customer_id"]
+
+
+def _combine(parts: List[pd.DataFrame], how: Dict[str, str]) -> pd.DataFrame:
+    """Reduce per-chunk partial aggregates to one frame with a single groupby."""
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts).groupby(level=0, dropna=False, sort=False).agg(how)
+
+
+def _distinct_keys(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    return pd.concat(parts, ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def _date_labels(days: pd.Series) -> pd.Series:
+    """YYYYMMDD integers back to 'YYYY-MM-DD' strings (missing stays missing)."""
+    text = days.astype("Int64").astype(str)
+    return (text.str[:4] + "-" + text.str[4:6] + "-" + text.str[6:8]).where(days.notna(), None)
+
+
+def _month_labels(months: pd.Index) -> pd.Index:
+    """YYYYMM integers back to 'YYYY-MM' strings (missing stays missing)."""
+    text = pd.Series(months).astype("Int64").astype(str)
+    return pd.Index((text.str[:4] + "-" + text.str[4:6]).where(pd.Series(months).notna(), None))
+
+
+def pct_change(current: pd.Series, previous: pd.Series) -> pd.Series:
+    """(current - previous) / previous, NULL when previous is missing or zero."""
+    return ((current - previous) / previous).where(previous.notna() & (previous != 0))
+
+
+class _Accumulator:
+    """Running partial aggregates for one scan of orders.
+
+    add() appends each chunk's grouped sums and its deduplicated key tuples;
+    compact() reduces those lists, so partials from other chunks or worker
+    processes merge by concatenating and grouping once more.
+    """
+
+    def __init__(self) -> None:
+        self.parts: Dict[str, List[pd.DataFrame]] = {
+            "month": [], "country": [], "customer": [], "sku": [], "keys": [],
+        }
+
+    @property
+    def empty(self) -> bool:
+        return not self.parts["month"]
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        if chunk.empty:
+            return
+        chunk = chunk.assign(
+            month=chunk["day"] // 100,
+            units=chunk["qty"],
+            revenue=chunk["gross_revenue"],
+            lines=1,
+            revenue_domestic=chunk["gross_revenue"].where(chunk["is_export"] == 0, 0.0),
+            revenue_export=chunk["gross_revenue"].where(chunk["is_export"] == 1, 0.0),
+        )
+        self.parts["month"].append(chunk.groupby("month", dropna=False, sort=False).agg(
+            units=("units", "sum"),
+            revenue=("revenue", "sum"),
+            gross_profit=("gross_profit", "sum"),
+            lines=("lines", "sum"),
+            month_start=("day", "min"),
+            revenue_domestic=("revenue_domestic", "sum"),
+            revenue_export=("revenue_export", "sum"),
+        ))
+        self.parts["country"].append(chunk.groupby("country", dropna=False, sort=False)[list(_SUMS)].sum())
+        self.parts["sku"].append(
+            chunk.groupby("sku", dropna=False, sort=False)[["units", "revenue", "gross_profit"]].sum()
+        )
+        self.parts["customer"].append(chunk[chunk["customer_id"].notna()].groupby("customer_id", sort=False).agg(
+            units=("units", "sum"),
+            revenue=("revenue", "sum"),
+            gross_profit=("gross_profit", "sum"),
+            lines=("lines", "sum"),
+            first_order_date=("day", "min"),
+            last_order_date=("day", "max"),
+        ))
+        self.parts["keys"].append(chunk[_KEYS].drop_duplicates())
+
+    def compact(self) -> "_Accumulator":
+        """Reduce every list of partials to a single frame."""
+        if not self.empty:
+            for name, how in [("month", _MONTH), ("country", _COUNTRY), ("customer", _CUSTOMER), ("sku", _SKU)]:
+                self.parts[name] = [_combine(self.parts[name], how)]
+            self.parts["keys"] = [_distinct_keys(self.parts["keys"])]
+        return self
+
+    def merge(self, other: "_Accumulator") -> None:
+        """Fold another accumulator, e.g. one partition's, into this one."""
+        for name, parts in other.parts.items():
+            self.parts[name].extend(parts)
+
+    def _distinct(self, by: str, column: str, index: pd.Index) -> np.ndarray:
+        """COUNT(DISTINCT column) per value of by, aligned to index."""
+        keys = self.parts["keys"][0]
+        if by == "customer_id":
+            keys = keys[keys["customer_id"].notna()]
+        counts = keys.groupby(by, dropna=False, sort=False)[column].nunique()
+        return counts.reindex(index, fill_value=0).to_numpy(dtype="int64")
+
+    def monthly(self) -> pd.DataFrame:
+        """Equivalent of SELECT * FROM v_orders_month ORDER BY ym."""
+        m = self.parts["month"][0].sort_index()
+        df = pd.DataFrame({
+            "ym": _month_labels(m.index),
+            "month_start": _date_labels(m["month_start"]).to_numpy(),
+            "orders": self._distinct("month", "invoice_no", m.index),
+            "buyers": self._distinct("month", "customer_id", m.index),
+            "units": m["units"].to_numpy(),
+            "revenue": m["revenue"].to_numpy(),
+            "gross_profit": m["gross_profit"].to_numpy(),
+            "aov": (m["revenue"] / m["lines"]).to_numpy(),
+            "revenue_domestic": m["revenue_domestic"].to_numpy(),
+            "revenue_export": m["revenue_export"].to_numpy(),
+        })
+        df["gross_margin_pct"] = (df["gross_profit"] / df["revenue"]).where(df["revenue"] != 0)
+        df["revenue_prev"] = df["revenue"].shift()
+        df["gross_profit_prev"] = df["gross_profit"].shift()
+        df["aov_prev"] = df["aov"].shift()
+        df["buyers_prev"] = df["buyers"].shift()
+        df["revenue_mom_pct"] = pct_change(df["revenue"], df["revenue_prev"])
+        df["gross_profit_mom_pct"] = pct_change(df["gross_profit"], df["gross_profit_prev"])
+        df["aov_mom_pct"] = pct_change(df["aov"], df["aov_prev"])
+        # buyers are integers, so SQLite divides with truncation toward zero
+        df["buyers_mom_pct"] = np.trunc(pct_change(df["buyers"], df["buyers_prev"]))
+        return df[[
+            "ym", "month_start", "orders", "buyers", "units", "revenue", "revenue_prev", "revenue_mom_pct",
+            "gross_profit", "gross_profit_prev", "gross_profit_mom_pct", "gross_margin_pct", "aov", "aov_prev",
+            "aov_mom_pct", "buyers_prev", "buyers_mom_pct", "revenue_domestic", "revenue_export",
+        ]]
+
+    def country_summary(self) -> pd.DataFrame:
+        """Equivalent of SELECT * FROM v_country_summary."""
+        c = self.parts["country"][0]
+        df = pd.DataFrame({
+            "country": c.index,
+            "orders": self._distinct("country", "invoice_no", c.index),
+            "buyers": self._distinct("country", "customer_id", c.index),
+            "units": c["units"].to_numpy(),
+            "revenue": c["revenue"].to_numpy(),
+            "gross_profit": c["gross_profit"].to_numpy(),
+            "aov": (c["revenue"] / c["lines"]).to_numpy(),
+        })
+        df["gross_margin_pct"] = (df["gross_profit"] / df["revenue"]).where(df["revenue"] != 0)
+        total = df["revenue"].sum()
+        df["revenue_share"] = df["revenue"] / total if total else np.nan
+        df = df.sort_values("revenue", ascending=False, kind="stable").reset_index(drop=True)
+        return df[["country", "orders", "buyers", "units", "revenue", "gross_profit", "gross_margin_pct", "aov", "revenue_share"]]
+
+    def top_customers(self, limit: int = TOP_CUSTOMERS) -> pd.DataFrame:
+        """Equivalent of SELECT * FROM v_top_customers."""
+        c = self.parts["customer"][0]
+        df = pd.DataFrame({
+            "customer_id": c.index,
+            "orders": self._distinct("customer_id", "invoice_no", c.index),
+            "units": c["units"].to_numpy(),
+            "revenue": c["revenue"].to_numpy(),
+            "gross_profit": c["gross_profit"].to_numpy(),
+            "avg_order_value": (c["revenue"] / c["lines"]).to_numpy(),
+            "first_order_date": _date_labels(c["first_order_date"]).to_numpy(),
+            "last_order_date": _date_labels(c["last_order_date"]).to_numpy(),
+        })
+        df = df.sort_values("revenue", ascending=False, kind="stable").head(limit).reset_index(drop=True)
+        first = pd.to_datetime(df["first_order_date"], errors="coerce")
+        last = pd.to_datetime(df["last_order_date"], errors="coerce")
+        df["active_days"] = (last - first).dt.days.astype("float64") + 1
+        df["revenue_per_active_month"] = (df["revenue"] / (df["active_days"] / 30.0)).where(df["active_days"] > 0)
+        df["revenue_rank"] = np.arange(1, len(df) + 1, dtype="int64")
+        return df
+
+    def sku_abc(self) -> pd.DataFrame:
+        """Equivalent of SELECT * FROM v_sku_abc ORDER BY revenue DESC."""
+        s = self.parts["sku"][0]
+        df = pd.DataFrame({
+            "sku": s.index,
+            "units": s["units"].to_numpy(),
+            "revenue": s["revenue"].to_numpy(),
+            "gross_profit": s["gross_profit"].to_numpy(),
+        }).sort_values("revenue", ascending=False, kind="stable").reset_index(drop=True)
+        total = df["revenue"].sum()
+        # SUM() OVER (ORDER BY revenue DESC) gives tied revenues the same running total
+        running = df["revenue"].cumsum().groupby(df["revenue"], sort=False).transform("max")
+        df["revenue_share"] = df["revenue"] / total if total else np.nan
+        df["cum_share"] = running / total if total else np.nan
+        df["abc_class"] = np.select([df["cum_share"] <= 0.80, df["cum_share"] <= 0.95], ["A", "B"], "C")
+        return df
+
+
+def _frames(acc: _Accumulator) -> Dict[str, pd.DataFrame]:
+    if acc.empty:
+        raise ValueError("orders table returned no data")
+    acc.compact()
+    return {
+        "monthly": acc.monthly(),
+        "country": acc.country_summary(),
+        "customers": acc.top_customers(),
+        "sku": acc.sku_abc(),
+    }
+
+
+def compute_rollups(
+    db: str = DB,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    con: Optional[sqlite3.Connection] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Scan orders once and return the monthly, country, customers and sku frames.
+
+    The scan runs on con when given, otherwise on a read-only connection to db.
+    """
+    acc = _Accumulator()
+    own = con is None
+    try:
+        if own:
+            con = open_readonly(db)
+        for chunk in pd.read_sql_query(SCAN_SQL, con, chunksize=chunk_size):
+            acc.add(chunk)
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        raise RuntimeError(f"Database query failed: {e}") from e
+    finally:
+        if own and con is not None:
+            con.close()
+    return _frames(acc)
+
+
+def partition_ranges(db: str, partitions: int) -> List[Tuple[int, int]]:
+    """Split orders' rowid span into at most `partitions` contiguous (lo, hi) ranges."""
+    if partitions <= 0:
+        raise ValueError(f"partitions must be positive, got {partitions}")
+    with connect(db) as con:
+        lo, hi = con.execute("SELECT MIN(rowid), MAX(rowid) FROM orders").fetchone()
+    if lo is None:
+        return []
+    step = -(-(hi - lo + 1) // partitions)  # ceiling division
+    return [(start, min(start + step - 1, hi)) for start in range(lo, hi + 1, step)]
+
+
+def _scan_partition(db: str, lo: int, hi: int, chunk_size: int) -> _Accumulator:
+    """Worker: aggregate one rowid range over a read-only connection.
+
+    The accumulator is compacted before it is pickled back, so the parent
+    receives one small pre-aggregated frame per dataset, not per chunk.
+    """
+    acc = _Accumulator()
+    con = open_readonly(db)
+    try:
+        for chunk in pd.read_sql_query(PARTITION_SQL, con, params=(lo, hi), chunksize=chunk_size):
+            acc.add(chunk)
+    finally:
+        con.close()
+    return acc.compact()
+
+
+def compute_rollups_parallel(
+    db: str = DB,
+    jobs: int = 2,
+    partitions: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Dict[str, pd.DataFrame]:
+    """Like compute_rollups(), but scan rowid partitions in `jobs` worker processes.
+
+    partitions defaults to jobs; more partitions than jobs evens out skew.
+    """
+    if jobs <= 0:
+        raise ValueError(f"jobs must be positive, got {jobs}")
+    acc = _Accumulator()
+    try:
+        ranges = partition_ranges(db, partitions or jobs)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(_scan_partition, db, lo, hi, chunk_size) for lo, hi in ranges]
+            for future in futures:
+                acc.merge(future.result())
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Database query failed: {e}") from e
+    return _frames(acc)
@@ -0,0 +1,341 @@
+"""Approximate distinct counts from mergeable HyperLogLog sketches.
+
+COUNT(DISTINCT invoice_no) and COUNT(DISTINCT customer_id) are the expensive
+part of v_orders_month and v_country_summary, and an exact distinct count
+cannot be updated from new rows alone. This module keeps one HyperLogLog
+sketch per month and per country for orders and buyers in the hll_sketch
+table (sql/35_sketches.sql). refresh_sketches() folds only orders rows past
+its etl_state watermark into the stored sketches, and because sketches merge
+by taking register maxima, distinct counts over any set of months or
+countries come from merging sketches rather than re-scanning orders.
+
+The error bound is the standard error of the estimate (1.04 / sqrt(m) for m
+registers); changing it rebuilds the sketches at the new precision.
+"""
+import argparse
+import math
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from etl_state import STATE_DDL, decide_mode, get_state, record_watermark, set_state
+from profiling import connect
+from rollups import pct_change
+
+ROOT = Path(__file__).resolve().parent.parent
+DB = str(ROOT / "db" / "ledgerlens.db")
+SKETCHES_SQL = ROOT / "sql" / "35_sketches.sql"
+
+STATE = "hll_orders"  # etl_state prefix: hll_orders_rowid, hll_orders_generation
+PRECISION = "hll_precision"
+
+DEFAULT_ERROR = 0.02
+MIN_PRECISION, MAX_PRECISION = 4, 16
+DEFAULT_CHUNK_SIZE = 200_000
+
+DIMENSIONS = {"month": "order_month", "country": "country"}
+METRICS = {"orders": "invoice_no", "buyers": "customer_id"}
+
+MONTH_SUMS_SQL = """
+SELECT
+  order_month AS ym,
+  MIN(order_date) AS month_start,
+  SUM(qty) AS units,
+  SUM(gross_revenue) AS revenue,
+  SUM(gross_profit) AS gross_profit,
+  AVG(gross_revenue) AS aov,
+  SUM(CASE WHEN is_export = 0 THEN gross_revenue ELSE 0 END) AS revenue_domestic,
+  SUM(CASE WHEN is_export = 1 THEN gross_revenue ELSE 0 END) AS revenue_export
+FROM orders
+GROUP BY order_month
+ORDER BY order_month
+"""
+
+COUNTRY_SUMS_SQL = """
+SELECT
+  country,
+  SUM(qty) AS units,
+  SUM(gross_revenue) AS revenue,
+  SUM(gross_profit) AS gross_profit,
+  AVG(gross_revenue) AS aov
+FROM orders
+GROUP BY country
+"""
+
+
+def precision_for_error(error: float) -> int:
+    """Smallest register-count exponent whose standard error is at most error."""
+    if not 0 < error < 1:
+        raise ValueError(f"error must be between 0 and 1, got {error}")
+    precision = math.ceil(math.log2((1.04 / error) ** 2))
+    return min(max(precision, MIN_PRECISION), MAX_PRECISION)
+
+
+def hash_values(values: Iterable[object]) -> np.ndarray:
+    """Stable 64-bit hashes of values (compared by their string form)."""
+    array = np.asarray(pd.Series(values, dtype=object).astype(str), dtype=object)
+    return pd.util.hash_array(array, categorize=False)
+
+
+def _leading_zeros(x: np.ndarray) -> np.ndarray:
+    """Count leading zero bits of each uint64 (64 for zero)."""
+    x = x.astype(np.uint64, copy=True)
+    zeros = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        empty = (x >> np.uint64(64 - shift)) == 0
+        zeros += np.where(empty, shift, 0)
+        x = np.where(empty, x << np.uint64(shift), x)
+    zeros += (x == 0).astype(np.int64)  # 63 zeros found above plus the final bit
+    return zeros
+
+
+def register_updates(hashes: np.ndarray, precision: int):
+    """Split hashes into (register index, rank) pairs."""
+    hashes = hashes.astype(np.uint64, copy=False)
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+    rank = np.minimum(_leading_zeros(rest) - precision + 1, 64 - precision + 1)
+    return index, rank.astype(np.uint8)
+
+
+class HyperLogLog:
+    """A HyperLogLog sketch with 2**precision one-byte registers."""
+
+    def __init__(self, precision: int, registers: Optional[np.ndarray] = None) -> None:
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}, got {precision}")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8) if registers is None else registers
+
+    @classmethod
+    def for_error(cls, error: float) -> "HyperLogLog":
+        return cls(precision_for_error(error))
+
+    @classmethod
+    def from_bytes(cls, precision: int, blob: bytes) -> "HyperLogLog":
+        return cls(precision, np.frombuffer(blob, dtype=np.uint8).copy())
+
+    def to_bytes(self) -> bytes:
+        return self.registers.tobytes()
+
+    @property
+    def standard_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, values: Iterable[object]) -> None:
+        """Add values to the sketch."""
+        index, rank = register_updates(hash_values(values), self.precision)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Return the sketch of the union of both inputs."""
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge sketches of precision {self.precision} and {other.precision}")
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    def count(self) -> int:
+        """Estimated number of distinct values added."""
+        m = self.m
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+
+def _fold_chunk(sketches: Dict[tuple, HyperLogLog], chunk: pd.DataFrame, precision: int, touched: Set[tuple]) -> None:
+    """Add one chunk of orders to the per-key sketches of every dimension and metric, noting the keys in touched."""
+    for metric, column in METRICS.items():
+        values = chunk[column]
+        named = values.notna()  # COUNT(DISTINCT) ignores NULLs
+        index, rank = register_updates(hash_values(values[named]), precision)
+        for dimension, key_column in DIMENSIONS.items():
+            keys = chunk.loc[named, key_column].to_numpy()
+            has_key = pd.notna(keys)
+            codes, uniques = pd.factorize(keys[has_key])
+            if not len(uniques):
+                continue
+            block = np.stack([
+                sketches.setdefault((dimension, str(key), metric), HyperLogLog(precision)).registers
+                for key in uniques
+            ])
+            np.maximum.at(block, (codes, index[has_key]), rank[has_key])
+            for row, key in enumerate(uniques):
+                sketches[(dimension, str(key), metric)].registers = block[row]
+                touched.add((dimension, str(key), metric))
+
+
+def refresh_sketches(
+    db: str = DB,
+    error: float = DEFAULT_ERROR,
+    full: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Dict[str, object]:
+    """Fold new orders rows into the stored sketches. Returns mode, rows, precision and seconds.
+
+    A full rebuild happens on the first run, after orders was rebuilt, or
+    when error maps to a different precision than the stored sketches.
+    """
+    if not Path(db).exists():
+        raise FileNotFoundError(f"Database not found: {db}. Please run SQL setup scripts first.")
+    precision = precision_for_error(error)
+
+    start = time.perf_counter()
+    con = connect(db, isolation_level=None)
+    try:
+        if not con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='orders'").fetchone():
+            raise ValueError("Table 'orders' not found. Please run sql/10_load_clean.sql first.")
+        con.execute(STATE_DDL)
+        plan = decide_mode(con, STATE, tables=("hll_sketch",), full=full or get_state(con, PRECISION) != precision)
+        if plan.mode == "fresh":
+            return {"mode": "fresh", "rows": 0, "precision": precision, "seconds": time.perf_counter() - start}
+
+        # A full rebuild starts from empty sketches; the table is recreated when they are written
+        sketches: Dict[tuple, HyperLogLog] = {}
+        if plan.mode == "incremental":
+            sketches = {
+                (dimension, key, metric): HyperLogLog.from_bytes(precision, blob)
+                for dimension, key, metric, blob in con.execute(
+                    "SELECT dimension, key, metric, registers FROM hll_sketch"
+                )
+            }
+        columns = sorted(set(DIMENSIONS.values()) | set(METRICS.values()))
+        scan = f"SELECT {', '.join(columns)} FROM orders WHERE rowid > ? AND rowid <= ?"
+        rows = 0
+        touched: Set[tuple] = set()
+        for chunk in pd.read_sql_query(scan, con, params=(plan.lo, plan.hi), chunksize=chunk_size):
+            _fold_chunk(sketches, chunk, precision, touched)
+            rows += len(chunk)
+
+        # executescript() commits any open transaction first, but a BEGIN inside the
+        # script stays open, so a full rebuild's DROP/CREATE rolls back with the registers
+        if plan.mode == "full":
+            con.executescript("BEGIN IMMEDIATE;" + SKETCHES_SQL.read_text())
+        else:
+            con.execute("BEGIN IMMEDIATE")
+        try:
+            # Only the months and countries the delta touched have new registers
+            con.executemany(
+                "INSERT OR REPLACE INTO hll_sketch(dimension, key, metric, registers) VALUES (?, ?, ?, ?)",
+                [(*key, sketches[key].to_bytes()) for key in sorted(touched)],
+            )
+            record_watermark(con, STATE, plan.hi)
+            set_state(con, PRECISION, precision)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Sketch refresh failed: {e}") from e
+    finally:
+        con.close()
+
+    return {"mode": plan.mode, "rows": rows, "precision": precision, "seconds": time.perf_counter() - start}
+
+
+def load_sketches(con: sqlite3.Connection, dimension: str, metric: str) -> Dict[str, HyperLogLog]:
+    """Stored sketches for one dimension and metric, keyed by month or country."""
+    precision = get_state(con, PRECISION)
+    if precision is None:
+        raise ValueError("No sketches found. Run sketches.py (or refresh_sketches()) first.")
+    return {
+        key: HyperLogLog.from_bytes(precision, blob)
+        for key, blob in con.execute(
+            "SELECT key, registers FROM hll_sketch WHERE dimension=? AND metric=?", (dimension, metric)
+        )
+    }
+
+
+def approx_distinct(db: str, dimension: str, metric: str, keys: Optional[Iterable[str]] = None) -> int:
+    """Approximate distinct orders or buyers across several months or countries (all when keys is None)."""
+    if dimension not in DIMENSIONS or metric not in METRICS:
+        raise ValueError(f"Unknown sketch {dimension}/{metric}")
+    with connect(db) as con:
+        sketches = load_sketches(con, dimension, metric)
+    selected = list(sketches.values()) if keys is None else [sketches[k] for k in keys if k in sketches]
+    if not selected:
+        return 0
+    merged = selected[0]
+    for sketch in selected[1:]:
+        merged = merged.merge(sketch)
+    return merged.count()
+
+
+def _counts(sketches: Dict[str, HyperLogLog], keys: pd.Series) -> np.ndarray:
+    return np.array([sketches[k].count() if k in sketches else 0 for k in keys], dtype="int64")
+
+
+def approx_monthly(db: str = DB) -> pd.DataFrame:
+    """v_orders_month with orders, buyers and the buyer growth columns estimated from sketches."""
+    with connect(db) as con:
+        df = pd.read_sql_query(MONTH_SUMS_SQL, con)
+        orders = load_sketches(con, "month", "orders")
+        buyers = load_sketches(con, "month", "buyers")
+    df["orders"] = _counts(orders, df["ym"])
+    df["buyers"] = _counts(buyers, df["ym"])
+    df["gross_margin_pct"] = (df["gross_profit"] / df["revenue"]).where(df["revenue"] != 0)
+    df["revenue_prev"] = df["revenue"].shift()
+    df["gross_profit_prev"] = df["gross_profit"].shift()
+    df["aov_prev"] = df["aov"].shift()
+    df["buyers_prev"] = df["buyers"].shift()
+    df["revenue_mom_pct"] = pct_change(df["revenue"], df["revenue_prev"])
+    df["gross_profit_mom_pct"] = pct_change(df["gross_profit"], df["gross_profit_prev"])
+    df["aov_mom_pct"] = pct_change(df["aov"], df["aov_prev"])
+    # Same integer-division semantics as the view
+    df["buyers_mom_pct"] = np.trunc(pct_change(df["buyers"], df["buyers_prev"]))
+    return df[[
+        "ym", "month_start", "orders", "buyers", "units", "revenue", "revenue_prev", "revenue_mom_pct",
+        "gross_profit", "gross_profit_prev", "gross_profit_mom_pct", "gross_margin_pct", "aov", "aov_prev",
+        "aov_mom_pct", "buyers_prev", "buyers_mom_pct", "revenue_domestic", "revenue_export",
+    ]]
+
+
+def approx_country_summary(db: str = DB) -> pd.DataFrame:
+    """v_country_summary with orders and buyers estimated from sketches."""
+    with connect(db) as con:
+        df = pd.read_sql_query(COUNTRY_SUMS_SQL, con)
+        orders = load_sketches(con, "country", "orders")
+        buyers = load_sketches(con, "country", "buyers")
+    df["orders"] = _counts(orders, df["country"])
+    df["buyers"] = _counts(buyers, df["country"])
+    df["gross_margin_pct"] = (df["gross_profit"] / df["revenue"]).where(df["revenue"] != 0)
+    total = df["revenue"].sum()
+    df["revenue_share"] = df["revenue"] / total if total else np.nan
+    df = df.sort_values("revenue", ascending=False, kind="stable").reset_index(drop=True)
+    return df[["country", "orders", "buyers", "units", "revenue", "gross_profit", "gross_margin_pct", "aov", "revenue_share"]]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Refresh and query HyperLogLog distinct-count sketches.")
+    parser.add_argument("--db", default=DB, help="SQLite database path")
+    parser.add_argument("--error", type=float, default=DEFAULT_ERROR, help="target standard error (e.g. 0.02 = 2%%)")
+    parser.add_argument("--full", action="store_true", help="rebuild the sketches from all of orders")
+    parser.add_argument("--months", help="comma-separated months (YYYY-MM) to report distinct orders and buyers across")
+    args = parser.parse_args(argv)
+
+    try:
+        result = refresh_sketches(args.db, args.error, full=args.full)
+        print(
+            f"  ✓ sketches {result['mode']} refresh: {result['rows']:,} order rows "
+            f"(precision {result['precision']}) in {result['seconds']:.2f}s"
+        )
+        if args.months:
+            months = [m.strip() for m in args.months.split(",")]
+            orders = approx_distinct(args.db, "month", "orders", months)
+            buyers = approx_distinct(args.db, "month", "buyers", months)
+            print(f"  ✓ {', '.join(months)}: ~{orders:,} orders, ~{buyers:,} buyers")
+    except (FileNotFoundError, ValueError, RuntimeError) as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""Shared fixtures: a small raw CSV and a database built from the real SQL scripts."""
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tests.sample_data import make_raw_rows, run_sql, write_csv
+
+
+@pytest.fixture
+def raw_csv(tmp_path):
+    """Path to a small raw e-commerce CSV."""
+    return write_csv(tmp_path / "ecommerce.csv", make_raw_rows())
+
+
+@pytest.fixture
+def built_db(tmp_path, raw_csv):
+    """Database with orders_raw, orders and the analytical views."""
+    from ingest import ingest_csv
+
+    db = str(tmp_path / "ledgerlens.db")
+    ingest_csv(raw_csv, db, chunk_size=50, reset=True)
+    run_sql(db, "10_load_clean.sql")
+    run_sql(db, "20_views.sql")
+    return db
@@ -0,0 +1,44 @@
+"""Synthetic orders_raw data and SQL helpers shared by the tests."""
+import csv
+import random
+import sqlite3
+from pathlib import Path
+
+SQL_DIR = Path(__file__).resolve().parent.parent.parent / "sql"
+
+HEADER = ["InvoiceNo", "StockCode", "Description", "Quantity", "InvoiceDate", "UnitPrice", "CustomerID", "Country"]
+COUNTRIES = ["United Kingdom", "United Kingdom", "United Kingdom", "France", "Germany", "EIRE"]
+
+
+def make_raw_rows(n_invoices: int = 120, seed: int = 7, start_month: int = 1, months: int = 4):
+    """Build orders_raw-shaped rows, including cancellations and anonymous buyers."""
+    rng = random.Random(seed)
+    rows = []
+    for inv in range(n_invoices):
+        month = start_month + inv % months
+        year = 2010 + (month - 1) // 12
+        month = (month - 1) % 12 + 1
+        day = rng.randint(1, 28)
+        ts = f"{month}/{day}/{year} {rng.randint(6, 20)}:{rng.randint(0, 59):02d}"
+        invoice = f"{'C' if inv % 17 == 0 else ''}{536000 + inv}"
+        customer = "" if inv % 11 == 0 else str(12000 + rng.randint(0, 30))
+        country = rng.choice(COUNTRIES)
+        for _ in range(rng.randint(1, 4)):
+            sku = rng.choice(["85123a", "71053", "84406B", "POST", "22423", "DOT", "21730"])
+            qty = rng.randint(1, 24) if inv % 13 else -rng.randint(1, 5)
+            price = rng.choice([0.85, 1.25, 2.55, 3.39, 7.65, 18.0])
+            rows.append([invoice, sku, f"item {sku}", str(qty), ts, str(price), customer, country])
+    return rows
+
+
+def write_csv(path: Path, rows) -> Path:
+    with open(path, "w", newline="", encoding="latin-1") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+    return path
+
+
+def run_sql(db: str, name: str) -> None:
+    with sqlite3.connect(db) as con:
+        con.executescript((SQL_DIR / name).read_text())
@@ -0,0 +1,141 @@
+"""Tests for the incremental SKU ABC engine."""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from abc_engine import (
+    SkuRevenue,
+    classify_skus,
+    load_sku_revenue,
+    refresh_sku_revenue,
+    sku_engine,
+    with_sku_engine,
+)
+from clean import full_rebuild, refresh_orders
+from ingest import ingest_csv
+from tests.sample_data import make_raw_rows, write_csv
+
+SORT = ["revenue", "sku"]
+
+
+def assert_matches_view(db, actual):
+    with sqlite3.connect(db) as con:
+        expected = pd.read_sql_query("SELECT * FROM v_sku_abc ORDER BY revenue DESC", con)
+    assert list(actual.columns) == list(expected.columns)
+    # Tied revenues may come back in either order
+    actual = actual.sort_values(SORT, ascending=[False, True]).reset_index(drop=True)
+    expected = expected.sort_values(SORT, ascending=[False, True]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+class TestSkuRevenue:
+    """The in-memory array structure."""
+
+    def test_ties_share_running_total(self):
+        """Tied revenues get the running total at the end of the tie, like the window sum."""
+        engine = SkuRevenue()
+        engine.add(pd.DataFrame({
+            "sku": ["a", "b", "c", "d"],
+            "units": [1, 1, 1, 1],
+            "revenue": [50.0, 20.0, 20.0, 10.0],
+            "gross_profit": [5.0, 2.0, 2.0, 1.0],
+        }))
+        df = engine.classify()
+        assert df["sku"].tolist() == ["a", "b", "c", "d"]
+        np.testing.assert_allclose(df["cum_share"], [0.5, 0.9, 0.9, 1.0])
+        assert df["abc_class"].tolist() == ["A", "B", "B", "C"]
+
+    def test_add_accumulates_and_grows(self):
+        """Repeated SKUs add up and new SKUs extend the arrays past their capacity."""
+        engine = SkuRevenue()
+        for start in range(0, 3000, 1000):
+            skus = [f"S{i}" for i in range(start, start + 1000)] + ["S0"]
+            engine.add(pd.DataFrame({"sku": skus, "units": 1, "revenue": 1.0, "gross_profit": 0.5}))
+        assert len(engine) == 3000
+        assert engine.revenue[engine.slots["S0"]] == 4.0
+
+    @pytest.mark.parametrize("limit", [0, 1, 5, 50, 10_000])
+    def test_top_matches_classify(self, limit):
+        """Partial selection returns the same rows as a full classification."""
+        rng = np.random.default_rng(0)
+        engine = SkuRevenue()
+        engine.add(pd.DataFrame({
+            "sku": [f"S{i}" for i in range(500)],
+            "units": 1,
+            "revenue": rng.integers(1, 40, 500).astype(float),  # many ties
+            "gross_profit": 0.0,
+        }))
+        pd.testing.assert_frame_equal(engine.top(limit), engine.classify().head(limit))
+        # Once ranked, top() slices the cached ordering
+        pd.testing.assert_frame_equal(engine.top(limit), engine.classify().head(limit))
+
+
+class TestRefreshSkuRevenue:
+    """The persisted per-SKU totals."""
+
+    def test_full_matches_view(self, built_db):
+        """The first refresh builds totals whose classification equals v_sku_abc."""
+        assert refresh_sku_revenue(built_db)["mode"] == "full"
+        assert refresh_sku_revenue(built_db)["mode"] == "fresh"
+        assert_matches_view(built_db, load_sku_revenue(built_db).classify())
+
+    def test_incremental_matches_view(self, built_db, tmp_path):
+        """Only appended rows are read, and the result still equals the view."""
+        refresh_sku_revenue(built_db)
+        delta = write_csv(tmp_path / "delta.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        ingest_csv(delta, built_db)
+        refresh_orders(built_db)
+        result = refresh_sku_revenue(built_db)
+        assert result["mode"] == "incremental" and result["rows"] > 0
+        assert_matches_view(built_db, classify_skus(built_db))
+
+    def test_rebuilt_orders_forces_full(self, built_db):
+        """A full rebuild of orders invalidates the totals."""
+        refresh_sku_revenue(built_db)
+        full_rebuild(built_db)
+        assert refresh_sku_revenue(built_db)["mode"] == "full"
+        assert_matches_view(built_db, classify_skus(built_db))
+
+
+class TestSkuEngine:
+    """The in-memory engine kept between exports."""
+
+    def test_delta_is_added_in_memory(self, built_db, tmp_path, monkeypatch):
+        """After the first load, new orders are added to the cached arrays without reloading."""
+        import abc_engine
+        refresh_sku_revenue(built_db)
+        engine = sku_engine(built_db)
+        monkeypatch.setattr(abc_engine, "load_sku_revenue", lambda *a, **k: pytest.fail("sku_revenue reloaded"))
+        assert sku_engine(built_db) is engine
+        delta = write_csv(tmp_path / "delta.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        ingest_csv(delta, built_db)
+        refresh_orders(built_db)
+        assert sku_engine(built_db) is engine
+        assert_matches_view(built_db, classify_skus(built_db))
+        pd.testing.assert_frame_equal(classify_skus(built_db, limit=5), engine.classify().head(5))
+
+    def test_reads_hold_the_engine_lock(self, built_db):
+        """with_sku_engine() reads under the lock a concurrent catch-up takes."""
+        import abc_engine
+        assert with_sku_engine(built_db, lambda engine: abc_engine._ENGINES_LOCK.locked())
+        assert not abc_engine._ENGINES_LOCK.locked()
+
+    def test_reads_only(self, built_db):
+        """Without sku_revenue the engine is built from orders, and nothing is written."""
+        from connections import open_readonly
+        con = open_readonly(built_db)
+        try:
+            assert_matches_view(built_db, classify_skus(built_db, con=con))
+        finally:
+            con.close()
+        with sqlite3.connect(built_db) as check:
+            assert not check.execute("SELECT 1 FROM sqlite_master WHERE name='sku_revenue'").fetchone()
+
+    def test_rebuilt_orders_replaces_engine(self, built_db):
+        """A full rebuild of orders restarts rowids, so the cached arrays are replaced."""
+        engine = sku_engine(built_db)
+        full_rebuild(built_db)
+        assert sku_engine(built_db) is not engine
+        assert_matches_view(built_db, classify_skus(built_db))
@@ -0,0 +1,177 @@
+"""Tests for the HTTP query API."""
+import asyncio
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from api import QueryService, ResultCache, build_query, parse_filters
+from clean import refresh_orders
+from ingest import ingest_csv
+from materialize import refresh
+from tests.sample_data import make_raw_rows, write_csv
+
+
+@pytest.fixture
+def service(built_db):
+    svc = QueryService(built_db, cache_size=4)
+    yield svc
+    svc.close()
+
+
+def get(service, target, **headers):
+    status, response_headers, body = asyncio.run(service.handle("GET", target, headers))
+    return status, response_headers, body
+
+
+class TestQueryBuilding:
+    """Parameter validation and SQL generation."""
+
+    def test_parse_filters(self):
+        """Dates are validated and lists are split, trimmed and sorted."""
+        filters = parse_filters({"start": ["2010-01-01"], "country": ["France, EIRE", "EIRE"]})
+        assert filters == {"start": "2010-01-01", "country": ("EIRE", "France")}
+        with pytest.raises(ValueError, match="YYYY-MM-DD"):
+            parse_filters({"end": ["01/02/2010"]})
+
+    def test_filters_are_parameters(self):
+        """Filter values are bound, never interpolated into the SQL."""
+        sql, params = build_query("skus", {"country": ("x'); DROP TABLE orders; --",)})
+        assert "DROP" not in sql
+        assert params == ["x'); DROP TABLE orders; --"]
+
+
+class TestQueryService:
+    """Request handling."""
+
+    def test_monthly_matches_view(self, service, built_db):
+        """Unfiltered monthly aggregates equal the view's columns."""
+        status, headers, body = get(service, "/api/monthly")
+        assert status == 200 and headers["Content-Type"] == "application/json"
+        payload = json.loads(body)
+        with sqlite3.connect(built_db) as con:
+            view = pd.read_sql_query("SELECT ym, orders, buyers, units, revenue FROM v_orders_month ORDER BY ym", con)
+        actual = pd.DataFrame(payload["rows"])[list(view.columns)]
+        pd.testing.assert_frame_equal(actual, view, check_dtype=False)
+        assert payload["total"] == len(view) and payload["next_offset"] is None
+
+    def test_filters_and_pagination(self, service, built_db):
+        """Pages cover the filtered result exactly once, in order."""
+        target = "/api/skus?start=2010-02-01&end=2010-03-31&country=United%20Kingdom,France"
+        rows, offset = [], 0
+        while offset is not None:
+            status, headers, body = get(service, f"{target}&limit=3&offset={offset}")
+            assert status == 200
+            payload = json.loads(body)
+            assert len(payload["rows"]) <= 3
+            rows.extend(payload["rows"])
+            offset = payload["next_offset"]
+        with sqlite3.connect(built_db) as con:
+            expected = con.execute(
+                """
+                SELECT sku, SUM(gross_revenue) FROM orders
+                WHERE order_date BETWEEN '2010-02-01' AND '2010-03-31' AND country IN ('United Kingdom', 'France')
+                GROUP BY sku ORDER BY SUM(gross_revenue) DESC, sku
+                """
+            ).fetchall()
+        assert expected
+        assert [(r["sku"], pytest.approx(r["revenue"])) for r in rows] == expected
+        assert int(headers["X-Total-Count"]) == len(expected)
+
+    def test_cache_and_etag(self, service):
+        """Repeated pages come from the cache, and a matching ETag gets 304."""
+        status, headers, _ = get(service, "/api/countries?limit=2")
+        get(service, "/api/countries?limit=2&offset=2")
+        assert service.cache.misses == 1 and service.cache.hits == 1
+
+        status, _, body = get(service, "/api/countries?limit=2", **{"if-none-match": headers["ETag"]})
+        assert status == 304 and body == b""
+
+    def test_cache_is_bounded_by_bytes(self):
+        """Least recently used frames are evicted once the cached bytes exceed max_bytes."""
+        frame = pd.DataFrame({"x": range(100)})
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        cache = ResultCache(maxsize=10, max_bytes=2 * size)
+        for key in ("a", "b", "c"):
+            cache.put((key,), frame)
+        assert list(cache.entries) == [("b",), ("c",)] and cache.nbytes == 2 * size
+        cache.put(("big",), pd.DataFrame({"x": range(1000)}))
+        assert ("big",) not in cache.entries and cache.nbytes == 2 * size
+
+    def test_new_data_changes_version(self, service, built_db, tmp_path):
+        """Appending orders invalidates ETags and cached results."""
+        _, before, _ = get(service, "/api/monthly")
+        delta = write_csv(tmp_path / "delta.csv", make_raw_rows(20, seed=5, start_month=3, months=2))
+        ingest_csv(delta, built_db)
+        refresh_orders(built_db)
+        status, after, _ = get(service, "/api/monthly", **{"if-none-match": before["ETag"]})
+        assert status == 200
+        assert after["X-Data-Version"] != before["X-Data-Version"]
+
+    def test_weak_etag_matches(self, service):
+        """A weak validator (W/"...") for the same version also gets 304."""
+        _, headers, _ = get(service, "/api/version")
+        status, _, _ = get(service, "/api/version", **{"if-none-match": f"W/{headers['ETag']}"})
+        assert status == 304
+
+    @pytest.mark.parametrize("dataset", ["monthly", "countries", "customers", "skus"])
+    def test_unfiltered_reads_summaries(self, service, built_db, dataset):
+        """Unfiltered results come from the summaries and equal the aggregate over orders."""
+        refresh(built_db)
+        sql, params = build_query(dataset, {})
+        with sqlite3.connect(built_db) as con:
+            expected = pd.read_sql_query(sql, con, params=params)
+        rows, offset = [], 0
+        while offset is not None:
+            status, headers, body = get(service, f"/api/{dataset}?limit=7&offset={offset}")
+            assert status == 200 and int(headers["X-Total-Count"]) == len(expected)
+            payload = json.loads(body)
+            rows.extend(payload["rows"])
+            offset = payload["next_offset"]
+        pd.testing.assert_frame_equal(pd.DataFrame(rows), expected, check_dtype=False)
+        assert not any(t["query"] == f"api:{dataset}" for t in service.connections.timings)
+
+    def test_arrow_format(self, service):
+        """format=arrow returns an Arrow IPC stream of the page."""
+        pa = pytest.importorskip("pyarrow")
+        status, headers, body = get(service, "/api/customers?limit=5&format=arrow")
+        assert status == 200 and headers["Content-Type"] == "application/vnd.apache.arrow.stream"
+        table = pa.ipc.open_stream(body).read_all()
+        assert table.num_rows == 5
+        assert "customer_id" in table.column_names
+
+    @pytest.mark.parametrize("target,status", [
+        ("/api/nope", 404),
+        ("/api/skus?limit=0", 400),
+        ("/api/skus?start=yesterday", 400),
+        ("/api/skus?format=xml", 400),
+    ])
+    def test_errors(self, service, target, status):
+        """Bad requests get a JSON error with the right status."""
+        code, _, body = get(service, target)
+        assert code == status
+        assert "error" in json.loads(body)
+
+
+class TestServer:
+    """The socket layer."""
+
+    def test_http_round_trip(self, service):
+        """A raw HTTP request gets a complete HTTP response."""
+        async def run():
+            server = await asyncio.start_server(service.serve_connection, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(b"GET /api/version HTTP/1.1\r\nHost: localhost\r\n\r\n")
+                await writer.drain()
+                response = await reader.read()
+                writer.close()
+            return response
+
+        response = asyncio.run(run())
+        head, body = response.split(b"\r\n\r\n", 1)
+        assert head.startswith(b"HTTP/1.1 200 OK")
+        assert b"Access-Control-Allow-Origin: *" in head
+        assert "version" in json.loads(body)
@@ -0,0 +1,77 @@
+"""Tests for the benchmark suite."""
+import json
+import sqlite3
+
+import pytest
+
+from benchmark import compare, generate_orders_raw, main, run_benchmark
+
+
+class TestGenerateOrdersRaw:
+    """Synthetic raw data must look like the real export."""
+
+    def test_shape_and_cardinalities(self, tmp_path):
+        """Rows, invoices, customers, countries and cancellations are in realistic ranges."""
+        db = str(tmp_path / "bench.db")
+        generate_orders_raw(db, 5_000, seed=1, chunk_size=1_000)
+        with sqlite3.connect(db) as con:
+            rows, invoices, customers, countries, cancelled, blank = con.execute(
+                """
+                SELECT COUNT(*), COUNT(DISTINCT InvoiceNo), COUNT(DISTINCT CustomerID),
+                       COUNT(DISTINCT Country), SUM(InvoiceNo LIKE 'C%'), SUM(CustomerID = '')
+                FROM orders_raw
+                """
+            ).fetchone()
+        assert rows == 5_000
+        assert 150 < invoices <= 250
+        assert customers <= 41  # 40 customers plus the blank one
+        assert countries > 1
+        assert 0 < blank < rows
+        assert cancelled < rows * 0.1
+
+    def test_deterministic(self, tmp_path):
+        """The same seed produces the same rows."""
+        dumps = []
+        for name in ("a.db", "b.db"):
+            db = str(tmp_path / name)
+            generate_orders_raw(db, 500, seed=3)
+            with sqlite3.connect(db) as con:
+                dumps.append(con.execute("SELECT * FROM orders_raw ORDER BY rowid").fetchall())
+        assert dumps[0] == dumps[1]
+
+
+class TestRunBenchmark:
+    """Every pipeline stage is timed."""
+
+    def test_stages(self, tmp_path):
+        """The report has one timing per stage and a cleaned row count."""
+        run = run_benchmark(2_000, tmp_path, charts_enabled=False)
+        stages = run["stages"]
+        for stage in ("generate", "clean.python", "clean.sql", "indexes", "query.v_orders_month",
+                      "export.export_monthly_kpis", "export.export_sku_abc"):
+            assert stage in stages
+            assert stages[stage] >= 0
+        assert not any(stage.startswith("chart.") for stage in stages)
+        assert 0 < run["clean_rows"] <= 2_000
+        assert (tmp_path / "orders_month.csv").exists()
+
+    def test_compare_flags_regressions(self):
+        """Only stages slower than the tolerance are reported."""
+        baseline = {"runs": [{"rows": 10, "stages": {"a": 1.0, "b": 1.0}}]}
+        report = {"runs": [{"rows": 10, "stages": {"a": 1.1, "b": 2.0, "c": 5.0}}]}
+        regressions = compare(report, baseline, tolerance=0.25)
+        assert [(r["stage"], r["ratio"]) for r in regressions] == [("b", 2.0)]
+
+    def test_main_writes_report(self, tmp_path, capsys):
+        """The CLI writes a JSON report and exits non-zero on regression."""
+        out = tmp_path / "bench.json"
+        main(["--sizes", "1000", "--no-charts", "--output", str(out)])
+        report = json.loads(out.read_text())
+        assert [run["rows"] for run in report["runs"]] == [1000]
+
+        for run in report["runs"]:
+            run["stages"] = {stage: 1e-9 for stage in run["stages"]}
+        baseline = tmp_path / "baseline.json"
+        baseline.write_text(json.dumps(report))
+        with pytest.raises(SystemExit):
+            main(["--sizes", "1000", "--no-charts", "--output", str(out), "--baseline", str(baseline)])
@@ -81,6 +81,149 @@ class TestDataValidation:
         validate_sku_data(df)
 
 
+class TestRenderCharts:
+    """Test the chart render runner."""
+
+    @staticmethod
+    def _frames():
+        monthly = pd.DataFrame({
+            "ym": ["2021-01", "2021-02", "2021-03"],
+            "revenue": [1000.0, 2000.0, 1500.0],
+            "gross_profit": [400.0, 800.0, 600.0],
+            "revenue_mom_pct": [None, 1.0, -0.25],
+            "aov": [10.0, 12.0, 11.0],
+            "revenue_domestic": [800.0, 1500.0, 1000.0],
+            "revenue_export": [200.0, 500.0, 500.0],
+        })
+        country = pd.DataFrame({"country": ["UK", "France"], "revenue": [300000.0, 150000.0]})
+        sku = pd.DataFrame({"sku": ["A1", "B2"], "revenue": [900.0, 100.0], "abc_class": ["A", "C"]})
+        customers = pd.DataFrame({"customer_id": ["12346", None], "revenue": [70000.0, 30000.0]})
+        cohorts = pd.DataFrame({
+            "cohort": ["2021-01", "2021-02"], "customers": [40, 25], "m0": [1.0, 1.0], "m1": [0.3, None],
+        })
+        return {"monthly": monthly, "country": country, "sku": sku, "customers": customers, "cohorts": cohorts}
+
+    @pytest.mark.parametrize("jobs", [1, 2])
+    def test_render_all_charts(self, tmp_path, monkeypatch, jobs):
+        """Every chart renders a PNG, in-process or in a pool."""
+        import charts
+        monkeypatch.setattr(charts, "ASSETS", tmp_path)
+        results = charts.render_charts(self._frames(), jobs=jobs)
+        assert results == {label: None for label, *_ in charts.CHARTS}
+        assert len(list(tmp_path.glob("*.png"))) == len(charts.CHARTS)
+
+    def test_render_collects_failures(self, tmp_path, monkeypatch):
+        """A failing chart is reported without stopping the others."""
+        import charts
+        monkeypatch.setattr(charts, "ASSETS", tmp_path)
+        frames = self._frames()
+        frames["country"] = pd.DataFrame()
+        results = charts.render_charts(frames, jobs=2)
+        assert "missing required columns" in results["Top Countries"]
+        assert sum(error is None for error in results.values()) == len(charts.CHARTS) - 1
+
+
+    def test_render_skips_cached_charts(self, tmp_path, monkeypatch):
+        """Only charts whose inputs changed are rendered again."""
+        import charts
+        from render_cache import RenderCache
+        monkeypatch.setattr(charts, "ASSETS", tmp_path)
+        frames = self._frames()
+        cache = RenderCache(tmp_path)
+        charts.render_charts(frames, cache=cache)
+        cache.save()
+
+        frames["sku"] = frames["sku"].assign(revenue=[950.0, 50.0])
+        cache = RenderCache(tmp_path)
+        results = charts.render_charts(frames, cache=cache)
+        assert list(results) == ["Top SKUs"]
+        assert cache.misses == ["top_skus.png"]
+        assert len(cache.hits) == len(charts.CHARTS) - 1
+
+    def test_helper_changes_invalidate_every_chart(self, tmp_path, monkeypatch):
+        """Changing a shared helper such as _save_png renders every chart again."""
+        import charts
+        from render_cache import RenderCache
+        monkeypatch.setattr(charts, "ASSETS", tmp_path)
+        frames = self._frames()
+        cache = RenderCache(tmp_path)
+        charts.render_charts(frames, cache=cache)
+        cache.save()
+
+        save_png = charts._save_png
+
+        def _save_png(fig, filename):
+            fig.set_dpi(200)
+            save_png(fig, filename)
+
+        monkeypatch.setattr(charts, "_save_png", _save_png)
+        cache = RenderCache(tmp_path)
+        results = charts.render_charts(frames, cache=cache)
+        assert list(results) == [label for label, *_ in charts.CHARTS] and not cache.hits
+
+
+class TestCommands:
+    """The validate/export/render subcommands."""
+
+    @pytest.fixture
+    def paths(self, built_db, tmp_path, monkeypatch):
+        import charts
+        monkeypatch.setattr(charts, "DB", built_db)
+        monkeypatch.setattr(charts, "DATA", tmp_path / "data")
+        monkeypatch.setattr(charts, "ASSETS", tmp_path / "assets")
+        yield tmp_path
+        charts.close_connections()
+
+    def test_import_is_lazy(self):
+        """Importing charts loads neither pandas nor matplotlib and creates no directories."""
+        import subprocess
+        code = (
+            "import sys, charts; "
+            "print(sorted(m for m in ('pandas', 'matplotlib') if m in sys.modules))"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=Path(__file__).parent.parent, capture_output=True, text=True, check=True,
+        )
+        assert out.stdout.strip() == "[]"
+
+    def test_validate_writes_nothing(self, paths, capsys):
+        """validate checks the views without exporting or rendering."""
+        import charts
+        charts.main(["validate"])
+        assert "order rows are valid" in capsys.readouterr().out
+        assert not (paths / "data").exists()
+        assert not (paths / "assets").exists()
+
+    def test_export_then_render(self, paths):
+        """render draws every chart from the CSVs a previous export wrote."""
+        import charts
+        charts.main(["export"])
+        assert sorted(p.name for p in (paths / "data").glob("*.csv")) == sorted(charts.EXPORT_FILES.values())
+        assert not (paths / "assets").exists()
+        charts.main(["render"])
+        assert len(list((paths / "assets").glob("*.png"))) == len(charts.CHARTS)
+
+    def test_render_without_export(self, paths, capsys):
+        """render exits with a hint when the CSVs have not been exported."""
+        import charts
+        with pytest.raises(SystemExit):
+            charts.main(["render"])
+        assert "charts.py export" in capsys.readouterr().err
+
+    @pytest.mark.parametrize("options", [
+        ["--materialized", "--single-pass"],
+        ["--abc-engine", "--single-pass"],
+        ["--abc-engine", "--partitioned"],
+    ])
+    def test_conflicting_options(self, options, capsys):
+        """Options the chosen export path would ignore are rejected."""
+        import charts
+        with pytest.raises(SystemExit):
+            charts.parse_args(["export", *options])
+        assert "cannot be combined" in capsys.readouterr().err
+
+
 class TestDatabaseValidation:
     """Test database validation."""
 
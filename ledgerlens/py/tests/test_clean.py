@@ -0,0 +1,160 @@
+"""Tests for the incremental orders refresh."""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from clean import benchmark_engines, full_rebuild, get_watermark, parse_invoice_dates, refresh_orders
+from ingest import ingest_csv
+from tests.sample_data import make_raw_rows, write_csv
+
+
+EDGE_ROWS = [
+    ["536365", "85123a", "HEART", "6", " 12/1/2010 8:26 ", "2.55", "17850", "United Kingdom"],
+    ["536366", "71053", "LANTERN", "2", "3/5/2011", "3.39", "", "France"],
+    ["536367", "84406B", "CREAM", "8", "3/5/2011 9", "2.75", "13047", "EIRE"],
+    ["536368", "22423", "CAKE", "1", "6/7/2011 8:26:45", "12.75", "13047", "Germany"],
+    ["536369", "POST", "POSTAGE", "1", "bad", "18.0", "12583", "France"],
+    ["536370", "DOT", "DOTCOM", "1", "1/2", "5.0", "", "United Kingdom"],
+    ["c536371", "22423", "CAKE", "1", "6/7/2011 9:00", "12.75", "13047", "Germany"],
+    ["536372", "22423", "CAKE", "0", "6/7/2011 9:00", "12.75", "13047", "Germany"],
+    ["536373", "21730", "LIGHT", "3", "6/7/2011 9:00", "0", "13047", ""],
+]
+
+
+def _orders(db):
+    with sqlite3.connect(db) as con:
+        return con.execute("SELECT * FROM orders ORDER BY rowid").fetchall()
+
+
+def _typed_orders(db):
+    with sqlite3.connect(db) as con:
+        cols = [row[1] for row in con.execute("PRAGMA table_info(orders)")]
+        typed = ", ".join(f"{c}, typeof({c})" for c in cols)
+        return con.execute(f"SELECT {typed} FROM orders ORDER BY rowid").fetchall()
+
+
+class TestRefreshOrders:
+    """Test full and incremental refresh of orders."""
+
+    def test_first_refresh_is_full(self, tmp_path, raw_csv):
+        """Without a watermark the table is rebuilt from scratch."""
+        db = str(tmp_path / "t.db")
+        ingest_csv(raw_csv, db, reset=True)
+        result = refresh_orders(db)
+        assert result["mode"] == "full"
+        assert result["rows_added"] == len(_orders(db))
+
+    def test_incremental_matches_full_rebuild(self, tmp_path, raw_csv):
+        """Appending a delta yields the same rows as rebuilding everything."""
+        db = str(tmp_path / "t.db")
+        ingest_csv(raw_csv, db, reset=True)
+        refresh_orders(db)
+        before = len(_orders(db))
+
+        delta = write_csv(tmp_path / "delta.csv", make_raw_rows(40, seed=3, start_month=5, months=1))
+        ingest_csv(delta, db)
+        result = refresh_orders(db)
+        assert result["mode"] == "incremental"
+        assert result["rows_added"] == len(_orders(db)) - before > 0
+        incremental = _orders(db)
+
+        full_rebuild(db)
+        assert _orders(db) == incremental
+
+    def test_noop_when_no_new_rows(self, built_db):
+        """A refresh with no new raw rows appends nothing."""
+        result = refresh_orders(built_db)
+        assert result["mode"] == "incremental"
+        assert result["rows_added"] == 0
+
+    def test_reset_raw_table_forces_full(self, tmp_path, raw_csv):
+        """Recreating orders_raw invalidates the watermark."""
+        db = str(tmp_path / "t.db")
+        ingest_csv(raw_csv, db, reset=True)
+        refresh_orders(db)
+        small = write_csv(tmp_path / "small.csv", make_raw_rows(5, seed=1))
+        ingest_csv(small, db, reset=True)
+        result = refresh_orders(db)
+        assert result["mode"] == "full"
+        with sqlite3.connect(db) as con:
+            assert get_watermark(con) == con.execute("SELECT MAX(rowid) FROM orders_raw").fetchone()[0]
+
+    def test_reset_then_larger_reload_forces_full(self, tmp_path, raw_csv):
+        """Reloading a larger file after a reset rebuilds instead of keeping stale rows."""
+        db = str(tmp_path / "t.db")
+        ingest_csv(raw_csv, db, reset=True)
+        refresh_orders(db)
+        larger = write_csv(tmp_path / "larger.csv", make_raw_rows(150, seed=9))
+        ingest_csv(larger, db, reset=True)
+        result = refresh_orders(db)
+        assert result["mode"] == "full"
+        reloaded = _orders(db)
+        full_rebuild(db)
+        assert _orders(db) == reloaded
+
+    def test_unknown_engine(self, built_db):
+        """Only the sql and python engines exist."""
+        with pytest.raises(ValueError, match="Unknown engine"):
+            refresh_orders(built_db, engine="rust")
+
+    def test_missing_database(self, tmp_path):
+        """A missing database file is reported."""
+        with pytest.raises(FileNotFoundError):
+            refresh_orders(str(tmp_path / "missing.db"))
+
+
+class TestPythonEngine:
+    """The vectorized normalizer must reproduce the SQL CTE chain."""
+
+    def test_parse_invoice_dates(self):
+        """Dates parse like the parts..parts4 CTEs, including missing pieces."""
+        parsed = parse_invoice_dates(pd.Series(["12/1/2010 8:26", "3/5/2011", "6/7/2011 8:26:45", "1/2", None]))
+        assert parsed[["year", "month", "day", "hour", "minute"]].values.tolist()[:3] == [
+            [2010, 12, 1, 8, 26],
+            [2011, 3, 5, 0, 0],
+            [2011, 6, 7, 8, 26],
+        ]
+        assert parsed["valid"].tolist() == [True, True, True, False, False]
+
+    @pytest.mark.parametrize("rows", [EDGE_ROWS, make_raw_rows()], ids=["edge-cases", "synthetic"])
+    def test_full_rebuild_parity(self, tmp_path, rows):
+        """Both engines produce identical rows, values and storage types."""
+        csv_path = write_csv(tmp_path / "raw.csv", rows)
+        results = {}
+        for engine in ("sql", "python"):
+            db = str(tmp_path / f"{engine}.db")
+            ingest_csv(csv_path, db, reset=True)
+            full_rebuild(db, engine=engine, chunk_size=4)
+            results[engine] = _typed_orders(db)
+        assert results["python"] == results["sql"]
+        assert len(results["sql"]) > 0
+
+    @pytest.mark.parametrize("engine", ["sql", "python"])
+    def test_full_rebuild_without_indexes(self, tmp_path, raw_csv, engine):
+        """indexes=False leaves index creation to the caller for either engine."""
+        db = str(tmp_path / "t.db")
+        ingest_csv(raw_csv, db, reset=True)
+        full_rebuild(db, engine=engine, indexes=False)
+        with sqlite3.connect(db) as con:
+            names = [r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='orders'")]
+        assert names == []
+
+    def test_incremental_python_matches_sql(self, tmp_path, raw_csv):
+        """Appending with the python engine equals a SQL rebuild."""
+        db = str(tmp_path / "t.db")
+        ingest_csv(raw_csv, db, reset=True)
+        refresh_orders(db, engine="python")
+        ingest_csv(write_csv(tmp_path / "delta.csv", EDGE_ROWS), db)
+        result = refresh_orders(db, engine="python", chunk_size=3)
+        assert result["mode"] == "incremental" and result["engine"] == "python"
+        appended = _typed_orders(db)
+        full_rebuild(db, engine="sql")
+        assert _typed_orders(db) == appended
+
+    def test_benchmark_leaves_database_untouched(self, built_db):
+        """Benchmarks run on scratch copies and agree on row counts."""
+        before = _orders(built_db)
+        results = benchmark_engines(built_db)
+        assert results["sql"]["rows_added"] == results["python"]["rows_added"] == len(before)
+        assert _orders(built_db) == before
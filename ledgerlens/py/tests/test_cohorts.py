@@ -0,0 +1,158 @@
+"""Tests for the incremental cohort retention engine."""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from clean import full_rebuild, refresh_orders
+from cohorts import cohort_counts, refresh_cohorts, retention
+from ingest import ingest_csv
+from tests.sample_data import make_raw_rows, write_csv
+
+# Reference: each customer's first month from v_customer_value, joined back to orders
+REFERENCE_SQL = """
+SELECT
+  substr(c.first_order_date, 1, 7) AS cohort,
+  (CAST(substr(o.order_month, 1, 4) AS INTEGER) * 12 + CAST(substr(o.order_month, 6, 2) AS INTEGER))
+    - (CAST(substr(c.first_order_date, 1, 4) AS INTEGER) * 12 + CAST(substr(c.first_order_date, 6, 2) AS INTEGER))
+    AS period,
+  COUNT(DISTINCT o.customer_id) AS customers
+FROM orders o
+JOIN v_customer_value c ON c.customer_id = o.customer_id
+GROUP BY 1, 2
+"""
+
+
+def assert_matches_reference(db):
+    with sqlite3.connect(db) as con:
+        expected = pd.read_sql_query(REFERENCE_SQL, con)
+    expected = expected.pivot(index="cohort", columns="period", values="customers").sort_index()
+    expected = expected.reindex(columns=range(expected.columns.max() + 1))
+    actual = cohort_counts(db)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_names=False)
+
+
+def late_rows(year="2009"):
+    """Orders from existing customers dated a year earlier than the base data."""
+    rows = make_raw_rows(80, seed=3, start_month=1, months=2)
+    return [row[:4] + [row[4].replace("/2010", f"/{year}")] + row[5:] for row in rows]
+
+
+class TestRefresh:
+    """Building and incrementally extending the cohort tables."""
+
+    def test_full_matches_self_join(self, built_db):
+        """The first refresh equals the orders-to-first-order join."""
+        result = refresh_cohorts(built_db)
+        assert result["mode"] == "full" and result["pairs"] > 0
+        assert refresh_cohorts(built_db)["mode"] == "fresh"
+        assert_matches_reference(built_db)
+
+    def test_new_months_fold_incrementally(self, built_db, tmp_path):
+        """Only new customer-months are read, and the matrix still equals the reference."""
+        refresh_cohorts(built_db)
+        delta = write_csv(tmp_path / "delta.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        ingest_csv(delta, built_db)
+        refresh_orders(built_db)
+        result = refresh_cohorts(built_db)
+        assert result["mode"] == "incremental"
+        assert 0 < result["pairs"] < 60
+        assert_matches_reference(built_db)
+
+    def test_late_rows_move_customers_to_an_earlier_cohort(self, built_db, tmp_path):
+        """Rows older than a customer's first month recount that customer under the new cohort."""
+        refresh_cohorts(built_db)
+        ingest_csv(write_csv(tmp_path / "late.csv", late_rows()), built_db)
+        refresh_orders(built_db)
+        result = refresh_cohorts(built_db)
+        assert result["mode"] == "incremental" and result["moved"] > 0
+        assert cohort_counts(built_db).index[0] == "2009-01"
+        assert_matches_reference(built_db)
+
+    def test_failed_rebuild_keeps_old_tables(self, built_db, monkeypatch):
+        """The DROP/CREATE of a full rebuild rolls back with the rest when the fold fails."""
+        import cohorts
+        refresh_cohorts(built_db)
+        before = cohort_counts(built_db)
+
+        def broken(con, new_pairs):
+            raise ValueError("fold failed")
+
+        monkeypatch.setattr(cohorts, "_fold", broken)
+        with pytest.raises(ValueError, match="fold failed"):
+            refresh_cohorts(built_db, full=True)
+        monkeypatch.undo()
+        pd.testing.assert_frame_equal(cohort_counts(built_db), before)
+        assert refresh_cohorts(built_db)["mode"] == "fresh"
+
+    def test_rebuilt_orders_forces_full(self, built_db):
+        """A full rebuild of orders invalidates the cohort tables."""
+        refresh_cohorts(built_db)
+        full_rebuild(built_db)
+        assert refresh_cohorts(built_db)["mode"] == "full"
+        assert_matches_reference(built_db)
+
+
+class TestRetention:
+    """The exported retention matrix."""
+
+    def test_rates_and_horizon(self, built_db):
+        """Month 0 is 100%, sizes match first-order months and unreached periods are empty."""
+        df = retention(built_db)
+        with sqlite3.connect(built_db) as con:
+            sizes = pd.read_sql_query(
+                "SELECT substr(first_order_date, 1, 7) AS cohort, COUNT(*) AS customers "
+                "FROM v_customer_value GROUP BY 1 ORDER BY 1",
+                con,
+            )
+        assert df["cohort"].tolist() == sizes["cohort"].tolist()
+        assert df["customers"].tolist() == sizes["customers"].tolist()
+        assert (df["m0"] == 1.0).all()
+        rates = df[[c for c in df.columns if c.startswith("m")]].to_numpy(dtype=float)
+        # Data runs 2010-01..2010-04: cohort i can only be observed for 4 - i months
+        for i in range(len(df)):
+            last = 4 - (int(df["cohort"][i][5:]) - 1)
+            assert not np.isnan(rates[i, :last]).any()
+            assert np.isnan(rates[i, last:]).all()
+        assert np.nanmax(rates) <= 1.0
+
+    def test_reads_only(self, built_db, tmp_path):
+        """Missing or stale cohort tables are worked around in memory, never written."""
+        def tables():
+            with sqlite3.connect(built_db) as con:
+                return con.execute("SELECT name FROM sqlite_master WHERE name LIKE 'cohort%'").fetchall()
+
+        computed = retention(built_db)
+        assert tables() == []
+        refresh_cohorts(built_db)
+        pd.testing.assert_frame_equal(retention(built_db), computed)
+
+        ingest_csv(write_csv(tmp_path / "late.csv", late_rows()), built_db)
+        refresh_orders(built_db)
+        with sqlite3.connect(built_db) as con:
+            watermark = con.execute("SELECT value FROM etl_state WHERE name='cohort_orders_rowid'").fetchone()
+        assert retention(built_db)["cohort"].iloc[0] == "2009-01"
+        assert_matches_reference(built_db)
+        with sqlite3.connect(built_db) as con:
+            assert con.execute("SELECT value FROM etl_state WHERE name='cohort_orders_rowid'").fetchone() == watermark
+
+    def test_validator_rejects_bad_month_zero(self):
+        """A cohort whose month-0 retention is not 100% fails validation."""
+        from charts import validate_cohort_data
+        df = pd.DataFrame({"cohort": ["2010-01"], "customers": [10], "m0": [0.9]})
+        with pytest.raises(ValueError, match="month-0 retention"):
+            validate_cohort_data(df)
+
+
+def test_charts_export_and_render(built_db, tmp_path, monkeypatch):
+    """charts.py writes cohort_retention.csv and the heatmap next to the other outputs."""
+    import charts
+    monkeypatch.setattr(charts, "DB", built_db)
+    monkeypatch.setattr(charts, "DATA", tmp_path / "data")
+    monkeypatch.setattr(charts, "ASSETS", tmp_path / "assets")
+    charts.main([])
+    exported = pd.read_csv(tmp_path / "data" / "cohort_retention.csv", dtype={"cohort": str})
+    pd.testing.assert_frame_equal(exported, retention(built_db), check_dtype=False)
+    assert (tmp_path / "assets" / "cohort_retention.png").stat().st_size > 0
+    charts.close_connections()
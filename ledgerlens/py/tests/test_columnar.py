@@ -0,0 +1,66 @@
+"""Tests for the columnar Arrow/Parquet export."""
+import json
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from columnar import MANIFEST_NAME, export_columnar
+
+
+def _frames():
+    monthly = pd.DataFrame({
+        "ym": ["2021-01", "2021-02"],
+        "month_start": ["2021-01-04", "2021-02-01"],
+        "orders": [10, 12],
+        "revenue": [1000.5, 2000.25],
+        "buyers_prev": [None, 7.0],
+    })
+    sku = pd.DataFrame({"sku": ["A1", "B2"], "revenue": [900.0, 100.0], "abc_class": ["A", "C"]})
+    return {"orders_month": monthly, "sku_abc": sku}
+
+
+class TestColumnarExport:
+    """Test export_columnar."""
+
+    @pytest.mark.parametrize("fmt", ["arrow", "parquet"])
+    def test_typed_roundtrip(self, tmp_path, fmt):
+        """Files keep dates, nullable ints and categories, and the manifest describes them."""
+        pytest.importorskip("pyarrow")
+        manifest = export_columnar(_frames(), tmp_path, fmt)
+
+        assert manifest["orders_month"]["rows"] == 2
+        schema = manifest["orders_month"]["schema"]
+        assert schema["month_start"] == "date32[day]"
+        assert schema["orders"] == "int64"
+        assert schema["buyers_prev"] == "int64"
+        assert manifest["sku_abc"]["schema"]["abc_class"].startswith("dictionary")
+        assert json.loads((tmp_path / MANIFEST_NAME).read_text()) == manifest
+
+        reader = pd.read_parquet if fmt == "parquet" else pd.read_feather
+        back = reader(tmp_path / manifest["orders_month"]["file"])
+        assert back["buyers_prev"].isna().tolist() == [True, False]
+        assert back["revenue"].tolist() == [1000.5, 2000.25]
+
+    def test_unknown_format(self, tmp_path):
+        """Only arrow and parquet are supported."""
+        with pytest.raises(ValueError, match="Unknown columnar format"):
+            export_columnar(_frames(), tmp_path, "orc")
+
+    def test_missing_pyarrow(self, tmp_path, monkeypatch):
+        """A missing optional dependency is a clear runtime error."""
+        monkeypatch.setitem(sys.modules, "pyarrow", None)
+        with pytest.raises(RuntimeError, match="pip install pyarrow"):
+            export_columnar(_frames(), tmp_path, "arrow")
+
+    def test_charts_writes_every_csv_dataset(self, built_db, tmp_path, monkeypatch):
+        """charts.py export --columnar mirrors the CSV export set, cohort retention included."""
+        pytest.importorskip("pyarrow")
+        import charts
+        monkeypatch.setattr(charts, "DB", built_db)
+        monkeypatch.setattr(charts, "DATA", tmp_path)
+        charts.main(["export", "--columnar", "arrow"])
+        manifest = json.loads((tmp_path / MANIFEST_NAME).read_text())
+        assert set(manifest) == {Path(name).stem for name in charts.EXPORT_FILES.values()}
+        assert manifest["cohort_retention"]["schema"]["customers"] == "int64"
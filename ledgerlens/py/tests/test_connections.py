@@ -0,0 +1,96 @@
+"""Tests for the shared read-only connection manager."""
+import sqlite3
+import threading
+
+import pytest
+
+import charts
+from connections import ConnectionManager, open_readonly
+
+
+class TestOpenReadonly:
+    """Single read-only connections."""
+
+    def test_rejects_writes_and_applies_pragmas(self, built_db):
+        """Writes fail and the read PRAGMAs are in effect."""
+        con = open_readonly(built_db)
+        try:
+            assert con.execute("PRAGMA cache_size").fetchone()[0] == -65536
+            assert con.execute("PRAGMA query_only").fetchone()[0] == 1
+            with pytest.raises(sqlite3.OperationalError):
+                con.execute("DELETE FROM orders")
+        finally:
+            con.close()
+
+    def test_missing_database(self, tmp_path):
+        """A missing file is reported instead of being created."""
+        with pytest.raises(FileNotFoundError):
+            open_readonly(str(tmp_path / "missing.db"))
+        assert not (tmp_path / "missing.db").exists()
+
+
+class TestConnectionManager:
+    """Pooling and timings."""
+
+    def test_reuses_connection_and_times_queries(self, built_db):
+        """Sequential queries share one connection and each gets a timing entry."""
+        with ConnectionManager(built_db) as manager:
+            with manager.connection() as first:
+                pass
+            manager.query("SELECT COUNT(*) AS n FROM orders")
+            manager.query("SELECT * FROM v_orders_month", label="monthly")
+            with manager.connection() as again:
+                assert again is first
+            assert [t["query"] for t in manager.timings] == ["SELECT COUNT(*) AS n FROM orders", "monthly"]
+            assert manager.timings[1]["rows"] > 0
+            assert "monthly" in manager.timing_report()
+
+    def test_pool_bounds_connections(self, built_db):
+        """Concurrent threads never open more than pool_size connections."""
+        manager = ConnectionManager(built_db, pool_size=2)
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(5):
+                    manager.query("SELECT * FROM v_country_summary")
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors
+        assert len(manager._opened) <= 2
+        assert len(manager.timings) == 30
+        manager.close()
+
+    def test_timings_are_bounded(self, built_db, monkeypatch):
+        """Only the latest MAX_TIMINGS timings are kept."""
+        import connections
+        monkeypatch.setattr(connections, "MAX_TIMINGS", 3)
+        with ConnectionManager(built_db) as manager:
+            for i in range(5):
+                manager.query(f"SELECT {i} AS n", label=str(i))
+            assert [t["query"] for t in manager.timings] == ["2", "3", "4"]
+
+
+class TestChartsQuery:
+    """charts.q() uses the shared manager."""
+
+    def test_q_shares_and_follows_db(self, built_db, tmp_path, monkeypatch):
+        """q() reuses one manager per DB path and reopens when DB changes."""
+        monkeypatch.setattr(charts, "DB", built_db)
+        charts.q("SELECT 1")
+        manager = charts.connections()
+        charts.q("SELECT 2")
+        assert charts.connections() is manager
+        assert len(manager.timings) == 2
+
+        other = tmp_path / "other.db"
+        sqlite3.connect(other).close()
+        monkeypatch.setattr(charts, "DB", str(other))
+        assert charts.connections() is not manager
+        charts.close_connections()
@@ -0,0 +1,148 @@
+"""Tests for the day × country × export order cube."""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from clean import full_rebuild, refresh_orders
+from cube import OrderCube, cube_path, load_cube, refresh_cube
+from ingest import ingest_csv
+from tests.sample_data import make_raw_rows, write_csv
+
+REFERENCE_SQL = """
+SELECT
+  COALESCE(SUM(gross_revenue), 0) AS revenue,
+  COALESCE(SUM(gross_profit), 0) AS gross_profit,
+  COALESCE(SUM(qty), 0) AS units,
+  COUNT(DISTINCT invoice_no || '|' || order_date || '|' || country) AS orders
+FROM orders
+WHERE order_date BETWEEN ? AND ? {extra}
+"""
+
+
+def reference(db, start, end, extra="", params=()):
+    """Measures for [start, end] computed directly from orders."""
+    with sqlite3.connect(db) as con:
+        row = con.execute(REFERENCE_SQL.format(extra=extra), (start, end, *params)).fetchone()
+    return dict(zip(["revenue", "gross_profit", "units", "orders"], row))
+
+
+def assert_totals(actual, expected):
+    assert actual["units"] == expected["units"] and actual["orders"] == expected["orders"]
+    assert np.isclose(actual["revenue"], expected["revenue"])
+    assert np.isclose(actual["gross_profit"], expected["gross_profit"])
+
+
+class TestRefresh:
+    """Building the cube and keeping it current."""
+
+    def test_monthly_periods_match_view(self, built_db):
+        """Summing the cube by month reproduces v_orders_month."""
+        result = refresh_cube(built_db)
+        assert result["mode"] == "full" and cube_path(built_db).exists()
+        assert refresh_cube(built_db)["mode"] == "fresh"
+
+        monthly = load_cube(db=built_db).by_period("M")
+        with sqlite3.connect(built_db) as con:
+            view = pd.read_sql_query(
+                "SELECT ym, revenue, gross_profit, units, orders, revenue_export FROM v_orders_month ORDER BY ym", con
+            )
+        assert monthly["period"].tolist() == view["ym"].tolist()
+        assert monthly["units"].tolist() == view["units"].tolist()
+        assert monthly["orders"].tolist() == view["orders"].tolist()
+        assert np.allclose(monthly["revenue"], view["revenue"])
+        assert np.allclose(monthly["gross_profit"], view["gross_profit"])
+        exports = load_cube(db=built_db).by_period("M", is_export=True)
+        assert np.allclose(exports["revenue"], view["revenue_export"])
+
+    def test_incremental_matches_full_rebuild(self, built_db, tmp_path):
+        """New days and countries widen the cube; the result equals a rebuild from scratch."""
+        refresh_cube(built_db)
+        before = load_cube(db=built_db)
+        delta = make_raw_rows(60, seed=11, start_month=3, months=3)
+        for row in delta[:5]:
+            row[7] = "Japan"
+        ingest_csv(write_csv(tmp_path / "delta.csv", delta), built_db)
+        refresh_orders(built_db)
+
+        result = refresh_cube(built_db)
+        assert result["mode"] == "incremental" and result["rows"] > 0
+        incremental = load_cube(db=built_db)
+        assert len(incremental.days) > len(before.days) and "Japan" in incremental.countries
+
+        refresh_cube(built_db, path=tmp_path / "full.npz", full=True)
+        rebuilt = load_cube(tmp_path / "full.npz")
+        np.testing.assert_array_equal(incremental.days, rebuilt.days)
+        np.testing.assert_array_equal(incremental.countries, rebuilt.countries)
+        np.testing.assert_allclose(incremental.cells, rebuilt.cells)
+        assert_totals(incremental.totals(), reference(built_db, "2010-01-01", "2010-12-31"))
+
+    def test_rebuilt_orders_or_missing_file_forces_full(self, built_db):
+        """A full rebuild of orders, or a deleted cube file, rebuilds the cube."""
+        refresh_cube(built_db)
+        full_rebuild(built_db)
+        assert refresh_cube(built_db)["mode"] == "full"
+        cube_path(built_db).unlink()
+        assert refresh_cube(built_db)["mode"] == "full"
+
+
+class TestQueries:
+    """Range, country and export-flag queries from prefix sums."""
+
+    @pytest.fixture
+    def cube(self, built_db):
+        refresh_cube(built_db)
+        return load_cube(db=built_db)
+
+    def test_totals_match_orders(self, built_db, cube):
+        """Arbitrary day ranges, month ranges, countries and export flags equal the SQL aggregates."""
+        assert_totals(cube.totals("2010-02-03", "2010-03-14"), reference(built_db, "2010-02-03", "2010-03-14"))
+        assert_totals(
+            cube.totals("2010-02", "2010-03", country="France"),
+            reference(built_db, "2010-02-01", "2010-03-31", "AND country = ?", ("France",)),
+        )
+        assert_totals(
+            cube.totals("2010-01-10", "2010-01-20", country=["France", "Germany"]),
+            reference(built_db, "2010-01-10", "2010-01-20", "AND country IN (?, ?)", ("France", "Germany")),
+        )
+        assert_totals(
+            cube.totals(end="2010-02-15", is_export=False),
+            reference(built_db, "2000-01-01", "2010-02-15", "AND is_export = 0"),
+        )
+
+    def test_ranges_outside_the_data(self, cube):
+        """Ranges past either end are clipped; an empty range sums to zero."""
+        assert cube.totals("2009-01-01", "2030-12-31") == cube.totals()
+        assert cube.totals("2030-01", "2030-02") == {"revenue": 0.0, "gross_profit": 0.0, "units": 0, "orders": 0}
+        assert cube.totals(country="Atlantis")["orders"] == 0
+        with pytest.raises(ValueError, match="after end"):
+            cube.totals("2010-03", "2010-01")
+        with pytest.raises(ValueError, match="YYYY-MM"):
+            cube.totals("March")
+
+    def test_by_country_and_week(self, built_db, cube):
+        """Per-country and per-week breakdowns add up to the range total."""
+        countries = cube.by_country("2010-02")
+        assert countries["revenue"].is_monotonic_decreasing
+        assert np.isclose(countries["revenue"].sum(), cube.totals("2010-02")["revenue"])
+        weeks = cube.by_period("W", "2010-01-01", "2010-01-31")
+        assert weeks["period_start"].iloc[0] == str(cube.days[0])
+        assert (pd.to_datetime(weeks["period_start"].iloc[1:]).dt.dayofweek == 0).all()
+        assert weeks["units"].sum() == cube.totals("2010-01-01", "2010-01-31")["units"]
+
+
+def test_empty_cube():
+    """A cube over no orders answers every query with zeros."""
+    cube = OrderCube.empty()
+    assert cube.totals()["revenue"] == 0.0
+    assert cube.by_period("M").empty
+
+
+def test_charts_export_builds_cube(built_db, tmp_path, monkeypatch):
+    """charts.py export --cube refreshes the cube next to the database."""
+    import charts
+    monkeypatch.setattr(charts, "DB", built_db)
+    monkeypatch.setattr(charts, "DATA", tmp_path / "data")
+    charts.main(["export", "--cube"])
+    assert load_cube(db=built_db).totals()["units"] > 0
@@ -0,0 +1,79 @@
+"""Tests for the top-K customers read from mv_customer."""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from clean import refresh_orders
+from customer_topk import TOP_SQL, top_customers
+from indexes import query_plan
+from ingest import ingest_csv
+from materialize import refresh
+from tests.sample_data import make_raw_rows, write_csv
+
+
+def assert_matches_view(db, n=50):
+    with sqlite3.connect(db) as con:
+        expected = pd.read_sql_query(f"SELECT * FROM v_top_customers WHERE revenue_rank <= {n}", con)
+    actual = top_customers(db, n)
+    assert list(actual.columns) == list(expected.columns)
+    # revenue_rank is arbitrary among tied revenues, so compare by customer
+    pd.testing.assert_frame_equal(
+        actual.drop(columns="revenue_rank").sort_values("customer_id").reset_index(drop=True),
+        expected.drop(columns="revenue_rank").sort_values("customer_id").reset_index(drop=True),
+        check_dtype=False,
+    )
+    assert actual["revenue_rank"].tolist() == list(range(1, len(actual) + 1))
+
+
+def snapshot(db):
+    """Every table's row count, to check that a read left the database alone."""
+    with sqlite3.connect(db) as con:
+        tables = [r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")]
+        return {t: con.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in tables}
+
+
+class TestTopCustomers:
+    """Top-N queries over mv_customer."""
+
+    @pytest.mark.parametrize("n", [1, 15, 50])
+    def test_matches_view(self, built_db, n):
+        """Any N up to the maximum equals the first N rows of v_top_customers."""
+        refresh(built_db)
+        assert_matches_view(built_db, n)
+
+    def test_n_out_of_range(self, built_db):
+        """N above the configured maximum is rejected."""
+        with pytest.raises(ValueError, match="between 1 and 50"):
+            top_customers(built_db, 51)
+
+    def test_stale_summaries_fall_back_to_view(self, built_db, tmp_path):
+        """Before a refresh, and after new orders, the view answers and nothing is written."""
+        before = snapshot(built_db)
+        assert_matches_view(built_db)
+        assert snapshot(built_db) == before
+
+        refresh(built_db)
+        delta = write_csv(tmp_path / "delta.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        ingest_csv(delta, built_db)
+        refresh_orders(built_db)
+        before = snapshot(built_db)
+        assert_matches_view(built_db)
+        assert snapshot(built_db) == before
+
+    def test_incremental_refresh(self, built_db, tmp_path):
+        """Folding new orders into mv_customer keeps the top N equal to the view."""
+        refresh(built_db)
+        delta = write_csv(tmp_path / "delta.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        ingest_csv(delta, built_db)
+        refresh_orders(built_db)
+        assert refresh(built_db)["mode"] == "incremental"
+        assert_matches_view(built_db)
+
+    def test_walks_revenue_index(self, built_db):
+        """TOP_SQL reads the revenue index instead of sorting every customer."""
+        refresh(built_db)
+        with sqlite3.connect(built_db) as con:
+            plan = query_plan(con, TOP_SQL.replace(":n", "5"))
+        assert any("idx_mv_customer_revenue" in step for step in plan)
+        assert not any("SCAN mv_customer" == step.strip() for step in plan)
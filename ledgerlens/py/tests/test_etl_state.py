@@ -0,0 +1,50 @@
+"""Tests for the shared watermark bookkeeping."""
+import sqlite3
+
+import pytest
+
+from clean import full_rebuild
+from etl_state import decide_mode, get_state, record_watermark
+
+
+@pytest.fixture
+def con(built_db):
+    con = sqlite3.connect(built_db, isolation_level=None)
+    yield con
+    con.close()
+
+
+class TestDecideMode:
+    """full / incremental / fresh decisions from the stored watermark."""
+
+    def test_first_run_is_full(self, con):
+        """Without a watermark every row is read."""
+        mode, lo, hi = decide_mode(con, "test")
+        assert (mode, lo) == ("full", 0)
+        assert hi == con.execute("SELECT MAX(rowid) FROM orders").fetchone()[0]
+
+    def test_fresh_then_incremental(self, con):
+        """A recorded watermark makes the next plan fresh, and new rows make it incremental."""
+        hi = decide_mode(con, "test").hi
+        record_watermark(con, "test", hi)
+        assert decide_mode(con, "test") == ("fresh", hi, hi)
+        record_watermark(con, "test", hi - 10)
+        assert decide_mode(con, "test") == ("incremental", hi - 10, hi)
+
+    def test_full_triggers(self, con, built_db):
+        """A request, a missing table, a shrunk orders table or a rebuild force a full plan."""
+        hi = decide_mode(con, "test").hi
+        record_watermark(con, "test", hi)
+        assert decide_mode(con, "test", full=True).mode == "full"
+        assert decide_mode(con, "test", tables=("no_such_table",)).mode == "full"
+        record_watermark(con, "test", hi + 1)
+        assert decide_mode(con, "test").mode == "full"
+        record_watermark(con, "test", hi)
+        full_rebuild(built_db)
+        assert decide_mode(con, "test").mode == "full"
+
+    def test_record_watermark_keys(self, con):
+        """The watermark and generation are stored under the prefix."""
+        record_watermark(con, "test", 7)
+        assert get_state(con, "test_rowid") == 7
+        assert get_state(con, "test_generation") == get_state(con, "orders_generation")
@@ -0,0 +1,40 @@
+"""Tests for covering indexes and the query-plan check."""
+import sqlite3
+
+from clean import full_rebuild
+from indexes import check_query_plans, ensure_indexes, plan_problems
+
+
+class TestQueryPlans:
+    """Test the EXPLAIN QUERY PLAN regression check."""
+
+    def test_plan_problems(self):
+        """Table scans and GROUP BY sorts are flagged; index scans are not."""
+        assert plan_problems(["SCAN orders", "USE TEMP B-TREE FOR GROUP BY"]) == [
+            "SCAN orders",
+            "USE TEMP B-TREE FOR GROUP BY",
+        ]
+        assert plan_problems(["SCAN orders USING COVERING INDEX idx_orders_sku_cover", "USE TEMP B-TREE FOR ORDER BY"]) == []
+
+    def test_views_fail_without_indexes(self, built_db):
+        """Every required view scans orders before indexes exist."""
+        with sqlite3.connect(built_db) as con:
+            con.executescript(
+                "DROP INDEX IF EXISTS idx_orders_month_cover; DROP INDEX IF EXISTS idx_orders_sku_cover;"
+                "DROP INDEX IF EXISTS idx_orders_country_cover; DROP INDEX IF EXISTS idx_orders_customer_cover;"
+            )
+            failures = check_query_plans(con)
+        assert set(failures) == {"v_orders_month", "v_country_summary", "v_top_customers", "v_sku_abc"}
+
+    def test_views_pass_with_indexes(self, built_db):
+        """Covering indexes remove every table scan and GROUP BY sort."""
+        with sqlite3.connect(built_db) as con:
+            ensure_indexes(con)
+            assert check_query_plans(con) == {}
+
+    def test_full_rebuild_restores_indexes(self, built_db):
+        """Both engines recreate the indexes that rebuilding orders drops."""
+        for engine in ("sql", "python"):
+            full_rebuild(built_db, engine=engine)
+            with sqlite3.connect(built_db) as con:
+                assert check_query_plans(con) == {}
@@ -0,0 +1,84 @@
+"""Tests for the streaming CSV ingest."""
+import sqlite3
+
+import pytest
+
+from tests.sample_data import make_raw_rows, write_csv
+from ingest import APPEND_PRAGMAS, BULK_PRAGMAS, ingest_csv, iter_chunks
+
+
+class TestIngest:
+    """Test ingest_csv and its helpers."""
+
+    def test_iter_chunks_sizes(self):
+        """Chunks are fixed-size with a short tail."""
+        chunks = list(iter_chunks(iter([[i] for i in range(7)]), 3))
+        assert [len(c) for c in chunks] == [3, 3, 1]
+
+    def test_iter_chunks_rejects_zero(self):
+        """A zero chunk size is an error."""
+        with pytest.raises(ValueError, match="chunk_size"):
+            list(iter_chunks(iter([]), 0))
+
+    def test_ingest_loads_all_rows(self, tmp_path, raw_csv):
+        """Every CSV row lands in orders_raw, across chunk boundaries."""
+        db = str(tmp_path / "t.db")
+        stats = ingest_csv(raw_csv, db, chunk_size=7, reset=True)
+        with sqlite3.connect(db) as con:
+            count = con.execute("SELECT COUNT(*) FROM orders_raw").fetchone()[0]
+        assert stats["rows"] == count == len(make_raw_rows())
+        assert stats["rows_per_sec"] > 0
+
+    def test_ingest_matches_sqlite_utils_storage(self, tmp_path):
+        """Numbers get column affinity, blank customers stay empty strings."""
+        csv_path = write_csv(tmp_path / "one.csv", [["536365", "85123A", "HEART", "6", "12/1/2010 8:26", "2.55", "", "France"]])
+        db = str(tmp_path / "t.db")
+        ingest_csv(csv_path, db, reset=True)
+        with sqlite3.connect(db) as con:
+            row = con.execute("SELECT typeof(Quantity), typeof(UnitPrice), CustomerID FROM orders_raw").fetchone()
+        assert row == ("integer", "real", "")
+
+    def test_ingest_requires_schema(self, tmp_path, raw_csv):
+        """Without --reset the orders_raw table must already exist."""
+        with pytest.raises(ValueError, match="orders_raw"):
+            ingest_csv(raw_csv, str(tmp_path / "empty.db"))
+
+    def test_ingest_missing_columns(self, tmp_path):
+        """A CSV without the expected header is rejected."""
+        bad = tmp_path / "bad.csv"
+        bad.write_text("a,b\n1,2\n")
+        with pytest.raises(ValueError, match="missing required columns"):
+            ingest_csv(bad, str(tmp_path / "t.db"), reset=True)
+
+    def test_ingest_skips_blank_lines(self, tmp_path):
+        """Empty lines, including trailing ones, are skipped rather than loaded or rejected."""
+        csv_path = write_csv(tmp_path / "gaps.csv", make_raw_rows(5))
+        csv_path.write_text(csv_path.read_text(encoding="latin-1").replace("\n", "\n\n", 1) + "\n\n", encoding="latin-1")
+        db = str(tmp_path / "t.db")
+        stats = ingest_csv(csv_path, db, reset=True)
+        with sqlite3.connect(db) as con:
+            count = con.execute("SELECT COUNT(*) FROM orders_raw").fetchone()[0]
+        assert stats["rows"] == count == len(make_raw_rows(5))
+
+    def test_ingest_short_row(self, tmp_path):
+        """A row with too few fields names its line and loads nothing."""
+        csv_path = write_csv(tmp_path / "short.csv", make_raw_rows(2))
+        with open(csv_path, "a", encoding="latin-1") as fh:
+            fh.write("536999,85123A,HEART\n")
+        lines = len(csv_path.read_text(encoding="latin-1").splitlines())
+        db = str(tmp_path / "t.db")
+        with pytest.raises(ValueError, match=f"line {lines} has 3 fields"):
+            ingest_csv(csv_path, db, reset=True)
+        with sqlite3.connect(db) as con:
+            assert con.execute("SELECT COUNT(*) FROM orders_raw").fetchone()[0] == 0
+
+    def test_only_reset_loads_skip_durability(self, tmp_path, raw_csv, monkeypatch):
+        """A reset load uses the bulk PRAGMAs; an append into the existing database keeps them safe."""
+        import ingest
+        applied = []
+        monkeypatch.setattr(ingest, "apply_pragmas", lambda con, pragmas: applied.append(pragmas))
+        db = str(tmp_path / "t.db")
+        ingest_csv(raw_csv, db, reset=True)
+        ingest_csv(raw_csv, db)
+        assert applied == [BULK_PRAGMAS, APPEND_PRAGMAS]
+        assert "journal_mode" not in APPEND_PRAGMAS and APPEND_PRAGMAS["synchronous"] != "OFF"
@@ -0,0 +1,82 @@
+"""Tests for the materialized summary tables."""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from clean import full_rebuild, refresh_orders
+from ingest import ingest_csv
+from materialize import MATERIALIZED_VIEWS, refresh, staleness
+from tests.sample_data import make_raw_rows, write_csv
+
+ORDER_BY = {
+    "v_orders_month": "ym",
+    "v_sku_abc": "sku",
+    "v_country_summary": "country",
+    "v_customer_value": "customer_id",
+    "v_top_customers": "customer_id",
+}
+
+
+def assert_views_match(db):
+    with sqlite3.connect(db) as con:
+        for view, mat in MATERIALIZED_VIEWS.items():
+            expected = pd.read_sql_query(f"SELECT * FROM {view} ORDER BY {ORDER_BY[view]}", con)
+            actual = pd.read_sql_query(f"SELECT * FROM {mat} ORDER BY {ORDER_BY[view]}", con)
+            pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+class TestMaterialize:
+    """Test full and incremental refresh of the summaries."""
+
+    def test_full_refresh_matches_views(self, built_db):
+        """A first refresh builds summaries equal to the plain views."""
+        result = refresh(built_db)
+        assert result["mode"] == "full"
+        assert_views_match(built_db)
+
+    def test_second_refresh_is_fresh(self, built_db):
+        """Nothing is recomputed when orders has not changed."""
+        refresh(built_db)
+        assert refresh(built_db)["mode"] == "fresh"
+
+    def test_incremental_refresh_matches_views(self, built_db, tmp_path):
+        """Appended orders are folded in, including repeat invoices and customers."""
+        refresh(built_db)
+        delta = write_csv(tmp_path / "delta.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        ingest_csv(delta, built_db)
+        refresh_orders(built_db)
+
+        with sqlite3.connect(built_db) as con:
+            status = staleness(con)
+        assert status["mode"] == "incremental" and status["pending_rows"] > 0
+
+        result = refresh(built_db)
+        assert result["mode"] == "incremental"
+        assert result["rows"] == status["pending_rows"]
+        assert_views_match(built_db)
+
+    def test_rebuilt_orders_forces_full(self, built_db):
+        """A full rebuild of orders invalidates the summaries."""
+        refresh(built_db)
+        full_rebuild(built_db)
+        assert refresh(built_db)["mode"] == "full"
+        assert_views_match(built_db)
+
+    def test_failed_rebuild_keeps_old_summaries(self, built_db, monkeypatch):
+        """The DROP/CREATE of a full refresh rolls back with the deltas when one fails."""
+        import materialize
+        refresh(built_db)
+        monkeypatch.setattr(materialize, "DELTA_SQL", materialize.DELTA_SQL + ["SELECT * FROM no_such_table"])
+        with pytest.raises(RuntimeError, match="no_such_table"):
+            refresh(built_db, full=True)
+        monkeypatch.undo()
+        assert_views_match(built_db)
+        assert refresh(built_db)["mode"] == "fresh"
+
+    def test_requires_orders(self, tmp_path):
+        """The orders table must exist."""
+        db = tmp_path / "empty.db"
+        sqlite3.connect(db).close()
+        with pytest.raises(ValueError, match="orders"):
+            refresh(str(db))
@@ -0,0 +1,148 @@
+"""Tests for the year/month partitions of orders and the range router."""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import partitions
+from clean import full_rebuild, refresh_orders
+from ingest import ingest_csv
+from partitions import attach_range, load_catalog, partition_dir, query, query_view, refresh_partitions, verify
+from tests.sample_data import make_raw_rows, write_csv
+
+VIEWS = ["v_orders_month", "v_country_summary", "v_top_customers", "v_sku_abc"]
+
+
+def sorted_frame(df):
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def assert_views_match(db):
+    """Every view over all partitions equals the same view in the main database."""
+    for view in VIEWS:
+        with sqlite3.connect(db) as con:
+            expected = pd.read_sql_query(f"SELECT * FROM {view}", con)
+        actual = query_view(view, db)
+        pd.testing.assert_frame_equal(sorted_frame(actual), sorted_frame(expected), check_dtype=False)
+
+
+class TestRefresh:
+    """Building, sealing and incrementally extending partitions."""
+
+    def test_views_match_main_database(self, built_db):
+        """The four exported views over all partitions equal the main-database views."""
+        result = refresh_partitions(built_db, grain="month")
+        assert result["mode"] == "full"
+        assert result["appended"] == ["2010-01", "2010-02", "2010-03", "2010-04"]
+        assert refresh_partitions(built_db, grain="month")["mode"] == "fresh"
+        assert_views_match(built_db)
+
+    def test_closed_partitions_are_sealed(self, built_db):
+        """All but the newest partition are read-only with a recorded hash that verify() checks."""
+        refresh_partitions(built_db, grain="month")
+        catalog = load_catalog(built_db).set_index("key")
+        assert catalog["sealed"].tolist() == [1, 1, 1, 0]
+        sealed = partition_dir(built_db) / catalog.loc["2010-01", "file"]
+        assert not sealed.stat().st_mode & 0o222
+        assert verify(built_db) == []
+
+        sealed.chmod(0o644)
+        with sqlite3.connect(sealed) as con:
+            con.execute("DELETE FROM orders WHERE rowid IN (SELECT rowid FROM orders LIMIT 1)")
+        assert verify(built_db) == ["2010-01"]
+
+    def test_late_rows_reopen_a_sealed_partition(self, built_db, tmp_path):
+        """Rows for an already sealed month are appended, the partition resealed and views still match."""
+        refresh_partitions(built_db, grain="month")
+        delta = write_csv(tmp_path / "delta.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        ingest_csv(delta, built_db)
+        refresh_orders(built_db)
+        result = refresh_partitions(built_db, grain="month")
+        assert result["mode"] == "incremental" and result["rows"] > 0
+        assert result["appended"] == ["2010-03", "2010-04", "2010-05"]
+        assert "2010-04" in result["sealed"]
+        assert verify(built_db) == []
+        assert_views_match(built_db)
+
+    def test_interrupted_append_is_redone_once(self, built_db, tmp_path):
+        """Rows appended to a partition before a failed refresh are replaced, not duplicated, on retry."""
+        refresh_partitions(built_db, grain="month")
+        ingest_csv(write_csv(tmp_path / "delta.csv", make_raw_rows(60, seed=11, start_month=3, months=3)), built_db)
+        refresh_orders(built_db)
+        with sqlite3.connect(built_db) as con:
+            lo = con.execute("SELECT value FROM etl_state WHERE name = 'partitions_orders_rowid'").fetchone()[0]
+            hi = con.execute("SELECT MAX(rowid) FROM orders").fetchone()[0]
+        # The append for 2010-05 committed, then the refresh died before recording its watermark
+        partitions._append(partition_dir(built_db), "2010-05", built_db, lo, hi)
+        result = refresh_partitions(built_db, grain="month")
+        assert result["mode"] == "incremental" and "2010-05" in result["appended"]
+        assert_views_match(built_db)
+
+    def test_rebuilt_orders_or_new_grain_forces_full(self, built_db):
+        """A full rebuild of orders, or a different grain, rebuilds every partition."""
+        refresh_partitions(built_db, grain="month")
+        full_rebuild(built_db)
+        assert refresh_partitions(built_db, grain="month")["mode"] == "full"
+        result = refresh_partitions(built_db, grain="year")
+        assert result["mode"] == "full" and result["appended"] == ["2010"]
+        assert sorted(p.name for p in partition_dir(built_db).iterdir()) == ["orders_2010.db"]
+        assert_views_match(built_db)
+
+
+class TestRouter:
+    """Range pruning and the attach limit."""
+
+    def test_range_attaches_only_overlapping_partitions(self, built_db):
+        """A range query opens only the partitions it touches and filters only the boundary ones."""
+        refresh_partitions(built_db, grain="month")
+        with attach_range(built_db, "2010-02-15", "2010-03") as con:
+            attached = [row[1] for row in con.execute("PRAGMA database_list")]
+            dates = con.execute("SELECT MIN(order_date), MAX(order_date) FROM orders").fetchone()
+        assert attached == ["main", "temp", "p0", "p1"]
+        assert dates[0] >= "2010-02-15" and dates[1] < "2010-04"
+
+        with sqlite3.connect(built_db) as con:
+            expected = con.execute(
+                "SELECT COUNT(*) FROM orders WHERE order_date BETWEEN '2010-02-15' AND '2010-03-31 23:59:59'"
+            ).fetchone()[0]
+        assert query("SELECT COUNT(*) AS n FROM orders", built_db, "2010-02-15", "2010-03")["n"][0] == expected
+
+    def test_more_partitions_than_attach_limit(self, built_db, monkeypatch):
+        """Past MAX_ATTACHED partitions are copied into a temp table batch by batch; results are unchanged."""
+        refresh_partitions(built_db, grain="month")
+        monkeypatch.setattr(partitions, "MAX_ATTACHED", 3)
+        with attach_range(built_db) as con:
+            assert [row[1] for row in con.execute("PRAGMA database_list")] == ["main", "temp"]
+        assert_views_match(built_db)
+
+    def test_bad_range(self, built_db):
+        """Malformed or inverted dates are rejected."""
+        refresh_partitions(built_db)
+        with pytest.raises(ValueError, match="YYYY-MM"):
+            query_view("v_orders_month", built_db, start="March")
+        with pytest.raises(ValueError, match="after end"):
+            query_view("v_orders_month", built_db, start="2010-04", end="2010-01")
+
+
+def test_charts_partitioned_export(built_db, tmp_path, monkeypatch):
+    """charts.py export --partitioned --start writes only the months in range."""
+    import charts
+    monkeypatch.setattr(charts, "DB", built_db)
+    monkeypatch.setattr(charts, "DATA", tmp_path / "data")
+    charts.main(["export", "--partitioned", "--start", "2010-02"])
+    monthly = pd.read_csv(tmp_path / "data" / "orders_month.csv")
+    assert monthly["ym"].tolist() == ["2010-02", "2010-03", "2010-04"]
+    assert (partition_dir(built_db) / "orders_2010.db").exists()
+
+
+def test_charts_full_range_reads_main_database(built_db, tmp_path, monkeypatch):
+    """Without --start/--end the partitions are refreshed but the views run on the main database."""
+    import charts
+    monkeypatch.setattr(charts, "DB", built_db)
+    monkeypatch.setattr(charts, "DATA", tmp_path / "data")
+    monkeypatch.setattr(partitions, "attach_range", lambda *a, **k: pytest.fail("partitions attached"))
+    charts.main(["export", "--partitioned"])
+    charts.close_connections()
+    monthly = pd.read_csv(tmp_path / "data" / "orders_month.csv")
+    assert monthly["ym"].tolist() == ["2010-01", "2010-02", "2010-03", "2010-04"]
+    assert (partition_dir(built_db) / "orders_2010.db").exists()
@@ -0,0 +1,185 @@
+"""Tests for the dependency-aware pipeline scheduler."""
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import pipeline
+from materialize import staleness
+from pipeline import Stage, build_stages, run_pipeline, watch
+from tests.sample_data import make_raw_rows, write_csv
+
+
+def counting_stage(name, deps, inputs, calls, fail=False):
+    """A stage whose inputs come from the `inputs` dict and that logs its runs in `calls`."""
+    def run(previous):
+        calls.append(name)
+        if fail:
+            raise ValueError(f"{name} broke")
+        return {"run": calls.count(name)}
+    return Stage(name, deps, lambda previous: {"value": inputs.get(name)}, run)
+
+
+class TestScheduler:
+    """Change detection and ordering on a toy DAG."""
+
+    def test_reruns_only_changed_stages(self, tmp_path):
+        """Unchanged stages are skipped; a changed one reruns without touching its siblings."""
+        db = str(tmp_path / "state.db")
+        inputs, calls = {"a": 1, "b": 1, "c": 1}, []
+        stages = [
+            counting_stage("a", [], inputs, calls),
+            counting_stage("b", ["a"], inputs, calls),
+            counting_stage("c", ["a"], inputs, calls),
+        ]
+        assert {r["status"] for r in run_pipeline(stages, db).values()} == {"ran"}
+        assert {r["status"] for r in run_pipeline(stages, db).values()} == {"skipped"}
+        inputs["b"] = 2
+        results = run_pipeline(stages, db)
+        assert {name: r["status"] for name, r in results.items()} == {"a": "skipped", "b": "ran", "c": "skipped"}
+        assert sorted(calls) == ["a", "b", "b", "c"]
+        assert run_pipeline(stages, db, force=["c"])["c"]["outputs"] == {"run": 2}
+
+    def test_independent_stages_run_concurrently(self, tmp_path):
+        """Siblings run at the same time: each waits for the other at a barrier."""
+        barrier = threading.Barrier(2, timeout=5)
+
+        def meet(previous):
+            barrier.wait()
+            return {}
+
+        stages = [
+            Stage("root", [], lambda previous: {}, lambda previous: {}),
+            Stage("left", ["root"], lambda previous: {}, meet),
+            Stage("right", ["root"], lambda previous: {}, meet),
+        ]
+        results = run_pipeline(stages, str(tmp_path / "state.db"), jobs=2)
+        assert {r["status"] for r in results.values()} == {"ran"}
+
+    def test_failure_blocks_dependents(self, tmp_path):
+        """A failed stage blocks what depends on it, lets the rest finish and is retried next run."""
+        db = str(tmp_path / "state.db")
+        inputs, calls = {}, []
+        stages = [
+            counting_stage("a", [], inputs, calls, fail=True),
+            counting_stage("b", ["a"], inputs, calls),
+            counting_stage("c", [], inputs, calls),
+        ]
+        with pytest.raises(RuntimeError, match="a broke"):
+            run_pipeline(stages, db)
+        assert sorted(calls) == ["a", "c"]
+        stages[0] = counting_stage("a", [], inputs, calls)
+        results = run_pipeline(stages, db)
+        assert {name: r["status"] for name, r in results.items()} == {"a": "ran", "b": "ran", "c": "skipped"}
+
+    def test_dependencies_must_come_first(self, tmp_path):
+        """Stages are listed in dependency order."""
+        stages = [Stage("b", ["a"], dict, dict), Stage("a", [], dict, dict)]
+        with pytest.raises(ValueError, match="must be listed before"):
+            run_pipeline(stages, str(tmp_path / "state.db"))
+
+
+class TestLedgerLensPipeline:
+    """The real stages over a drop directory."""
+
+    @pytest.fixture
+    def setup(self, tmp_path, monkeypatch):
+        import charts
+        monkeypatch.setattr(charts, "DATA", tmp_path / "data")
+        monkeypatch.setattr(charts, "ASSETS", tmp_path / "assets")
+        drop = tmp_path / "drop"
+        drop.mkdir()
+        write_csv(drop / "2010-01.csv", make_raw_rows())
+        db = str(tmp_path / "ledgerlens.db")
+        return db, drop, build_stages(db, drop)
+
+    @staticmethod
+    def orders(db):
+        with sqlite3.connect(db) as con:
+            return con.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    def test_new_drop_runs_incrementally(self, setup, tmp_path):
+        """A second CSV is appended and cleaned incrementally; schema, indexes and views are skipped."""
+        db, drop, stages = setup
+        run_pipeline(stages, db)
+        before = self.orders(db)
+        assert len(list((tmp_path / "assets").glob("*.png"))) > 0
+
+        write_csv(drop / "2010-03.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        results = run_pipeline(stages, db)
+        status = {name: r["status"] for name, r in results.items()}
+        assert status == {
+            "schema": "skipped", "ingest": "ran", "clean": "ran", "indexes": "skipped",
+            "views": "skipped", "materialize": "ran", "export": "ran", "render": "ran", "quality": "ran",
+        }
+        assert results["materialize"]["outputs"]["mode"] == "incremental"
+        assert results["ingest"]["outputs"]["files"] == ["2010-03.csv"]
+        assert results["clean"]["outputs"]["mode"] == "incremental"
+        assert self.orders(db) > before
+
+    def test_stage_order_and_db(self, setup):
+        """quality waits for the DDL writers, and export reaches db without repointing charts.DB."""
+        import charts
+        db, _, stages = setup
+        deps = {stage.name: stage.deps for stage in stages}
+        assert set(deps["materialize"]) == {"indexes", "views"}
+        assert tuple(deps["quality"]) == tuple(deps["export"]) == ("materialize",)
+        default = charts.DB
+        run_pipeline(stages, db)
+        assert charts.DB == default != db
+
+    def test_top_customers_read_the_index_after_a_load(self, setup, tmp_path, monkeypatch):
+        """The summaries are current after each run, so the export never falls back to v_top_customers."""
+        import customer_topk
+        db, drop, stages = setup
+        monkeypatch.setattr(customer_topk, "VIEW_SQL", "SELECT * FROM no_such_view")
+        run_pipeline(stages, db)
+        write_csv(drop / "2010-03.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        run_pipeline(stages, db)
+        with sqlite3.connect(db) as con:
+            assert not staleness(con)["stale"]
+            expected = pd.read_sql_query("SELECT revenue FROM v_top_customers ORDER BY revenue_rank", con)
+        exported = pd.read_csv(tmp_path / "data" / "top_customers.csv")
+        assert exported["revenue"].tolist() == pytest.approx(expected["revenue"].tolist())
+
+    def test_edited_file_reloads_everything(self, setup):
+        """Changing an already loaded CSV reloads orders_raw from every file."""
+        db, drop, stages = setup
+        run_pipeline(stages, db)
+        rows = self.orders(db)
+        write_csv(drop / "2010-01.csv", make_raw_rows(seed=8))
+        results = run_pipeline(stages, db)
+        assert results["ingest"]["outputs"]["mode"] == "reload"
+        assert self.orders(db) != rows
+
+    def test_edit_keeping_row_count_rebuilds_orders(self, setup):
+        """An edited CSV with the same number of rows (doubled prices) is cleaned again from scratch."""
+        db, drop, stages = setup
+        run_pipeline(stages, db)
+        with sqlite3.connect(db) as con:
+            revenue = con.execute("SELECT SUM(gross_revenue) FROM orders").fetchone()[0]
+        rows = make_raw_rows()
+        for row in rows:
+            row[5] = str(float(row[5]) * 2)
+        write_csv(drop / "2010-01.csv", rows)
+        results = run_pipeline(stages, db)
+        assert results["ingest"]["outputs"]["mode"] == "reload"
+        assert results["clean"]["status"] == "ran" and results["clean"]["outputs"]["mode"] == "full"
+        with sqlite3.connect(db) as con:
+            assert con.execute("SELECT SUM(gross_revenue) FROM orders").fetchone()[0] == pytest.approx(2 * revenue)
+
+    def test_watch_picks_up_drops(self, setup):
+        """watch() runs once at start and again when a new CSV lands."""
+        db, drop, stages = setup
+        thread = threading.Thread(target=watch, args=(stages, db, drop, 0.05), kwargs={"max_runs": 2})
+        thread.start()
+        deadline = time.time() + 60
+        while "render" not in pipeline.load_state(db) and time.time() < deadline:
+            time.sleep(0.05)
+        rows = self.orders(db)
+        write_csv(drop / "2010-03.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        thread.join(timeout=60)
+        assert not thread.is_alive()
+        assert self.orders(db) > rows
@@ -0,0 +1,141 @@
+"""Tests for pipeline span tracing and SQLite statement capture."""
+import json
+import pstats
+import sqlite3
+import time
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture
+def tracer():
+    tracer = profiling.enable()
+    yield tracer
+    profiling.disable()
+
+
+class TestSpans:
+    """Span recording and the decorator."""
+
+    def test_disabled_is_a_plain_call(self):
+        """With no active tracer, traced functions and spans just run."""
+        profiling.disable()
+
+        @profiling.traced("test")
+        def double(x):
+            return 2 * x
+
+        with profiling.span("block") as args:
+            args["rows"] = 1
+        assert double(4) == 8
+        assert profiling.active() is None
+
+    def test_nested_spans(self, tracer):
+        """Spans record their parent, depth, category and args."""
+        @profiling.traced("export")
+        def export():
+            with profiling.span("write_csv", "io", file="a.csv") as args:
+                args["rows"] = 3
+
+        export()
+        spans = {s["name"]: s for s in tracer.to_dict()["spans"]}
+        assert spans["export"]["category"] == "export" and spans["export"]["depth"] == 0
+        assert spans["write_csv"]["parent"] == "export" and spans["write_csv"]["depth"] == 1
+        assert spans["write_csv"]["args"] == {"file": "a.csv", "rows": 3}
+        assert spans["export"]["duration_us"] >= spans["write_csv"]["duration_us"]
+
+    def test_failed_span_records_error(self, tracer):
+        """An exception is recorded on the span and re-raised."""
+        with pytest.raises(ValueError):
+            with profiling.span("boom"):
+                raise ValueError("bad data")
+        assert tracer.spans[0]["args"]["error"] == "bad data"
+
+
+class TestStatements:
+    """SQLite trace and progress callbacks."""
+
+    def test_statements_are_attributed_to_spans(self, tracer):
+        """Each statement gets its SQL, span, duration, VM steps and the rows fetched from it."""
+        con = profiling.connect(":memory:")
+        con.execute("CREATE TABLE t(x)")
+        con.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(5000)])
+        with profiling.span("q", "sql"):
+            rows = con.execute("SELECT x FROM t WHERE x % 2 = 0").fetchall()
+            time.sleep(0.05)
+        con.close()
+
+        select = [s for s in tracer.statements if s["sql"].startswith("SELECT")]
+        assert len(select) == 1
+        assert select[0]["span"] == "q" and select[0]["rows"] == len(rows) == 2500
+        assert select[0]["vm_steps"] > 0 and select[0]["duration_us"] > 0
+        # The statement ended when its rows ran out, not when the span did
+        assert select[0]["duration_us"] < tracer.spans[0]["duration_us"] - 40_000
+        assert tracer.spans[0]["statements"] == 1
+
+    def test_cursor_iteration_and_chunks(self, tracer):
+        """Rows are counted when iterating a cursor and when pandas reads in chunks."""
+        import pandas as pd
+        con = profiling.connect(":memory:")
+        con.execute("CREATE TABLE t(x)")
+        con.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(250)])
+        assert sum(1 for _ in con.execute("SELECT x FROM t")) == 250
+        assert sum(len(c) for c in pd.read_sql_query("SELECT x AS y FROM t", con, chunksize=100)) == 250
+        con.close()
+        rows = {s["sql"]: s["rows"] for s in tracer.statements if s["sql"].startswith("SELECT")}
+        assert rows == {"SELECT x FROM t": 250, "SELECT x AS y FROM t": 250}
+
+    def test_engine_statements_are_traced(self, tracer, built_db):
+        """Connections opened by the engines are hooked too."""
+        from materialize import refresh
+        with profiling.span("refresh"):
+            refresh(built_db)
+        assert any(s["span"] == "refresh" and "mv_month" in s["sql"] for s in tracer.statements)
+
+    def test_plain_connection_without_tracer(self):
+        """With tracing off connect() adds no Python layer to the cursors."""
+        assert profiling.active() is None
+        con = profiling.connect(":memory:")
+        try:
+            assert type(con) is sqlite3.Connection and type(con.execute("SELECT 1")) is sqlite3.Cursor
+        finally:
+            con.close()
+
+    def test_chrome_trace(self, tracer, tmp_path):
+        """Spans and statements become complete events in the Chrome trace format."""
+        con = profiling.connect(":memory:")
+        with profiling.span("validate_database", "validate"):
+            con.execute("SELECT 1").fetchall()
+        con.close()
+        path = tracer.write_chrome_trace(tmp_path / "trace.json")
+        events = json.loads(path.read_text())["traceEvents"]
+        assert {e["cat"] for e in events} == {"validate", "sqlite"}
+        assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+
+
+def test_profile_dump(tmp_path):
+    """profile() writes stats that pstats can load."""
+    path = tmp_path / "run.prof"
+    with profiling.profile(path):
+        sum(range(1000))
+    assert pstats.Stats(str(path)).total_calls > 0
+
+
+def test_charts_trace(built_db, tmp_path, monkeypatch, capsys):
+    """charts.py --trace records the export, query and write spans of a run."""
+    import charts
+    monkeypatch.setattr(charts, "DB", built_db)
+    monkeypatch.setattr(charts, "DATA", tmp_path / "data")
+    trace = tmp_path / "trace.json"
+    charts.main(["export", "--trace", str(trace)])
+    assert profiling.active() is None
+
+    data = json.loads(trace.read_text())
+    names = [s["name"] for s in data["spans"]]
+    assert names[0] == "export"
+    for name in ("validate_database", "export_monthly_kpis", "validate_monthly_data", "q", "write_csv"):
+        assert name in names
+    assert any(s["span"] == "q" and s.get("rows") for s in data["statements"])
+    assert "Slowest spans" in capsys.readouterr().out
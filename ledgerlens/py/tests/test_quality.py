@@ -0,0 +1,97 @@
+"""Tests for the data-quality rule engine."""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from quality import (
+    ORDER_RULES,
+    SKU_RULES,
+    Rule,
+    check_frame,
+    check_orders,
+    evaluate,
+)
+
+
+class TestRules:
+    """Rule evaluation on in-memory frames."""
+
+    def test_evaluate_one_mask_per_rule(self):
+        """evaluate() returns a rules x rows boolean matrix."""
+        df = pd.DataFrame({"revenue": [1.0, -2.0, None]})
+        rules = [
+            Rule("negative", "negative revenue", ["revenue"], lambda d: d["revenue"] < 0),
+            Rule("null", "null revenue", ["revenue"], lambda d: d["revenue"].isna(), "warning"),
+        ]
+        masks = evaluate(df, rules)
+        assert masks.tolist() == [[False, True, False], [False, False, True]]
+
+    def test_invalid_severity(self):
+        """Only error and warning severities exist."""
+        with pytest.raises(ValueError, match="severity"):
+            Rule("x", "x", ["a"], lambda d: d["a"].isna(), "fatal")
+
+    def test_report_counts_and_samples(self):
+        """Violations are counted across chunks and samples are capped."""
+        rules = [Rule("negative", "negative revenue", ["revenue"], lambda d: d["revenue"] < 0)]
+        report = check_frame(pd.DataFrame({"revenue": [-1.0, 2.0, -3.0]}, index=[10, 11, 12]), rules, samples=3)
+        report.add(pd.DataFrame({"revenue": [-4.0, -5.0]}), ids=[20, 21])
+        result = report.results()[0]
+        assert result["violations"] == 4
+        assert result["sample_row_ids"] == [10, 12, 20]
+        assert report.rows == 5 and report.chunks == 2
+        with pytest.raises(ValueError, match="Found 4 rows with negative revenue"):
+            report.raise_for_errors()
+
+    def test_warnings_do_not_raise(self):
+        """Warning-severity violations are reported but never raise."""
+        df = pd.DataFrame({"sku": ["A1", "B2"], "revenue": [10.0, 5.0], "abc_class": ["A", "Z"]})
+        report = check_frame(df, SKU_RULES)
+        report.raise_for_errors()
+        assert [r["rule"] for r in report.failures("warning")] == ["abc_class_invalid"]
+
+
+class TestOrders:
+    """Chunked checks over the orders table."""
+
+    def test_clean_orders_have_no_errors(self, built_db):
+        """The cleaned fact table passes every error rule; anonymous buyers are warnings."""
+        report = check_orders(built_db, chunk_size=50)
+        with sqlite3.connect(built_db) as con:
+            total = con.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+            anonymous = con.execute(
+                "SELECT COUNT(*) FROM orders WHERE customer_id IS NULL OR TRIM(customer_id) = ''"
+            ).fetchone()[0]
+        assert report.rows == total
+        assert report.chunks == -(-total // 50)
+        assert report.failures("error") == []
+        customers = next(r for r in report.results() if r["rule"] == "customer_missing")
+        assert customers["violations"] == anonymous > 0
+
+    def test_sample_ids_are_rowids(self, built_db):
+        """Broken rows are counted once per rule and sampled by orders rowid."""
+        with sqlite3.connect(built_db) as con:
+            con.execute("UPDATE orders SET gross_revenue = -1 WHERE rowid IN (3, 70)")
+            con.execute("UPDATE orders SET order_month = '1999-01' WHERE rowid = 5")
+        report = check_orders(built_db, chunk_size=50)
+        failed = {r["rule"]: r for r in report.failures("error")}
+        assert set(failed) == {"revenue_mismatch", "profit_mismatch", "order_month_mismatch"}
+        assert failed["revenue_mismatch"]["violations"] == 2
+        assert failed["revenue_mismatch"]["sample_row_ids"] == [3, 70]
+        assert failed["order_month_mismatch"]["sample_row_ids"] == [5]
+        with pytest.raises(ValueError, match="order_month that does not match"):
+            report.raise_for_errors()
+
+    def test_reads_only_rule_columns(self, built_db):
+        """A rule set over one column scans orders without the others."""
+        rules = [r for r in ORDER_RULES if r.columns == ("qty",)]
+        report = check_orders(built_db, rules)
+        assert [r["rule"] for r in report.results()] == ["qty_not_positive"]
+
+    def test_missing_table(self, tmp_path):
+        """A database without orders is a ValueError."""
+        db = tmp_path / "empty.db"
+        sqlite3.connect(db).close()
+        with pytest.raises(ValueError, match="orders"):
+            check_orders(str(db))
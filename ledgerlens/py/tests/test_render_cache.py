@@ -0,0 +1,57 @@
+"""Tests for the content-hash render cache."""
+import pandas as pd
+
+from render_cache import MANIFEST_NAME, RenderCache, frame_fingerprint
+
+
+class TestFingerprint:
+    """Test frame_fingerprint."""
+
+    def test_same_data_same_fingerprint(self):
+        """Equal frames hash equally."""
+        a = pd.DataFrame({"ym": ["2021-01"], "revenue": [1.5]})
+        assert frame_fingerprint(a) == frame_fingerprint(a.copy())
+
+    def test_value_and_param_changes(self):
+        """Values, dtypes and parameters all change the fingerprint."""
+        a = pd.DataFrame({"revenue": [1.5, 2.0]})
+        assert frame_fingerprint(a) != frame_fingerprint(pd.DataFrame({"revenue": [1.5, 2.5]}))
+        assert frame_fingerprint(a) != frame_fingerprint(a.astype("float32"))
+        assert frame_fingerprint(a, "dpi=160") != frame_fingerprint(a, "dpi=200")
+
+
+class TestRenderCache:
+    """Test manifest bookkeeping."""
+
+    def test_hit_after_record_and_save(self, tmp_path):
+        """A recorded artifact is fresh in the next run."""
+        (tmp_path / "a.csv").write_text("x\n")
+        cache = RenderCache(tmp_path)
+        assert not cache.is_fresh("a.csv", "f1")
+        cache.record("a.csv", "f1")
+        cache.save()
+
+        again = RenderCache(tmp_path)
+        assert again.is_fresh("a.csv", "f1")
+        assert not again.is_fresh("a.csv", "f2")
+        assert (again.hits, again.misses) == (["a.csv"], ["a.csv"])
+
+    def test_missing_file_is_stale(self, tmp_path):
+        """A deleted artifact is rebuilt even if the manifest matches."""
+        cache = RenderCache(tmp_path)
+        cache.record("gone.png", "f1")
+        assert not cache.is_fresh("gone.png", "f1")
+
+    def test_disabled_cache(self, tmp_path):
+        """A disabled cache never hits and never writes a manifest."""
+        (tmp_path / "a.csv").write_text("x\n")
+        cache = RenderCache(tmp_path, enabled=False)
+        cache.record("a.csv", "f1")
+        assert not cache.is_fresh("a.csv", "f1")
+        cache.save()
+        assert not (tmp_path / MANIFEST_NAME).exists()
+
+    def test_corrupt_manifest(self, tmp_path):
+        """An unreadable manifest is treated as empty."""
+        (tmp_path / MANIFEST_NAME).write_text("{not json")
+        assert RenderCache(tmp_path).entries == {}
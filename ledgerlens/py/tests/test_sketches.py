@@ -0,0 +1,142 @@
+"""Tests for the HyperLogLog distinct-count sketches."""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from clean import full_rebuild, refresh_orders
+from ingest import ingest_csv
+from sketches import (
+    HyperLogLog,
+    approx_country_summary,
+    approx_distinct,
+    approx_monthly,
+    precision_for_error,
+    refresh_sketches,
+)
+from tests.sample_data import make_raw_rows, write_csv
+
+
+def assert_close(actual, expected, rel=0.05):
+    """Sketch estimates are within rel (or 2 for tiny counts) of the exact values."""
+    actual, expected = np.asarray(actual), np.asarray(expected)
+    assert np.all(np.abs(actual - expected) <= np.maximum(2, rel * expected))
+
+
+class TestHyperLogLog:
+    """The sketch itself."""
+
+    def test_precision_for_error(self):
+        """Smaller error bounds need more registers."""
+        assert precision_for_error(0.02) == 12
+        assert precision_for_error(0.01) == 14
+        with pytest.raises(ValueError):
+            precision_for_error(0)
+
+    @pytest.mark.parametrize("n", [50, 5_000, 50_000])
+    def test_estimate_within_error(self, n):
+        """Estimates stay within three standard errors; duplicates do not count."""
+        sketch = HyperLogLog.for_error(0.02)
+        sketch.add(f"c{i}" for i in range(n))
+        sketch.add(f"c{i}" for i in range(n // 2))
+        assert abs(sketch.count() - n) <= max(2, 3 * sketch.standard_error * n)
+
+    def test_merge_is_union(self):
+        """Merging sketches estimates the size of the union."""
+        a, b = HyperLogLog(12), HyperLogLog(12)
+        a.add(range(5_000))
+        b.add(range(2_500, 9_000))
+        assert abs(a.merge(b).count() - 9_000) <= 3 * a.standard_error * 9_000
+        with pytest.raises(ValueError):
+            a.merge(HyperLogLog(10))
+
+    def test_round_trip_bytes(self):
+        """Registers survive serialization."""
+        sketch = HyperLogLog(8)
+        sketch.add(["a", "b", "c"])
+        assert HyperLogLog.from_bytes(8, sketch.to_bytes()).count() == sketch.count()
+
+
+class TestSketchRefresh:
+    """Stored per-month and per-country sketches."""
+
+    def test_matches_views(self, built_db):
+        """Approximate frames equal the views except for estimated distinct counts."""
+        assert refresh_sketches(built_db)["mode"] == "full"
+        with sqlite3.connect(built_db) as con:
+            month = pd.read_sql_query("SELECT * FROM v_orders_month ORDER BY ym", con)
+            country = pd.read_sql_query("SELECT * FROM v_country_summary ORDER BY country", con)
+        approx = approx_monthly(built_db)
+        assert list(approx.columns) == list(month.columns)
+        assert_close(approx["orders"], month["orders"])
+        assert_close(approx["buyers"], month["buyers"])
+        exact_cols = ["ym", "units", "revenue", "gross_profit", "aov", "revenue_mom_pct", "revenue_export"]
+        pd.testing.assert_frame_equal(approx[exact_cols], month[exact_cols], check_dtype=False)
+
+        approx_c = approx_country_summary(built_db).sort_values("country").reset_index(drop=True)
+        assert list(approx_c.columns) == list(country.columns)
+        assert_close(approx_c["buyers"], country["buyers"])
+        assert_close(approx_c["orders"], country["orders"])
+
+    def test_incremental_and_cross_period(self, built_db, tmp_path):
+        """Appended rows are folded in; merged months estimate distinct buyers across periods."""
+        refresh_sketches(built_db)
+        assert refresh_sketches(built_db)["mode"] == "fresh"
+        delta = write_csv(tmp_path / "delta.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        ingest_csv(delta, built_db)
+        refresh_orders(built_db)
+        result = refresh_sketches(built_db)
+        assert result["mode"] == "incremental" and result["rows"] > 0
+
+        with sqlite3.connect(built_db) as con:
+            months = [r[0] for r in con.execute("SELECT DISTINCT order_month FROM orders ORDER BY 1")][:3]
+            exact = con.execute(
+                f"SELECT COUNT(DISTINCT customer_id) FROM orders WHERE order_month IN ({','.join('?' * len(months))})",
+                months,
+            ).fetchone()[0]
+            month = pd.read_sql_query("SELECT ym, buyers FROM v_orders_month ORDER BY ym", con)
+        assert_close(approx_distinct(built_db, "month", "buyers", months), exact)
+        assert_close(approx_monthly(built_db)["buyers"], month["buyers"])
+
+    def test_rebuild_triggers(self, built_db):
+        """A new error bound or a rebuilt orders table forces a full rebuild."""
+        refresh_sketches(built_db, error=0.02)
+        assert refresh_sketches(built_db, error=0.01)["mode"] == "full"
+        full_rebuild(built_db)
+        assert refresh_sketches(built_db, error=0.01)["mode"] == "full"
+
+    def test_incremental_writes_only_touched_keys(self, built_db, tmp_path):
+        """Sketches for months the delta does not reach are left as stored."""
+        refresh_sketches(built_db)
+        with sqlite3.connect(built_db) as con:
+            con.execute("UPDATE hll_sketch SET registers = x'00' WHERE dimension = 'month' AND key = '2010-01'")
+        delta = write_csv(tmp_path / "delta.csv", make_raw_rows(60, seed=11, start_month=3, months=3))
+        ingest_csv(delta, built_db)
+        refresh_orders(built_db)
+        refresh_sketches(built_db)
+        with sqlite3.connect(built_db) as con:
+            untouched = {r[0] for r in con.execute(
+                "SELECT registers FROM hll_sketch WHERE dimension = 'month' AND key = '2010-01'"
+            )}
+            touched = con.execute(
+                "SELECT COUNT(*) FROM hll_sketch WHERE dimension = 'month' AND key = '2010-03' AND length(registers) > 1"
+            ).fetchone()[0]
+        assert untouched == {b"\x00"}
+        assert touched == 2
+
+    def test_failed_rebuild_keeps_old_sketches(self, built_db, monkeypatch):
+        """The DROP/CREATE of a full rebuild rolls back with the registers when writing them fails."""
+        import sketches
+        refresh_sketches(built_db)
+        before = approx_monthly(built_db)
+
+        def broken(self):
+            raise ValueError("sketch failed")
+
+        monkeypatch.setattr(sketches.HyperLogLog, "to_bytes", broken)
+        with pytest.raises(ValueError, match="sketch failed"):
+            refresh_sketches(built_db, full=True)
+        monkeypatch.undo()
+        pd.testing.assert_frame_equal(approx_monthly(built_db), before)
+        assert refresh_sketches(built_db)["mode"] == "fresh"
@@ -10,3 +10,13 @@ CREATE TABLE orders_raw(
   Country TEXT
 );
 
+
+-- orders_raw rowids restart here: drop the clean watermark so the next refresh
+-- rebuilds orders, and bump the load generation for anything keyed on raw loads
+CREATE TABLE IF NOT EXISTS etl_state(
+  name TEXT PRIMARY KEY,
+  value INTEGER
+);
+DELETE FROM etl_state WHERE name = 'orders_raw_rowid';
+INSERT OR REPLACE INTO etl_state(name, value)
+SELECT 'orders_raw_generation', COALESCE((SELECT value FROM etl_state WHERE name = 'orders_raw_generation'), 0) + 1;
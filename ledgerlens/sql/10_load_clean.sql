@@ -1,7 +1,10 @@
-DROP TABLE IF EXISTS orders;
-CREATE TABLE orders AS
+-- Normalization of orders_raw, exposed as a view so py/clean.py can append
+-- only rows past the etl_state high-water mark (raw_rowid > watermark).
+DROP VIEW IF EXISTS v_orders_clean;
+CREATE VIEW v_orders_clean AS
 WITH src AS (
   SELECT
+    rowid AS raw_rowid,
     InvoiceNo,
     UPPER(StockCode) AS sku,
     Description,
@@ -75,6 +78,7 @@ parts4 AS (
 ),
 normalized AS (
   SELECT
+    raw_rowid,
     InvoiceNo AS invoice_no,
     sku,
     Description AS description,
@@ -93,6 +97,7 @@ normalized AS (
     AND COALESCE(TRIM(year_txt), '') <> ''
 )
 SELECT
+  raw_rowid,
   invoice_no,
   printf('%04d-%02d-%02d %02d:%02d:00', year_num, month_num, day_num, hour_num, minute_num) AS order_ts,
   printf('%04d-%02d-%02d', year_num, month_num, day_num) AS order_date,
@@ -109,3 +114,35 @@ SELECT
   (qty * unit_price * 0.60) AS cogs,
   (qty * unit_price) - (qty * unit_price * 0.60) AS gross_profit
 FROM normalized;
+
+DROP TABLE IF EXISTS orders;
+CREATE TABLE orders AS
+SELECT
+  invoice_no,
+  order_ts,
+  order_date,
+  order_month,
+  order_year,
+  customer_id,
+  sku,
+  description,
+  qty,
+  unit_price,
+  country,
+  is_export,
+  gross_revenue,
+  cogs,
+  gross_profit
+FROM v_orders_clean;
+
+-- High-water mark: the last orders_raw rowid already normalized into orders
+CREATE TABLE IF NOT EXISTS etl_state(
+  name TEXT PRIMARY KEY,
+  value INTEGER
+);
+INSERT OR REPLACE INTO etl_state(name, value)
+SELECT 'orders_raw_rowid', COALESCE(MAX(rowid), 0) FROM orders_raw;
+
+-- Bumped on every full rebuild so downstream summaries know orders rowids restarted
+INSERT OR REPLACE INTO etl_state(name, value)
+SELECT 'orders_generation', COALESCE((SELECT value FROM etl_state WHERE name = 'orders_generation'), 0) + 1;
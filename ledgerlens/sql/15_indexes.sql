@@ -0,0 +1,22 @@
+-- Covering indexes for the GROUP BY keys in 20_views.sql. Each index leads
+-- with the grouping column and carries every column the view aggregates, so
+-- the views read orders in group order straight from the index instead of
+-- scanning the table and sorting into a temp B-tree.
+-- 10_load_clean.sql recreates orders, which drops these; py/clean.py
+-- re-applies this script after every full rebuild.
+
+-- v_orders_month
+CREATE INDEX IF NOT EXISTS idx_orders_month_cover
+  ON orders(order_month, order_date, invoice_no, customer_id, qty, gross_revenue, gross_profit, is_export);
+
+-- v_sku_abc
+CREATE INDEX IF NOT EXISTS idx_orders_sku_cover
+  ON orders(sku, qty, gross_revenue, gross_profit);
+
+-- v_country_summary
+CREATE INDEX IF NOT EXISTS idx_orders_country_cover
+  ON orders(country, invoice_no, customer_id, qty, gross_revenue, gross_profit);
+
+-- v_customer_value / v_top_customers
+CREATE INDEX IF NOT EXISTS idx_orders_customer_cover
+  ON orders(customer_id, invoice_no, qty, gross_revenue, gross_profit, order_date);
@@ -0,0 +1,219 @@
+-- Materialized summaries of orders, refreshed incrementally by py/materialize.py.
+-- Running this script drops and recreates the (empty) summary tables; the
+-- *_mat views return the same columns as their 20_views.sql counterparts.
+
+DROP TABLE IF EXISTS mv_month;
+CREATE TABLE mv_month(
+  ym TEXT PRIMARY KEY,
+  month_start TEXT,
+  orders INTEGER,
+  buyers INTEGER,
+  units INTEGER,
+  revenue REAL,
+  gross_profit REAL,
+  lines INTEGER,
+  revenue_domestic REAL,
+  revenue_export REAL
+);
+
+DROP TABLE IF EXISTS mv_sku;
+CREATE TABLE mv_sku(
+  sku TEXT PRIMARY KEY,
+  units INTEGER,
+  revenue REAL,
+  gross_profit REAL
+);
+
+DROP TABLE IF EXISTS mv_country;
+CREATE TABLE mv_country(
+  country TEXT PRIMARY KEY,
+  orders INTEGER,
+  buyers INTEGER,
+  units INTEGER,
+  revenue REAL,
+  gross_profit REAL,
+  lines INTEGER
+);
+
+DROP TABLE IF EXISTS mv_customer;
+CREATE TABLE mv_customer(
+  customer_id TEXT PRIMARY KEY,
+  orders INTEGER,
+  units INTEGER,
+  revenue REAL,
+  gross_profit REAL,
+  lines INTEGER,
+  first_order_date TEXT,
+  last_order_date TEXT
+);
+-- customer_topk.py walks this index for top-N queries
+CREATE INDEX idx_mv_customer_revenue ON mv_customer(revenue DESC);
+
+-- Distinct-key sets behind the COUNT(DISTINCT ...) columns; new keys are
+-- merged with INSERT OR IGNORE so counts stay exact under appends.
+DROP TABLE IF EXISTS mv_month_invoice;
+CREATE TABLE mv_month_invoice(ym TEXT, invoice_no TEXT, PRIMARY KEY (ym, invoice_no)) WITHOUT ROWID;
+DROP TABLE IF EXISTS mv_month_buyer;
+CREATE TABLE mv_month_buyer(ym TEXT, customer_id TEXT, PRIMARY KEY (ym, customer_id)) WITHOUT ROWID;
+DROP TABLE IF EXISTS mv_country_invoice;
+CREATE TABLE mv_country_invoice(country TEXT, invoice_no TEXT, PRIMARY KEY (country, invoice_no)) WITHOUT ROWID;
+DROP TABLE IF EXISTS mv_country_buyer;
+CREATE TABLE mv_country_buyer(country TEXT, customer_id TEXT, PRIMARY KEY (country, customer_id)) WITHOUT ROWID;
+DROP TABLE IF EXISTS mv_customer_invoice;
+CREATE TABLE mv_customer_invoice(customer_id TEXT, invoice_no TEXT, PRIMARY KEY (customer_id, invoice_no)) WITHOUT ROWID;
+
+-- Monthly KPIs read from mv_month
+DROP VIEW IF EXISTS v_orders_month_mat;
+CREATE VIEW v_orders_month_mat AS
+WITH monthly AS (
+  SELECT
+    ym,
+    month_start,
+    orders,
+    buyers,
+    units,
+    revenue,
+    gross_profit,
+    gross_profit * 1.0 / NULLIF(revenue, 0) AS gross_margin_pct,
+    revenue * 1.0 / lines AS aov,
+    revenue_domestic,
+    revenue_export
+  FROM mv_month
+),
+enriched AS (
+  SELECT
+    monthly.*,
+    LAG(revenue) OVER w AS revenue_prev,
+    LAG(gross_profit) OVER w AS gross_profit_prev,
+    LAG(aov) OVER w AS aov_prev,
+    LAG(orders) OVER w AS orders_prev,
+    LAG(buyers) OVER w AS buyers_prev
+  FROM monthly
+  WINDOW w AS (ORDER BY ym)
+)
+SELECT
+  ym,
+  month_start,
+  orders,
+  buyers,
+  units,
+  revenue,
+  revenue_prev,
+  CASE
+    WHEN revenue_prev IS NULL OR revenue_prev = 0 THEN NULL
+    ELSE (revenue - revenue_prev) / revenue_prev
+  END AS revenue_mom_pct,
+  gross_profit,
+  gross_profit_prev,
+  CASE
+    WHEN gross_profit_prev IS NULL OR gross_profit_prev = 0 THEN NULL
+    ELSE (gross_profit - gross_profit_prev) / gross_profit_prev
+  END AS gross_profit_mom_pct,
+  gross_margin_pct,
+  aov,
+  aov_prev,
+  CASE
+    WHEN aov_prev IS NULL OR aov_prev = 0 THEN NULL
+    ELSE (aov - aov_prev) / aov_prev
+  END AS aov_mom_pct,
+  buyers_prev,
+  CASE
+    WHEN buyers_prev IS NULL OR buyers_prev = 0 THEN NULL
+    ELSE (buyers - buyers_prev) / buyers_prev
+  END AS buyers_mom_pct,
+  revenue_domestic,
+  revenue_export
+FROM enriched
+ORDER BY ym;
+
+-- SKU Pareto (ABC) read from mv_sku
+DROP VIEW IF EXISTS v_sku_abc_mat;
+CREATE VIEW v_sku_abc_mat AS
+WITH ranked AS (
+  SELECT
+    sku,
+    units,
+    revenue,
+    gross_profit,
+    revenue * 1.0 / NULLIF(SUM(revenue) OVER (), 0) AS revenue_share,
+    SUM(revenue) OVER (ORDER BY revenue DESC)
+      * 1.0 / NULLIF(SUM(revenue) OVER (), 0) AS cum_share
+  FROM mv_sku
+)
+SELECT
+  sku,
+  units,
+  revenue,
+  gross_profit,
+  revenue_share,
+  cum_share,
+  CASE
+    WHEN cum_share <= 0.80 THEN 'A'
+    WHEN cum_share <= 0.95 THEN 'B'
+    ELSE 'C'
+  END AS abc_class
+FROM ranked;
+
+-- Revenue by country read from mv_country
+DROP VIEW IF EXISTS v_country_summary_mat;
+CREATE VIEW v_country_summary_mat AS
+WITH totals AS (
+  SELECT SUM(revenue) AS total_revenue
+  FROM mv_country
+)
+SELECT
+  country,
+  orders,
+  buyers,
+  units,
+  revenue,
+  gross_profit,
+  CASE
+    WHEN revenue = 0 THEN NULL
+    ELSE gross_profit * 1.0 / revenue
+  END AS gross_margin_pct,
+  revenue * 1.0 / lines AS aov,
+  revenue * 1.0 / NULLIF(totals.total_revenue, 0) AS revenue_share
+FROM mv_country, totals
+ORDER BY revenue DESC;
+
+-- Customer lifetime value read from mv_customer
+DROP VIEW IF EXISTS v_customer_value_mat;
+CREATE VIEW v_customer_value_mat AS
+WITH enriched AS (
+  SELECT
+    customer_id,
+    orders,
+    units,
+    revenue,
+    gross_profit,
+    revenue * 1.0 / lines AS avg_order_value,
+    first_order_date,
+    last_order_date,
+    (julianday(last_order_date) - julianday(first_order_date) + 1) AS active_days,
+    ROW_NUMBER() OVER (ORDER BY revenue DESC) AS revenue_rank
+  FROM mv_customer
+)
+SELECT
+  customer_id,
+  orders,
+  units,
+  revenue,
+  gross_profit,
+  avg_order_value,
+  first_order_date,
+  last_order_date,
+  active_days,
+  CASE
+    WHEN active_days <= 0 THEN NULL
+    ELSE revenue / (active_days / 30.0)
+  END AS revenue_per_active_month,
+  revenue_rank
+FROM enriched
+ORDER BY revenue DESC;
+
+DROP VIEW IF EXISTS v_top_customers_mat;
+CREATE VIEW v_top_customers_mat AS
+SELECT *
+FROM v_customer_value_mat
+WHERE revenue_rank <= 50;
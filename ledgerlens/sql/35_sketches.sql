@@ -0,0 +1,11 @@
+-- HyperLogLog sketches for approximate distinct counts (see py/sketches.py).
+-- One sketch per (dimension, key, metric), e.g. ('month', '2011-03', 'buyers').
+-- Registers are stored as raw bytes; the precision lives in etl_state.
+DROP TABLE IF EXISTS hll_sketch;
+CREATE TABLE hll_sketch (
+  dimension TEXT NOT NULL,
+  key TEXT NOT NULL,
+  metric TEXT NOT NULL,
+  registers BLOB NOT NULL,
+  PRIMARY KEY (dimension, key, metric)
+) WITHOUT ROWID;